@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Cache persistant des verdicts IA, indexé par l'empreinte des champs envoyés dans le prompt :
+# une annonce supprimée puis republiée (nouvelle URL, même contenu) n'est pas réévaluée.
+MAX_ENTRIES = 5000
+TTL_DAYS = 30
+
+FINGERPRINT_FIELDS = ['title', 'description', 'price', 'mileage', 'year', 'fuel_type', 'transmission', 'body_type']
+NUMERIC_FIELDS = {'price', 'mileage', 'year'}
+# Champs ajoutés par la page de l'annonce (scraper/detail_page.py) : une annonce enrichie n'a pas
+# l'empreinte de sa carte seule, sinon sa réévaluation reprendrait le verdict de la carte
+ENRICHED_FIELDS = ['options', 'details', 'image_count']
+
+
+def normalize_text(value):
+    # Insensible à la casse, aux accents, à la ponctuation et aux espaces
+    text = unicodedata.normalize('NFKD', str(value or ''))
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return re.sub(r'[^a-z0-9]+', ' ', text).strip()
+
+
+def ad_fingerprint(listing):
+    parts = []
+    for field in FINGERPRINT_FIELDS:
+        value = listing.get(field, 'N/A')
+        if field in NUMERIC_FIELDS:
+            parts.append(re.sub(r'\D', '', str(value or '')))
+        else:
+            parts.append(normalize_text(value))
+    if listing.get('detail_enriched'):
+        parts.append('detail')
+        for field in ENRICHED_FIELDS:
+            parts.append(normalize_text(json.dumps(listing.get(field), sort_keys=True, ensure_ascii=False)))
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()[:20]
+
+
+class EvaluationCache:
+    """Cache LRU borné (MAX_ENTRIES) avec expiration (TTL_DAYS), sauvegardé en JSON."""
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, ttl_days=TTL_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_days * 86400
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def load(cls, path, max_entries=MAX_ENTRIES, ttl_days=TTL_DAYS):
+        cache = cls(path, max_entries=max_entries, ttl_days=ttl_days)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except json.JSONDecodeError:
+                print(f"Attention: Le cache {path} est corrompu, il sera reconstruit.")
+                entries = {}
+            now = time.time()
+            # Le fichier est écrit du moins au plus récemment utilisé
+            for fingerprint, entry in entries.items():
+                if now - entry.get('ts', 0) <= cache.ttl_seconds:
+                    cache._entries[fingerprint] = entry
+            cache._evict()
+        return cache
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, listing):
+        fingerprint = ad_fingerprint(listing)
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None and time.time() - entry['ts'] > self.ttl_seconds:
+                del self._entries[fingerprint]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return dict(entry['result'])
+
+    def put(self, listing, result):
+        fingerprint = ad_fingerprint(listing)
+        with self._lock:
+            self._entries[fingerprint] = {'result': dict(result), 'ts': time.time()}
+            self._entries.move_to_end(fingerprint)
+            self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with self._lock:
+            entries = dict(self._entries)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entrees': len(self._entries), 'taux_hits': hit_rate}
@@ -1,30 +1,29 @@
 import os
 import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 # --- CORRECTION ICI : Aligner avec le Quickstart ---
 from mistralai import Mistral # Importation de la classe Mistral directement
 # Plus besoin d'importer ChatMessage explicitement si on utilise des dictionnaires pour les messages
 # from mistralai.models.chat import ChatMessage # <-- Ligne à SUPPRIMER
 
-def evaluate_car_ad(title, description, price, mileage, year, model, brand, fuel_type='N/A', transmission='N/A', body_type='N/A'):
-    api_key = os.environ.get("MISTRAL_API_KEY")
-    if not api_key:
-        raise ValueError("La variable d'environnement MISTRAL_API_KEY n'est pas définie.")
+import cassette
+from metrics import get_default_metrics
+from scraper.scheduler import TokenBucket
+from storage.seen_ads import format_price_history
 
-    # --- CORRECTION ICI : Initialisation du client comme dans le Quickstart ---
-    client = Mistral(api_key=api_key)
+# Évaluation par lots : appels concurrents, limités en débit, avec backoff sur les 429
+MAX_CONCURRENT_EVALUATIONS = 4
+MISTRAL_REQUESTS_PER_SECOND = 1.0
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 2
+ERROR_RESULT = {"note": 0, "commentaire": "Erreur lors de l'analyse IA ou de la réponse JSON."}
 
-    # Nettoyer et préparer les entrées pour le prompt
-    description_clean = description if description else "Aucune description fournie."
-    mileage_clean = f"{mileage} km" if mileage and str(mileage).strip() != 'N/A' else "Kilométrage non spécifié."
-    year_clean = f"Année: {year}" if year and str(year).strip() != 'N/A' else "Année non spécifiée."
-    price_clean = f"Prix: {price}" if price and str(price).strip() != 'N/A' else "Prix non spécifié."
-    model_brand_clean = f"Modèle: {model}, Marque: {brand}" if model and brand else ""
 
-    fuel_type_clean = f"Type de carburant: {fuel_type}" if fuel_type and str(fuel_type).strip() != 'N/A' else ""
-    transmission_clean = f"Transmission: {transmission}" if transmission and str(transmission).strip() != 'N/A' else ""
-    body_type_clean = f"Type de carrosserie: {body_type}" if body_type and str(body_type).strip() != 'N/A' else ""
-
-    prompt = f"""
+# Partie fixe du prompt, construite une seule fois ; seule la section "Annonce" varie
+PROMPT_INSTRUCTIONS = """
 Voici une annonce de vente de voiture (neuve ou d'occasion). Évalue-la avec un maximum de rigueur selon les critères suivants. L'objectif est de **déterminer si la voiture peut être revendue rapidement avec bénéfice**, ou si l'annonce cache des pièges.
 
 ---
@@ -74,33 +73,236 @@ Classe l’annonce dans cette grille **ultra stricte** :
 Retourne la réponse au **format JSON strict**, sans explication additionnelle :
 
 ```json
-{{
+{
   "note": [1-5],
   "commentaire": "Synthèse en 2 phrases max. Justifie la note en restant neutre et critique."
-}}
+}
+```
 """
 
-    messages = [
-        # --- CORRECTION ICI : Utilisation d'un dictionnaire simple pour le message ---
-        {"role": "user", "content": prompt}
+
+def create_client():
+    api_key = os.environ.get("MISTRAL_API_KEY")
+    if not api_key and cassette.replaying():
+        # Rejeu hors ligne (voir cassette.py) : la clé n'est jamais envoyée
+        api_key = "rejeu"
+    if not api_key:
+        raise ValueError("La variable d'environnement MISTRAL_API_KEY n'est pas définie.")
+
+    # --- CORRECTION ICI : Initialisation du client comme dans le Quickstart ---
+    # MISTRAL_SERVER_URL (optionnel) permet de viser un faux serveur local pour les benchmarks ;
+    # avec --record / --replay, les appels passent par la cassette
+    return Mistral(api_key=api_key, server_url=os.environ.get("MISTRAL_SERVER_URL") or None,
+                   client=cassette.httpx_client())
+
+
+def build_prompt(title, description, price, mileage, year, model, brand, fuel_type='N/A', transmission='N/A', body_type='N/A',
+                 market_percentile=None, market_samples=0, city='N/A', seller_type='N/A', date_posted='N/A', image_count='N/A',
+                 options=None, details=None, price_history=None, relisted=False):
+    # Nettoyer et préparer les entrées pour le prompt
+    description_clean = description if description else "Aucune description fournie."
+    mileage_clean = f"Kilométrage: {mileage} km" if mileage and str(mileage).strip() != 'N/A' else "Kilométrage non spécifié."
+    year_clean = f"Année: {year}" if year and str(year).strip() != 'N/A' else "Année non spécifiée."
+    price_clean = f"Prix: {price}" if price and str(price).strip() != 'N/A' else "Prix non spécifié."
+    model_brand_clean = f"Modèle: {model}, Marque: {brand}" if model and brand else ""
+
+    fuel_type_clean = f"Type de carburant: {fuel_type}" if fuel_type and str(fuel_type).strip() != 'N/A' else ""
+    transmission_clean = f"Transmission: {transmission}" if transmission and str(transmission).strip() != 'N/A' else ""
+    body_type_clean = f"Type de carrosserie: {body_type}" if body_type and str(body_type).strip() != 'N/A' else ""
+    # Champs présents seulement dans l'état JSON des pages de résultats (scraper/embedded_state.py)
+    city_clean = f"Localisation: {city}" if city and str(city).strip() != 'N/A' else ""
+    seller_clean = f"Vendeur: {seller_type}" if seller_type and str(seller_type).strip() != 'N/A' else ""
+    date_clean = f"Publiée le: {date_posted}" if date_posted and str(date_posted).strip() != 'N/A' else ""
+    images_clean = f"Nombre de photos: {image_count}" if image_count is not None and str(image_count).strip() != 'N/A' else ""
+    # Champs de la page de l'annonce, pour les annonces présélectionnées (scraper/detail_page.py)
+    options_clean = f"Équipements: {', '.join(options)}" if options else ""
+    details_clean = "\n".join(f"{label}: {value}" for label, value in (details or {}).items())
+    # Annonce déjà vue dont le prix a baissé, ou republiée sous un autre lien (storage/seen_ads.py)
+    history_clean = (
+        f"{'Annonce republiée, déjà vue' if relisted else 'Annonce déjà vue'} ; historique des prix : "
+        f"{format_price_history(price_history)}"
+        if price_history else ""
+    )
+    # Position du prix dans l'index local (ai/price_index.py), quand assez d'annonces comparables existent
+    market_clean = (
+        f"Position du prix sur le marché local : {market_percentile}e percentile parmi {market_samples} annonces "
+        f"comparables déjà vues (même modèle, kilométrage ajusté ; 0 = la moins chère)"
+        if market_percentile is not None else ""
+    )
+
+    ad_lines = [
+        f"Titre: {title}",
+        model_brand_clean,
+        price_clean,
+        year_clean,
+        mileage_clean,
+        fuel_type_clean,
+        transmission_clean,
+        body_type_clean,
+        city_clean,
+        seller_clean,
+        date_clean,
+        images_clean,
+        options_clean,
+        details_clean,
+        history_clean,
+        market_clean,
+        f"Description: {description_clean}",
     ]
+    ad_section = "\n".join(line for line in ad_lines if line)
+    return f"{PROMPT_INSTRUCTIONS}\n### Annonce à évaluer :\n\n{ad_section}\n"
+
+
+def listing_prompt(listing):
+    return build_prompt(
+        listing.get('title', 'N/A'),
+        listing.get('description', 'N/A'),
+        listing.get('price', 'N/A'),
+        listing.get('mileage', 'N/A'),
+        listing.get('year', 'N/A'),
+        listing.get('model', 'N/A'),
+        listing.get('brand', 'N/A'),
+        fuel_type=listing.get('fuel_type', 'N/A'),
+        transmission=listing.get('transmission', 'N/A'),
+        body_type=listing.get('body_type', 'N/A'),
+        market_percentile=listing.get('market_percentile'),
+        market_samples=listing.get('market_samples', 0),
+        city=listing.get('city', 'N/A'),
+        seller_type=listing.get('seller_type', 'N/A'),
+        date_posted=listing.get('date_posted', 'N/A'),
+        image_count=listing.get('image_count', 'N/A'),
+        options=listing.get('options'),
+        details=listing.get('details'),
+        price_history=listing.get('price_history'),
+        relisted=bool(listing.get('relisted_from'))
+    )
+
 
+def retry_after_seconds(error):
+    # Délai demandé par l'API (en-tête Retry-After) sur une erreur 429, si présent
+    raw_response = getattr(error, 'raw_response', None)
+    if raw_response is None:
+        return None
     try:
-        # --- CORRECTION ICI : Appel de l'API comme dans le Quickstart ---
-        chat_response = client.chat.complete(
-            model="mistral-tiny",
-            response_format={"type": "json_object"}, # Cette option devrait fonctionner avec cette API
-            messages=messages
-        )
-
-        content = chat_response.choices[0].message.content
-        return json.loads(content)
-
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Erreur lors de l'appel à l'API Mistral : {e}")
-        return {"note": 0, "commentaire": "Erreur lors de l'analyse IA ou de la réponse JSON."}
+        return float(raw_response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdEvaluator:
+    """Évaluateur longue durée : un seul client Mistral (connexions HTTP gardées ouvertes) et
+    un limiteur de débit partagé. Le temps passé par appel (attente, réseau, parsing JSON) va dans
+    les histogrammes du registre de mesures (voir metrics.py)."""
+
+    def __init__(self, client=None, requests_per_second=MISTRAL_REQUESTS_PER_SECOND, max_retries=MAX_RETRIES, cache=None):
+        self.client = client or create_client()
+        self.max_retries = max_retries
+        # Cache optionnel des verdicts (voir ai/cache.py) : les republications ne coûtent aucun appel
+        self.cache = cache
+        self._bucket = TokenBucket(requests_per_second, 1)
+        self._lock = threading.Lock()
+
+    def _wait_for_slot(self):
+        with self._lock:
+            delay = self._bucket.reserve(time.monotonic())
+        if delay > 0:
+            time.sleep(delay)
+
+    def _request(self, prompt):
+        messages = [
+            # --- CORRECTION ICI : Utilisation d'un dictionnaire simple pour le message ---
+            {"role": "user", "content": prompt}
+        ]
+
+        queued_at = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_slot()
+            sent_at = time.perf_counter()
+            try:
+                # --- CORRECTION ICI : Appel de l'API comme dans le Quickstart ---
+                chat_response = self.client.chat.complete(
+                    model="mistral-tiny",
+                    response_format={"type": "json_object"}, # Cette option devrait fonctionner avec cette API
+                    messages=messages
+                )
+            except Exception as e:
+                if getattr(e, 'status_code', None) == 429 and attempt < self.max_retries:
+                    delay = retry_after_seconds(e) or BACKOFF_BASE_SECONDS * 2 ** attempt * random.uniform(1, 1.5)
+                    print(f"Limite de l'API Mistral atteinte (429), nouvel essai dans {delay:.1f} s.")
+                    time.sleep(delay)
+                    continue
+                raise
+            received_at = time.perf_counter()
+
+            content = chat_response.choices[0].message.content
+            result = json.loads(content)
+            parsed_at = time.perf_counter()
+
+            metrics = get_default_metrics()
+            metrics.count('llm_calls')
+            metrics.observe('llm_wait_seconds', sent_at - queued_at)
+            metrics.observe('llm_latency_seconds', received_at - sent_at)
+            metrics.observe('llm_parse_seconds', parsed_at - received_at)
+            usage = getattr(chat_response, 'usage', None)
+            if usage is not None:
+                metrics.count('llm_prompt_tokens', usage.prompt_tokens or 0)
+                metrics.count('llm_completion_tokens', usage.completion_tokens or 0)
+            return result
+
+    def evaluate(self, listing):
+        if self.cache is not None:
+            cached = self.cache.get(listing)
+            if cached is not None:
+                get_default_metrics().count('llm_cache_hits')
+                return cached
+        try:
+            result = self._request(listing_prompt(listing))
+            if self.cache is not None:
+                self.cache.put(listing, result)
+            return result
+        except Exception as e:
+            print(f"Erreur lors de l'appel à l'API Mistral pour '{listing.get('title', 'N/A')}' : {e}")
+            get_default_metrics().count('llm_errors')
+            return dict(ERROR_RESULT)
+
+    def evaluate_many(self, listings, max_workers=MAX_CONCURRENT_EVALUATIONS):
+        # Renvoie les résultats dans l'ordre de `listings` ; une annonce en échec reçoit
+        # ERROR_RESULT sans bloquer les autres.
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.evaluate, listings))
+
+
+_default_evaluator = None
+_default_evaluator_lock = threading.Lock()
+
+
+def get_default_evaluator():
+    global _default_evaluator
+    with _default_evaluator_lock:
+        if _default_evaluator is None:
+            _default_evaluator = AdEvaluator()
+        return _default_evaluator
+
+
+def evaluate_car_ad(title, description, price, mileage, year, model, brand, fuel_type='N/A', transmission='N/A', body_type='N/A'):
+    # Conservé pour les appelants existants : délègue à l'évaluateur partagé
+    return get_default_evaluator().evaluate({
+        'title': title,
+        'description': description,
+        'price': price,
+        'mileage': mileage,
+        'year': year,
+        'model': model,
+        'brand': brand,
+        'fuel_type': fuel_type,
+        'transmission': transmission,
+        'body_type': body_type,
+    })
+
+
+def evaluate_car_ads(listings, evaluator=None, max_workers=MAX_CONCURRENT_EVALUATIONS):
+    # Évalue plusieurs annonces en parallèle (voir AdEvaluator.evaluate_many)
+    return (evaluator or get_default_evaluator()).evaluate_many(listings, max_workers=max_workers)
 
 if __name__ == '__main__':
     example_ad = {
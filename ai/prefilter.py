@@ -0,0 +1,153 @@
+import bisect
+import datetime
+
+from scraper.brand_model import canonical_brand_model
+from storage.seen_ads import parse_int
+
+# Pré-filtre local avant l'appel à Mistral : seules les annonces plausibles comme
+# bonnes affaires sont envoyées à l'IA. Seuils modifiables via PreFilter(thresholds=...).
+DEFAULT_THRESHOLDS = {
+    'min_price': 500,            # en dessous : pièces, épave ou prix d'appel
+    'max_price': 20000,          # au-dessus de ce qu'on revend
+    'max_mileage': 250000,
+    'min_year': 2000,
+    # Écarter si le prix/km dépasse la référence du modèle de plus de ce facteur
+    'max_price_per_km_factor': 1.5,
+    # Nombre minimum d'annonces du même modèle dans l'historique pour utiliser la référence
+    'min_model_samples': 5,
+    # Écarter si le prix est au-dessus de ce percentile du marché local (voir ai/price_index.py)
+    'max_market_percentile': 80,
+}
+
+# Le prix/km baisse naturellement avec le kilométrage : la référence est calculée par tranche
+MILEAGE_BAND_KM = 50000
+
+
+def baseline_key(listing, mileage):
+    # Mêmes noms canoniques que les seaux de l'index des prix (voir ai/price_index.py)
+    brand, model = canonical_brand_model(str(listing.get('brand') or 'N/A'), str(listing.get('model') or 'N/A'))
+    brand, model = brand.strip().lower(), model.strip().lower()
+    if brand == 'n/a' or model == 'n/a' or not mileage:
+        return None
+    return brand, model, mileage // MILEAGE_BAND_KM
+
+
+class PreFilter:
+    def __init__(self, thresholds=None, price_per_km_baselines=None):
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.price_per_km_baselines = price_per_km_baselines or {}
+        # Prix/km triés par modèle et tranche de kilométrage, pour tenir la médiane à jour annonce par annonce
+        self.ratios = {}
+        # Nombre d'annonces de l'historique déjà intégrées (pour ne traiter que la suite, comme PriceIndex)
+        self.ads_count = 0
+        self.checked = 0
+        self.skipped = {}
+
+    @classmethod
+    def from_history(cls, seen_ads, thresholds=None):
+        # Référence prix/km par modèle et tranche de kilométrage : médiane sur les annonces déjà vues
+        prefilter = cls(thresholds)
+        for ad in seen_ads:
+            prefilter.add(ad)
+        return prefilter
+
+    def add(self, ad):
+        price = parse_int(ad.get('price'))
+        mileage = parse_int(ad.get('mileage'))
+        key = baseline_key(ad, mileage)
+        if not key or not price:
+            return
+        bisect.insort(self.ratios.setdefault(key, []), price / mileage)
+        self._update_baseline(key)
+
+    def _update_baseline(self, key):
+        values = self.ratios[key]
+        if len(values) < self.thresholds['min_model_samples']:
+            self.price_per_km_baselines.pop(key, None)
+            return
+        middle = len(values) // 2
+        self.price_per_km_baselines[key] = (
+            values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2)
+
+    def remove(self, ad):
+        price = parse_int(ad.get('price'))
+        mileage = parse_int(ad.get('mileage'))
+        key = baseline_key(ad, mileage)
+        values = self.ratios.get(key)
+        if not values or not price:
+            return
+        position = bisect.bisect_left(values, price / mileage)
+        if position < len(values) and values[position] == price / mileage:
+            del values[position]
+            self._update_baseline(key)
+
+    def replaced(self, position, previous, ad):
+        # Appelé par SeenAdsStore quand un enregistrement change, comme PriceIndex.replaced
+        if position < self.ads_count:
+            self.remove(previous)
+            self.add(ad)
+
+    def sync(self, seen_ads):
+        # Intègre uniquement les annonces ajoutées à l'historique depuis le dernier passage
+        ads = seen_ads.ads
+        if self.ads_count > len(ads):
+            # Historique réduit ou remplacé : reconstruction complète
+            self.ratios = {}
+            self.price_per_km_baselines = {}
+            self.ads_count = 0
+        for ad in ads[self.ads_count:]:
+            self.add(ad)
+        added = len(ads) - self.ads_count
+        self.ads_count = len(ads)
+        return added
+
+    def reset_report(self):
+        # Les références restent d'un cycle à l'autre, les compteurs du rapport repartent de zéro
+        self.checked = 0
+        self.skipped = {}
+
+    def check(self, listing):
+        # Renvoie (à_évaluer, raison)
+        self.checked += 1
+        reason = self._skip_reason(listing)
+        if reason:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+            return False, reason
+        return True, None
+
+    def _skip_reason(self, listing):
+        t = self.thresholds
+        price = parse_int(listing.get('price'))
+        if price is None:
+            return "prix non indiqué"
+        if price < t['min_price']:
+            return "prix anormalement bas"
+        if price > t['max_price']:
+            return "prix trop élevé"
+
+        mileage = parse_int(listing.get('mileage'))
+        if mileage is not None and mileage > t['max_mileage']:
+            return "kilométrage trop élevé"
+
+        year = parse_int(listing.get('year'))
+        if year is not None and not t['min_year'] <= year <= datetime.date.today().year + 1:
+            return "année hors limites"
+
+        market_percentile = listing.get('market_percentile')
+        if market_percentile is not None and market_percentile > t['max_market_percentile']:
+            return "prix élevé par rapport au marché local"
+
+        baseline = self.price_per_km_baselines.get(baseline_key(listing, mileage))
+        if baseline and mileage:
+            if price / mileage > baseline * t['max_price_per_km_factor']:
+                return "prix/km au-dessus de la référence du modèle"
+        return None
+
+    @property
+    def llm_calls_saved(self):
+        return sum(self.skipped.values())
+
+    def print_report(self):
+        print(f"Pré-filtre : {self.llm_calls_saved} appels IA évités sur {self.checked} nouvelles annonces.")
+        for reason, count in sorted(self.skipped.items(), key=lambda item: -item[1]):
+            print(f"  {count} x {reason}")
@@ -0,0 +1,146 @@
+import bisect
+import json
+import os
+from array import array
+
+from scraper.brand_model import canonical_brand_model
+from storage.seen_ads import parse_int
+
+# Index des prix du marché local construit à partir des annonces déjà vues.
+# Un seau par marque/modèle/année (plus un seau marque/modèle toutes années en repli),
+# contenant les prix ajustés au kilométrage, triés dans un array compact : la position
+# d'un prix (percentile) se calcule par recherche dichotomique.
+
+# Ajustement au kilométrage : on ramène chaque prix à REFERENCE_MILEAGE km
+REFERENCE_MILEAGE = 100000
+DEPRECIATION_PER_10K_KM = 0.02
+MIN_ADJUSTMENT, MAX_ADJUSTMENT = 0.5, 2.0
+
+# En dessous, le seau est jugé trop petit pour donner un percentile
+MIN_SAMPLES = 5
+ALL_YEARS = '*'
+# Format des clés de seaux ; un index enregistré dans un autre format est reconstruit
+INDEX_VERSION = 2
+
+
+def mileage_adjusted_price(price, mileage):
+    if not mileage:
+        return float(price)
+    factor = 1 + DEPRECIATION_PER_10K_KM * (mileage - REFERENCE_MILEAGE) / 10000
+    return price * min(MAX_ADJUSTMENT, max(MIN_ADJUSTMENT, factor))
+
+
+def bucket_keys(listing):
+    # Noms canoniques : une annonce de l'historique notée 'Bmw' / 'Serie 3' tombe dans le seau de 'BMW' / 'Série 3'
+    brand, model = canonical_brand_model(str(listing.get('brand') or 'N/A'), str(listing.get('model') or 'N/A'))
+    brand, model = brand.strip().lower(), model.strip().lower()
+    if brand == 'n/a' or model == 'n/a':
+        return []
+    year = parse_int(listing.get('year'))
+    keys = [f"{brand}|{model}|{ALL_YEARS}"]
+    if year:
+        keys.insert(0, f"{brand}|{model}|{year}")
+    return keys
+
+
+class PriceIndex:
+    def __init__(self, path=None):
+        self.path = path
+        self.buckets = {}
+        # Nombre d'annonces de l'historique déjà intégrées (pour ne traiter que la suite)
+        self.ads_count = 0
+
+    @classmethod
+    def load(cls, path):
+        index = cls(path)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') != INDEX_VERSION:
+                    print(f"L'index des prix {path} est dans un format précédent, il sera reconstruit.")
+                    return index
+                index.ads_count = data.get('ads_count', 0)
+                index.buckets = {key: array('f', values) for key, values in data.get('buckets', {}).items()}
+            except (json.JSONDecodeError, TypeError, ValueError):
+                print(f"Attention: L'index des prix {path} est corrompu, il sera reconstruit.")
+                index = cls(path)
+        return index
+
+    def add(self, listing):
+        price = parse_int(listing.get('price'))
+        if not price:
+            return
+        adjusted = mileage_adjusted_price(price, parse_int(listing.get('mileage')))
+        for key in bucket_keys(listing):
+            bisect.insort(self.buckets.setdefault(key, array('f')), adjusted)
+
+    def remove(self, listing):
+        # Retire le prix d'une annonce déjà indexée : tel qu'ajouté (float32), ou arrondi à l'euro
+        # s'il vient du fichier (voir save())
+        price = parse_int(listing.get('price'))
+        if not price:
+            return
+        stored = array('f', [mileage_adjusted_price(price, parse_int(listing.get('mileage')))])[0]
+        for key in bucket_keys(listing):
+            values = self.buckets.get(key)
+            if not values:
+                continue
+            for value in (stored, round(stored)):
+                position = bisect.bisect_left(values, value)
+                if position < len(values) and values[position] == value:
+                    del values[position]
+                    break
+
+    def replaced(self, position, previous, listing):
+        # Appelé par SeenAdsStore quand un enregistrement change (prix ou kilométrage revu) ; une
+        # annonce pas encore intégrée le sera avec son nouveau prix au prochain sync()
+        if position < self.ads_count:
+            self.remove(previous)
+            self.add(listing)
+
+    def sync(self, seen_ads):
+        # Intègre uniquement les annonces ajoutées à l'historique depuis le dernier passage
+        ads = seen_ads.ads
+        if self.ads_count > len(ads):
+            # Historique réduit ou remplacé : reconstruction complète
+            self.buckets = {}
+            self.ads_count = 0
+        for ad in ads[self.ads_count:]:
+            self.add(ad)
+        added = len(ads) - self.ads_count
+        self.ads_count = len(ads)
+        return added
+
+    def percentile(self, listing):
+        # Renvoie (percentile 0-100, nombre d'annonces comparables) ou (None, 0)
+        price = parse_int(listing.get('price'))
+        if not price:
+            return None, 0
+        adjusted = mileage_adjusted_price(price, parse_int(listing.get('mileage')))
+        for key in bucket_keys(listing):
+            values = self.buckets.get(key)
+            if values is not None and len(values) >= MIN_SAMPLES:
+                return round(100 * bisect.bisect_left(values, adjusted) / len(values)), len(values)
+        return None, 0
+
+    def annotate(self, listing):
+        percentile, samples = self.percentile(listing)
+        if percentile is not None:
+            listing['market_percentile'] = percentile
+            listing['market_samples'] = samples
+        return percentile
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        data = {
+            'version': INDEX_VERSION,
+            'ads_count': self.ads_count,
+            'buckets': {key: [round(value) for value in values] for key, values in self.buckets.items()},
+        }
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,144 @@
+import os
+import time
+
+from scraper.brand_model import (BRAND_ALIASES, MODEL_ALIASES_BY_BRAND, canonical_brand_model, normalize,
+                                 recognize_brand_model)
+from scraper.embedded_state import extract_state_listings, state_listing_fields
+from scraper.parsers import get_parser
+from scraper.scrape_2ememain import guess_brand_model
+
+# Précision et débit de la reconnaissance marque/modèle sur les titres des pages enregistrées
+# (bench/fixtures/*.html, étiquettes dans bench/fixtures/fixture_titles.tsv), comparés à l'ancien
+# parcours de dictionnaire par carte et au même parcours sur la liste complète de
+# scraper/data/car_models.json. Une réponse est juste si elle tombe dans le même seau de l'index
+# des prix que l'étiquette ('Bmw' / 'Serie 3' = 'BMW' / 'Série 3').
+# Le corpus écrit à la main (bench/fixtures/titles_corpus.tsv) vérifie en plus les alias ("VW", "3-reeks").
+# Échoue si la précision passe sous MIN_ACCURACY ; les erreurs sont listées.
+# Lancer depuis la racine du dépôt : python -m bench.bench_brand_model
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+FIXTURE_PAGES = ['results_page.html', 'results_page_state.html', 'edge_cases.html']
+FIXTURE_LABELS_FILE = os.path.join(FIXTURES_DIR, 'fixture_titles.tsv')
+CORPUS_FILE = os.path.join(FIXTURES_DIR, 'titles_corpus.tsv')
+MIN_ACCURACY = 0.95
+REPEAT = 200
+
+
+def fixture_corpus():
+    # Titres des annonces des pages enregistrées (cartes HTML et état embarqué), avec leur étiquette ;
+    # les cartes sans lien sont ignorées, comme dans parse_listings()
+    labels = {title: (brand, model) for title, brand, model in load_corpus(FIXTURE_LABELS_FILE)}
+    titles = set()
+    for name in FIXTURE_PAGES:
+        with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+            html = f.read()
+        cards = list(get_parser().iter_cards(html))
+        cards += [state_listing_fields(item) for item in extract_state_listings(html) or []]
+        titles.update(card['title'].strip() for card in cards if card['href'] and card['title'])
+    missing = sorted(titles - set(labels))
+    assert not missing, f"Titres sans étiquette dans {FIXTURE_LABELS_FILE} : {missing}"
+    return [(title, *labels[title]) for title in sorted(titles)]
+
+
+def load_corpus(path=CORPUS_FILE):
+    corpus = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            title, brand, model = line.split('\t')
+            corpus.append((title, brand, model))
+    return corpus
+
+
+def legacy_guess_brand_model(title):
+    # Ancienne version de scraper.scrape_2ememain.guess_brand_model, pour comparaison
+    brand = 'N/A'
+    model = 'N/A'
+    if title and title != 'N/A':
+        title_lower = title.lower()
+        known_brands = {
+            'honda': ['civic', 'cr-v', 'jazz', 'accord'],
+            'volkswagen': ['golf', 'passat', 'polo'],
+            'bmw': ['serie 3', 'serie 5', 'x3'],
+            'mercedes': ['c-klasse', 'e-klasse', 'a-klasse'],
+            'audi': ['a3', 'a4', 'a6'],
+        }
+        found_brand = False
+        for b, models_list in known_brands.items():
+            if b in title_lower:
+                brand = b.capitalize()
+                found_brand = True
+                for m in models_list:
+                    if m in title_lower:
+                        model = m.capitalize()
+                        break
+                break
+        if not found_brand and len(title.split()) > 1:
+            brand = title.split()[0]
+            model = title.split()[1]
+    return brand, model
+
+
+def scan_brand_model(title):
+    # Parcours naïf de la liste complète, alias par alias (sans limite de mot)
+    text = normalize(title)
+    for brand_alias, brand in sorted(BRAND_ALIASES.items(), key=lambda item: -len(item[0])):
+        if brand_alias in text:
+            for model_alias, model in sorted(MODEL_ALIASES_BY_BRAND[brand].items(), key=lambda item: -len(item[0])):
+                if model_alias in text:
+                    return brand, model
+            return brand, 'N/A'
+    return 'N/A', 'N/A'
+
+
+def bucket(brand, model):
+    # Même regroupement que bucket_keys() dans ai/price_index.py
+    brand, model = canonical_brand_model(brand, model)
+    return brand.lower(), model.lower()
+
+
+def accuracy(corpus, recognize):
+    errors = []
+    for title, brand, model in corpus:
+        found = recognize(title)
+        if bucket(*found) != bucket(brand, model):
+            errors.append((title, (brand, model), found))
+    return 1 - len(errors) / len(corpus), errors
+
+
+def titles_per_second(corpus, recognize):
+    titles = [title for title, _, _ in corpus]
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for title in titles:
+            recognize(title)
+    return len(titles) * REPEAT / (time.perf_counter() - start)
+
+
+def measure(label, corpus):
+    print(f"{label} : {len(corpus)} titres étiquetés")
+    results = {}
+    for name, recognize in [('ancien', legacy_guess_brand_model), ('scan complet', scan_brand_model),
+                             ('sans repli', recognize_brand_model), ('actuel', guess_brand_model)]:
+        score, errors = accuracy(corpus, recognize)
+        results[name] = (score, errors)
+        print(f"  {name:>12} : {score:.1%} corrects, {titles_per_second(corpus, recognize):>8.0f} titres/s")
+
+    score, errors = results['actuel']
+    if errors:
+        print("Erreurs restantes :")
+        for title, expected, found in errors:
+            print(f"  {title!r} : attendu {expected}, obtenu {found}")
+    print()
+    assert score >= MIN_ACCURACY, f"{label} : précision {score:.1%} sous le seuil de {MIN_ACCURACY:.0%}"
+
+
+def main():
+    measure("Pages enregistrées", fixture_corpus())
+    measure("Corpus d'alias", load_corpus())
+
+
+if __name__ == '__main__':
+    main()
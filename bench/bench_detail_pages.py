@@ -0,0 +1,112 @@
+import contextlib
+import io
+import os
+import time
+
+from ai.evaluate import AdEvaluator
+from ai.prefilter import PreFilter
+from ai.price_index import PriceIndex
+from bench.fake_mistral import FakeMistral
+from bench.stub_site import StubSite, make_ad
+from pipeline import DetailShortlist, ai_note, evaluate_stream
+from scraper.detail_page import DetailEnricher
+from scraper.fetcher import fetch_pages
+from scraper.scheduler import RequestScheduler
+from scraper.scrape_2ememain import guess_brand_model, parse_listings
+from storage.seen_ads import SeenAdsStore
+
+# Pages d'annonces téléchargées et appels IA, contre un faux 2ememain et un faux Mistral,
+# pour les annonces qui passent le pré-filtre (comme dans main.py) : cartes seules, page lue
+# pour chaque annonce, et page lue pour les seules annonces présélectionnées (DetailShortlist :
+# pré-score local ou note >= 3 sur la carte). Les notes du faux Mistral sont uniformes de 1 à 5,
+# bien plus généreuses que les vraies : la part d'annonces présélectionnées est ici surestimée.
+# Lancer depuis la racine du dépôt : python -m bench.bench_detail_pages
+
+NUM_PAGES = 4
+CARDS_PER_PAGE = 30
+HISTORY_SIZE = 3000
+SERVER_LATENCY = 0.05
+API_LATENCY = 0.05
+MAX_WORKERS = 4
+MAX_MARKET_PERCENTILE = 25
+MIN_CARD_NOTE = 3
+
+
+def history():
+    # Annonces "déjà vues" pour l'index des prix, avec d'autres IDs que celles du crawl
+    ads = []
+    for ad_id in range(1_000_000, 1_000_000 + HISTORY_SIZE):
+        ad = make_ad(ad_id)
+        brand, model = guess_brand_model(ad['title'])
+        ads.append({'url': f"https://www.2ememain.be/v/autos/x/m{ad_id}-x", 'price': str(ad['price']),
+                    'mileage': str(ad['mileage']), 'year': str(ad['year']), 'brand': brand, 'model': model})
+    return SeenAdsStore(ads)
+
+
+def crawl(base):
+    urls = [f"{base}/l/autos/p/{page}/" for page in range(1, NUM_PAGES + 1)]
+    listings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _, html in fetch_pages(urls, scheduler=RequestScheduler(1000, jitter=0)):
+            listings.extend(parse_listings(html))
+    for listing in listings:
+        # Les pages sont demandées au faux site, pas à 2ememain
+        listing['url'] = listing['url'].replace("https://www.2ememain.be", base)
+    return listings
+
+
+def run(name, listings, evaluate_one, site, fake):
+    site.detail_request_count = 0
+    fake.request_count = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = list(evaluate_stream(listings, evaluate_one, max_workers=MAX_WORKERS))
+    elapsed = time.perf_counter() - start
+    alerts = [listing for listing, result in results if ai_note(result) >= 4]
+    complete = sum(1 for listing in alerts if listing.get('detail_enriched'))
+    print(f"  {name:>14} : {site.detail_request_count:>3} pages d'annonces, {fake.request_count:>3} appels IA, "
+          f"{len(alerts):>2} alertes dont {complete} évaluées avec la page complète ({elapsed:.2f} s)")
+
+
+def main():
+    site = StubSite(latency=SERVER_LATENCY, cards_per_page=CARDS_PER_PAGE)
+    fake = FakeMistral(latency=API_LATENCY)
+    base = site.start()
+    os.environ['MISTRAL_SERVER_URL'] = fake.start()
+    os.environ.setdefault('MISTRAL_API_KEY', 'fake-key')
+    try:
+        seen_ads = history()
+        price_index = PriceIndex()
+        price_index.sync(seen_ads)
+        prefilter = PreFilter.from_history(seen_ads)
+        crawled = crawl(base)
+        for listing in crawled:
+            price_index.annotate(listing)
+        candidates = [listing for listing in crawled if prefilter.check(listing)[0]]
+        print(f"{len(crawled)} annonces sur {NUM_PAGES} pages de résultats, {len(candidates)} après le pré-filtre\n")
+
+        def fresh_listings():
+            return [dict(listing) for listing in candidates]
+
+        scheduler = RequestScheduler(1000, jitter=0)
+        evaluator = AdEvaluator(requests_per_second=1000)
+        run('cartes seules', fresh_listings(), evaluator.evaluate, site, fake)
+
+        enricher = DetailEnricher(scheduler=scheduler)
+
+        def enrich_all(listing):
+            enricher.enrich(listing)
+            return evaluator.evaluate(listing)
+        run('toutes pages', fresh_listings(), enrich_all, site, fake)
+
+        shortlist = DetailShortlist(DetailEnricher(scheduler=scheduler), evaluator.evaluate, MAX_MARKET_PERCENTILE, MIN_CARD_NOTE)
+        run('présélection', fresh_listings(), shortlist.evaluate, site, fake)
+        print()
+        shortlist.print_report()
+    finally:
+        site.stop()
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cassette
+from ai.price_index import PriceIndex
+from bench.fake_mistral import FakeMistral
+from bench.stub_site import StubSite, make_ad
+from scraper.crawler import page_url
+from scraper.scrape_2ememain import guess_brand_model
+from storage.seen_ads import SeenAdsStore, write_snapshot
+
+# Runs complets de main.run_cycle, hors ligne (cassette rejouée, voir cassette.py), sur un
+# historique synthétique d'annonces déjà vues et des pages de résultats enregistrées.
+# Chaque run tourne dans son propre processus (RSS max propre au run) et rapporte le temps total,
+# la mémoire maximale et le coût de chaque étape tiré de metrics.py : une régression sur un
+# chemin chaud (chargement de l'historique, pré-filtre, parsing, sauvegarde) se voit ici.
+# Les pages sont toutes nouvelles : pas d'arrêt du crawl incrémental, tout passe par le pipeline.
+# Lancer depuis la racine du dépôt : python -m bench.bench_end_to_end [--full] [--json resultats.json]
+# (--full ajoute l'historique de 1M d'annonces : plusieurs Go de mémoire et quelques minutes)
+
+HISTORY_SIZES = (1_000, 100_000)
+FULL_HISTORY_SIZES = (1_000, 100_000, 1_000_000)
+PAGE_COUNTS = (1, 20, 200)
+PAGES_PER_BASE_URL = 10
+CARDS_PER_PAGE = 30
+# Annonces modèles de l'historique (IDs différents, mêmes répartitions de marques et de prix)
+HISTORY_TEMPLATES = 5000
+# Réponses Mistral enregistrées : chaque prompt en reçoit une, choisie par son empreinte
+MISTRAL_RESPONSES = 50
+MISTRAL_URL = "https://api.mistral.ai/v1/chat/completions"
+TELEGRAM_URL = "https://api.telegram.org/bot<jeton>/sendMessage"
+JSON_HEADERS = {'Content-Type': 'application/json'}
+HTML_HEADERS = {'Content-Type': 'text/html; charset=utf-8'}
+
+
+def layout(num_pages):
+    # (nombre d'URLs de base, pages par URL) : 200 pages = 20 URLs de 10 pages
+    pages_per_url = min(num_pages, PAGES_PER_BASE_URL)
+    return num_pages // pages_per_url, pages_per_url
+
+
+def base_urls(num_urls):
+    return [f"https://www.2ememain.be/l/autos/q{i}/" for i in range(num_urls)]
+
+
+def record_cassette(path, num_pages):
+    # Cassette synthétique, au même format qu'un run enregistré avec main.py --record
+    num_urls, pages_per_url = layout(num_pages)
+    recording = cassette.Cassette(path, cassette.RECORD)
+    for i, base_url in enumerate(base_urls(num_urls)):
+        site = StubSite(cards_per_page=CARDS_PER_PAGE, first_ad_id=2_100_000_000 - i * 1_000_000)
+        for page_num in range(1, pages_per_url + 1):
+            body = site.handle(f"/l/autos/q{i}/p/{page_num}/")[2]
+            recording.add('GET', page_url(base_url, page_num), {}, None, 200, HTML_HEADERS, body)
+    fake = FakeMistral()
+    for i in range(MISTRAL_RESPONSES):
+        body = json.dumps(fake.complete({'messages': [{'content': f"annonce {i}"}]})).encode('utf-8')
+        recording.add('POST', MISTRAL_URL, {}, f"annonce {i}".encode('utf-8'), 200, JSON_HEADERS, body)
+    body = json.dumps({'ok': True, 'result': {'message_id': 1, 'chat': {'id': 1}}}).encode('utf-8')
+    recording.add('POST', TELEGRAM_URL, {}, None, 200, JSON_HEADERS, body)
+    recording.save()
+
+
+def prepare_history(data_dir, size):
+    # Processus à part : l'historique n'occupe pas la mémoire du processus principal
+    templates = []
+    for ad_id in range(1_000_000, 1_000_000 + HISTORY_TEMPLATES):
+        ad = make_ad(ad_id)
+        brand, model = guess_brand_model(ad['title'])
+        templates.append({'title': ad['title'], 'price': str(ad['price']), 'mileage': str(ad['mileage']), 'year': str(ad['year']),
+                          'fuel_type': ad['fuel_type'], 'brand': brand, 'model': model, 'city': ad['city']})
+    ads = []
+    for n in range(size):
+        ad = dict(templates[n % HISTORY_TEMPLATES])
+        ad['url'] = f"https://www.2ememain.be/v/autos/x/m{1_000_000 + n}-x"
+        ads.append(ad)
+    write_snapshot(ads, os.path.join(data_dir, 'annonces_vues.json'))
+    # Index des prix déjà à jour, comme après un run précédent
+    price_index = PriceIndex(os.path.join(data_dir, 'index_prix.json'))
+    price_index.sync(SeenAdsStore(ads))
+    price_index.save()
+
+
+def run_child(work_dir, cassette_dir, num_urls, pages_per_url):
+    recording = cassette.install(cassette_dir, cassette.REPLAY)
+    # Importé ici : main.py charge .env, dont les URLs de faux serveurs ne doivent pas viser la cassette
+    import main
+    from metrics import get_default_metrics
+    for name in ('MISTRAL_SERVER_URL', 'TELEGRAM_API_URL'):
+        os.environ.pop(name, None)
+    os.chdir(work_dir)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = main.BotState()
+        main.run_cycle(state, base_urls(num_urls), pages_per_url)
+        state.checkpoint()
+    wall = time.perf_counter() - start
+
+    # ru_maxrss : en Ko sous Linux, en octets sous macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    print(json.dumps({'temps_s': round(wall, 3), 'rss_max_mo': round(peak_rss_mb, 1),
+                      'cassette': recording.stats, 'mesures': get_default_metrics().report()}))
+
+
+def child(*args):
+    output = subprocess.run([sys.executable, '-m', 'bench.bench_end_to_end', *map(str, args)],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if output.returncode:
+        raise RuntimeError(f"Échec du processus {args[:2]} :\n{output.stderr}")
+    return output.stdout
+
+
+def stage_seconds(durations, *names):
+    return sum(durations[name]['total_s'] for name in names if name in durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs complets hors ligne sur historique synthétique")
+    parser.add_argument('--full', action='store_true', help="ajouter l'historique de 1M d'annonces")
+    parser.add_argument('--json', metavar='PATH', help="écrire tous les résultats (mesures complètes) dans PATH")
+    parser.add_argument('--prepare', nargs=2, metavar=('DATA_DIR', 'SIZE'), help=argparse.SUPPRESS)
+    parser.add_argument('--child', nargs=4, metavar=('WORK_DIR', 'CASSETTE', 'URLS', 'PAGES'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.prepare:
+        prepare_history(args.prepare[0], int(args.prepare[1]))
+        return
+    if args.child:
+        work_dir, cassette_dir, num_urls, pages_per_url = args.child
+        run_child(work_dir, cassette_dir, int(num_urls), int(pages_per_url))
+        return
+
+    results = []
+    root = tempfile.mkdtemp(prefix='bench_e2e_')
+    try:
+        for num_pages in PAGE_COUNTS:
+            record_cassette(os.path.join(root, f"cassette_{num_pages}"), num_pages)
+
+        print(f"{'historique':>10} {'pages':>5} {'annonces':>8} {'appels IA':>9} {'temps':>7} {'RSS max':>8} | "
+              f"{'chargement':>10} {'crawl':>6} {'IA':>6} {'Telegram':>8} {'sauvegarde':>10}")
+        for size in (FULL_HISTORY_SIZES if args.full else HISTORY_SIZES):
+            history_dir = os.path.join(root, f"historique_{size}")
+            child('--prepare', history_dir, size)
+            for num_pages in PAGE_COUNTS:
+                work_dir = os.path.join(root, 'run')
+                shutil.rmtree(work_dir, ignore_errors=True)
+                shutil.copytree(history_dir, os.path.join(work_dir, 'data'))
+                num_urls, pages_per_url = layout(num_pages)
+                result = json.loads(child('--child', work_dir, os.path.join(root, f"cassette_{num_pages}"),
+                                          num_urls, pages_per_url).strip().splitlines()[-1])
+                assert result['cassette']['absentes'] == 0, f"Requêtes absentes de la cassette : {result['cassette']}"
+
+                counters = result['mesures']['compteurs']
+                durations = result['mesures']['durees']
+                print(f"{size:>10} {num_pages:>5} {counters.get('cards_parsed', 0):>8} {counters.get('llm_calls', 0):>9} "
+                      f"{result['temps_s']:>6.2f}s {result['rss_max_mo']:>6.0f}Mo | "
+                      f"{stage_seconds(durations, 'load_seconds'):>9.2f}s "
+                      f"{stage_seconds(durations, 'http_request_seconds', 'parse_seconds'):>5.2f}s "
+                      f"{stage_seconds(durations, 'llm_latency_seconds'):>5.2f}s "
+                      f"{stage_seconds(durations, 'notification_seconds'):>7.2f}s "
+                      f"{stage_seconds(durations, 'save_seconds'):>9.2f}s")
+                results.append({'historique': size, 'pages': num_pages, **result})
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print("\nIA et Telegram : durées cumulées des appels concurrents (rejoués), pas du temps écoulé.")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Résultats complets écrits dans {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import os
+import time
+
+from ai.evaluate import AdEvaluator, evaluate_car_ads
+from bench.fake_mistral import FakeMistral
+from bench.stub_site import make_ad
+from metrics import get_default_metrics
+
+# Annonces notées par minute contre un faux endpoint Mistral local :
+# ancienne boucle (nouveau client + appel bloquant + pause de 2 s par annonce),
+# client réutilisé en séquentiel, et evaluate_car_ads (concurrent).
+# La pause de 2 s et le débit autorisé sont mis à l'échelle par DELAY_SCALE.
+# Lancer depuis la racine du dépôt : python -m bench.bench_evaluate
+
+NUM_ADS = 24
+API_LATENCY = 0.8
+DELAY_SCALE = 0.25
+SERVER_MAX_REQUESTS_PER_SECOND = 4 / DELAY_SCALE
+MAX_WORKERS = 4
+
+
+def make_listings():
+    listings = []
+    for i in range(NUM_ADS):
+        ad = make_ad(2_100_000_000 + i)
+        listings.append({
+            'title': ad['title'], 'description': ad['description'], 'price': str(ad['price']),
+            'mileage': str(ad['mileage']), 'year': str(ad['year']), 'model': 'N/A', 'brand': 'N/A',
+            'fuel_type': ad['fuel_type'], 'transmission': ad['transmission'], 'body_type': ad['body_type'],
+        })
+    return listings
+
+
+def run_sequential(listings):
+    results = []
+    for listing in listings:
+        # Un client neuf par annonce, comme avant AdEvaluator
+        evaluator = AdEvaluator(requests_per_second=SERVER_MAX_REQUESTS_PER_SECOND)
+        results.append(evaluator.evaluate(listing))
+        time.sleep(2 * DELAY_SCALE)
+    return results, None
+
+
+def run_reused_client(listings):
+    evaluator = AdEvaluator(requests_per_second=SERVER_MAX_REQUESTS_PER_SECOND)
+    results = [evaluator.evaluate(listing) for listing in listings]
+    return results, evaluator
+
+
+def run_batched(listings):
+    evaluator = AdEvaluator(requests_per_second=SERVER_MAX_REQUESTS_PER_SECOND)
+    results = evaluate_car_ads(listings, evaluator=evaluator, max_workers=MAX_WORKERS)
+    return results, evaluator
+
+
+TIMING_HISTOGRAMS = ('llm_wait_seconds', 'llm_latency_seconds', 'llm_parse_seconds')
+
+
+def histogram_totals():
+    # (nombre, somme) des histogrammes de l'évaluateur dans le registre partagé, pour isoler un scénario
+    histograms = get_default_metrics().histograms
+    return {name: (histograms[name].count, histograms[name].total) if name in histograms else (0, 0.0)
+            for name in TIMING_HISTOGRAMS}
+
+
+def print_timings(before):
+    after = histogram_totals()
+    means = {}
+    for name in TIMING_HISTOGRAMS:
+        count = after[name][0] - before[name][0]
+        means[name] = (after[name][1] - before[name][1]) / count if count else 0.0
+    print(f"{'':>18} moyenne par appel : attente {means['llm_wait_seconds'] * 1000:.0f} ms, "
+          f"réseau {means['llm_latency_seconds'] * 1000:.0f} ms, parsing JSON {means['llm_parse_seconds'] * 1000:.2f} ms")
+
+
+def main():
+    fake = FakeMistral(latency=API_LATENCY, max_requests_per_second=SERVER_MAX_REQUESTS_PER_SECOND)
+    os.environ['MISTRAL_SERVER_URL'] = fake.start()
+    os.environ.setdefault('MISTRAL_API_KEY', 'fake-key')
+    listings = make_listings()
+    try:
+        for name, runner in [('séquentiel', run_sequential), ('client réutilisé', run_reused_client), ('par lots', run_batched)]:
+            before = histogram_totals()
+            start = time.perf_counter()
+            results, evaluator = runner(listings)
+            elapsed = time.perf_counter() - start
+            failures = sum(1 for result in results if result.get('note') == 0)
+            print(f"{name:>16} : {len(listings)} annonces en {elapsed:.2f} s -> "
+                  f"{len(listings) / elapsed * 60:.0f} annonces/min ({failures} échecs)")
+            if evaluator:
+                print_timings(before)
+        print(f"Réponses 429 du faux serveur : {fake.rate_limited_count}")
+    finally:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import random
+import time
+
+import requests
+
+from bench.stub_site import StubSite
+from scraper.fetcher import DEFAULT_HEADERS, create_session, fetch_pages
+from scraper.scheduler import PER_HOST_REQUESTS_PER_SECOND, RequestScheduler
+
+# Pages/s : chemin séquentiel actuel (requests.get nu + pause 1-3 s entre pages)
+# contre le moteur concurrent sur une session keep-alive partagée.
+# Les pauses de politesse sont réduites d'un facteur DELAY_SCALE des deux côtés.
+# Lancer depuis la racine du dépôt : python -m bench.bench_fetch
+
+NUM_BASE_URLS = 4
+NUM_PAGES_PER_BASE_URL = 5
+SERVER_LATENCY = 0.25
+DELAY_SCALE = 0.1
+MAX_WORKERS = 4
+
+
+def page_urls(base):
+    urls = []
+    for base_num in range(NUM_BASE_URLS):
+        for page_num in range(1, NUM_PAGES_PER_BASE_URL + 1):
+            suffix = '' if page_num == 1 else f"p/{page_num}/"
+            urls.append(f"{base}/l/autos/q{base_num}/{suffix}")
+    return urls
+
+
+def run_sequential(urls):
+    for url in urls:
+        response = requests.get(url, headers=DEFAULT_HEADERS)
+        response.raise_for_status()
+        time.sleep(random.uniform(1, 3) * DELAY_SCALE)
+
+
+def run_concurrent(urls):
+    session = create_session(pool_size=MAX_WORKERS)
+    scheduler = RequestScheduler(PER_HOST_REQUESTS_PER_SECOND / DELAY_SCALE, jitter=0.5 * DELAY_SCALE)
+    pages = fetch_pages(urls, max_workers=MAX_WORKERS, session=session, scheduler=scheduler)
+    assert all(html for _, html in pages)
+
+
+def main():
+    site = StubSite(latency=SERVER_LATENCY)
+    base = site.start()
+    urls = page_urls(base)
+    try:
+        for name, runner in [('séquentiel', run_sequential), ('concurrent', run_concurrent)]:
+            start = time.perf_counter()
+            runner(urls)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>12} : {len(urls)} pages en {elapsed:.2f} s -> {len(urls) / elapsed:.1f} pages/s")
+    finally:
+        site.stop()
+
+
+if __name__ == '__main__':
+    main()
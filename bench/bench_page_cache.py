@@ -0,0 +1,94 @@
+import hashlib
+import time
+
+from bench.stub_site import StubSite
+from scraper.crawler import crawl_all
+from scraper.fetcher import create_session
+from scraper.page_cache import PageCache
+from scraper.scheduler import RequestScheduler
+
+# Trois passages successifs (démarrage à froid, rien de neuf, 3 nouvelles annonces) sur un
+# faux 2ememain local, avec et sans cache des pages. Les requêtes q0/q1 gèrent ETag et
+# If-None-Match (304) ; q2/q3 renvoient toujours 200 avec un jeton qui change à chaque
+# réponse, seule l'empreinte des IDs d'annonces permet alors de sauter la page.
+# Lancer depuis la racine du dépôt : python -m bench.bench_page_cache
+
+NUM_BASE_URLS = 4
+NUM_PAGES_PER_BASE_URL = 5
+SERVER_LATENCY = 0.05
+NEW_ADS_BEFORE_LAST_POLL = 3
+
+
+class CachingStubSite(StubSite):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.bytes_sent = 0
+        self.not_modified = 0
+        self.token = 0
+
+    def handle(self, path, headers=None):
+        status, response_headers, body = super().handle(path, headers)
+        if '/q0/' in path or '/q1/' in path:
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            response_headers = dict(response_headers, ETag=etag)
+            if headers is not None and headers.get('If-None-Match') == etag:
+                self.not_modified += 1
+                return 304, {'ETag': etag}, b''
+        else:
+            self.token += 1
+            body = body.replace(b'</body>', f'<input name="csrf" value="{self.token}"></body>'.encode('ascii'))
+        self.bytes_sent += len(body)
+        return status, response_headers, body
+
+
+def run(page_cache):
+    site = CachingStubSite(latency=SERVER_LATENCY)
+    base = site.start()
+    base_urls = [f"{base}/l/autos/q{num}/" for num in range(NUM_BASE_URLS)]
+    session = create_session()
+    scheduler = RequestScheduler(1000, jitter=0)
+    seen = set()
+    rows = []
+    try:
+        for poll in range(3):
+            if poll == 2:
+                site.first_ad_id += NEW_ADS_BEFORE_LAST_POLL
+            requests_before, bytes_before = site.request_count, site.bytes_sent
+            passed_downstream = []
+
+            def on_page(base_url, listings):
+                passed_downstream.extend(listings)
+
+            start = time.perf_counter()
+            crawl_all(base_urls, seen.__contains__, NUM_PAGES_PER_BASE_URL, session=session, scheduler=scheduler,
+                      on_page=on_page, page_cache=page_cache)
+            if page_cache:
+                page_cache.commit()
+            elapsed = time.perf_counter() - start
+            new_ads = {listing['url'] for listing in passed_downstream} - seen
+            seen.update(new_ads)
+            rows.append((poll + 1, site.request_count - requests_before, (site.bytes_sent - bytes_before) / 1024,
+                         len(passed_downstream), len(new_ads), elapsed))
+    finally:
+        site.stop()
+    return rows, site.not_modified
+
+
+def main():
+    results = []
+    for name, page_cache in [('sans cache', None), ('avec cache', PageCache())]:
+        rows, not_modified = run(page_cache)
+        results.append((name, rows, not_modified, page_cache))
+
+    print()
+    for name, rows, not_modified, page_cache in results:
+        print(f"{name} ({not_modified} réponses 304) :")
+        for poll, requests_count, kilobytes, downstream, new_ads, elapsed in rows:
+            print(f"  passage {poll} : {requests_count} requêtes, {kilobytes:.0f} Ko reçus, "
+                  f"{downstream} annonces passées à l'aval ({new_ads} nouvelles), {elapsed:.2f} s")
+        if page_cache:
+            page_cache.print_report()
+
+
+if __name__ == '__main__':
+    main()
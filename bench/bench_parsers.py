@@ -0,0 +1,96 @@
+import contextlib
+import io
+import json
+import os
+import time
+
+from scraper.parsers import PARSER_BACKENDS, get_parser
+from scraper.scrape_2ememain import parse_listings
+
+# Cartes/s pour chaque backend de parsing, après avoir vérifié que tous
+# produisent exactement les mêmes dictionnaires d'annonces que BeautifulSoup.
+# Puis, sur une page avec l'état JSON embarqué : résultat comparé au fichier attendu,
+# cohérence avec le parsing HTML, et temps par page de chaque chemin.
+# Lancer depuis la racine du dépôt : python -m bench.bench_parsers
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+FIXTURES = ['results_page.html', 'edge_cases.html']
+STATE_FIXTURE = 'results_page_state.html'
+STATE_EXPECTED = 'results_page_state.expected.json'
+# Champs visibles sur les cartes HTML, qui doivent être identiques dans l'état JSON
+CARD_FIELDS = ['title', 'price', 'url', 'description', 'year', 'mileage', 'fuel_type', 'transmission', 'body_type']
+REPEAT = 50
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def available_backends():
+    names = []
+    for name in PARSER_BACKENDS:
+        try:
+            get_parser(name)
+        except ImportError as e:
+            print(f"Backend '{name}' indisponible : {e}")
+            continue
+        names.append(name)
+    return names
+
+
+def time_parse_listings(html, **kwargs):
+    # parse_listings affiche une ligne par page : sortie masquée pendant la mesure
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            parse_listings(html, **kwargs)
+        return (time.perf_counter() - start) / REPEAT
+
+
+def check_embedded_state(backends):
+    html = load_fixture(STATE_FIXTURE)
+    listings = parse_listings(html)
+    expected = json.loads(load_fixture(STATE_EXPECTED))
+    assert listings == expected, "L'état JSON embarqué ne donne pas les annonces attendues"
+
+    # Les annonces présentes dans les deux sources doivent concorder sur les champs des cartes
+    from_html = {listing['url']: listing for listing in parse_listings(html, embedded_state=False)}
+    compared = 0
+    for listing in listings:
+        card = from_html.get(listing['url'])
+        if card:
+            assert {f: listing[f] for f in CARD_FIELDS} == {f: card[f] for f in CARD_FIELDS}, listing['url']
+            compared += 1
+    extras = sum(1 for listing in listings if listing['city'] != 'N/A')
+    print(f"\n{STATE_FIXTURE} : {len(listings)} annonces conformes au fichier attendu, "
+          f"{compared} identiques au parsing HTML, {extras} avec la ville")
+
+    print(f"  {'état JSON':>9} : {time_parse_listings(html) * 1000:.2f} ms/page")
+    for name in backends:
+        elapsed = time_parse_listings(html, parser=get_parser(name), embedded_state=False)
+        print(f"  {name:>9} : {elapsed * 1000:.2f} ms/page")
+
+
+def main():
+    backends = available_backends()
+    for fixture in FIXTURES:
+        html = load_fixture(fixture)
+        reference = parse_listings(html, parser=get_parser('bs4'))
+        print(f"\n{fixture} : {len(reference)} annonces")
+        for name in backends:
+            listings = parse_listings(html, parser=get_parser(name))
+            assert listings == reference, f"Le backend '{name}' ne produit pas les mêmes annonces que bs4"
+
+            cards = 0
+            start = time.perf_counter()
+            for _ in range(REPEAT):
+                cards += len(list(get_parser(name).iter_cards(html)))
+            elapsed = time.perf_counter() - start
+            print(f"  {name:>5} : {cards / elapsed:>9.0f} cartes/s ({elapsed / REPEAT * 1000:.2f} ms/page)")
+
+    check_embedded_state(backends)
+
+
+if __name__ == '__main__':
+    main()
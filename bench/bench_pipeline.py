@@ -0,0 +1,84 @@
+import os
+import statistics
+import time
+
+from ai.evaluate import AdEvaluator, evaluate_car_ads
+from bench.fake_mistral import FakeMistral
+from bench.stub_site import StubSite
+from pipeline import LatencyTracker, PageStream, evaluate_stream
+from scraper.crawler import crawl_all
+from scraper.scheduler import RequestScheduler
+
+# Latence téléchargement de la page -> verdict IA, par annonce, contre un faux 2ememain
+# et un faux Mistral locaux : ancien enchaînement (tout crawler, puis tout évaluer)
+# contre le pipeline en flux de pipeline.py.
+# Lancer depuis la racine du dépôt : python -m bench.bench_pipeline
+
+NUM_BASE_URLS = 3
+NUM_PAGES_PER_BASE_URL = 4
+CARDS_PER_PAGE = 5
+SERVER_LATENCY = 0.25
+API_LATENCY = 0.3
+PER_HOST_REQUESTS_PER_SECOND = 4.0
+MAX_WORKERS = 4
+
+
+def base_urls(base):
+    return [f"{base}/l/autos/q{num}/" for num in range(NUM_BASE_URLS)]
+
+
+def crawl(urls, on_page):
+    scheduler = RequestScheduler(PER_HOST_REQUESTS_PER_SECOND, jitter=0)
+    return crawl_all(urls, lambda url: False, NUM_PAGES_PER_BASE_URL, max_workers=MAX_WORKERS,
+                     scheduler=scheduler, on_page=on_page)
+
+
+def run_batch(urls, evaluator, latency):
+    listings_by_query, _ = crawl(urls, lambda base_url, listings: latency.page_fetched(listings))
+    listings = [listing for _, page_listings in listings_by_query for listing in page_listings]
+    for listing in evaluate_car_ads(listings, evaluator=evaluator, max_workers=MAX_WORKERS):
+        pass
+    for listing in listings:
+        latency.reached(listing, 'verdict IA')
+
+
+def run_streaming(urls, evaluator, latency):
+    def crawl_pages(on_page):
+        def page_parsed(base_url, listings):
+            latency.page_fetched(listings)
+            on_page(base_url, listings)
+        return crawl(urls, page_parsed)[1]
+
+    listings = (listing for _, page_listings in PageStream(crawl_pages) for listing in page_listings)
+    for listing, _ in evaluate_stream(listings, evaluator.evaluate, max_workers=MAX_WORKERS):
+        latency.reached(listing, 'verdict IA')
+
+
+def main():
+    site = StubSite(latency=SERVER_LATENCY, cards_per_page=CARDS_PER_PAGE)
+    fake = FakeMistral(latency=API_LATENCY)
+    urls = base_urls(site.start())
+    os.environ['MISTRAL_SERVER_URL'] = fake.start()
+    os.environ.setdefault('MISTRAL_API_KEY', 'fake-key')
+    results = []
+    try:
+        for name, runner in [('crawl puis IA', run_batch), ('en flux', run_streaming)]:
+            # Pas de limite de débit côté client : seul l'ordonnancement diffère
+            evaluator = AdEvaluator(requests_per_second=1000)
+            latency = LatencyTracker()
+            start = time.perf_counter()
+            runner(urls, evaluator, latency)
+            elapsed = time.perf_counter() - start
+            results.append((name, elapsed, latency.latencies['verdict IA']))
+    finally:
+        site.stop()
+        fake.stop()
+
+    print()
+    for name, elapsed, values in results:
+        print(f"{name:>14} : {len(values)} annonces en {elapsed:.2f} s, latence min {min(values):.2f} s, "
+              f"latence médiane {statistics.median(values):.2f} s, max {max(values):.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import time
+
+from storage.seen_ads import SeenAdsStore
+
+# Benchmark du dédoublonnage : le temps par lot d'annonces scrapées doit rester
+# constant quelle que soit la taille de l'historique.
+# Lancer depuis la racine du dépôt : python -m bench.bench_seen_ads
+
+HISTORY_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+BATCH_SIZE = 1_000
+
+
+def fake_url(ad_id):
+    return f"https://www.2ememain.be/v/autos/volkswagen/m{ad_id}-vw-golf-7-1-6-tdi"
+
+
+def dedup_with_store(store, urls):
+    return [url for url in urls if url not in store]
+
+
+def dedup_with_list_scan(seen_ads, urls):
+    # Ancienne méthode de main() : liste des URLs reconstruite pour chaque annonce
+    new_urls = []
+    for url in urls:
+        seen_urls_list = [ad.get('url') for ad in seen_ads if ad.get('url')]
+        if url not in seen_urls_list:
+            new_urls.append(url)
+    return new_urls
+
+
+def main():
+    print(f"{'historique':>12} | {'store (ms)':>10} | {'scan liste (ms)':>15}")
+    for size in HISTORY_SIZES:
+        seen_ads = [{'url': fake_url(2_000_000_000 + i)} for i in range(size)]
+        store = SeenAdsStore(seen_ads)
+        # Moitié déjà vues, moitié nouvelles
+        urls = [fake_url(2_000_000_000 + i) for i in range(0, size, max(1, size // (BATCH_SIZE // 2)))][:BATCH_SIZE // 2]
+        urls += [fake_url(3_000_000_000 + i) for i in range(BATCH_SIZE - len(urls))]
+
+        start = time.perf_counter()
+        new_urls = dedup_with_store(store, urls)
+        store_ms = (time.perf_counter() - start) * 1000
+
+        scan_ms = 'ignoré'
+        if size <= 10_000:
+            # Au-delà, la méthode quadratique prend plusieurs minutes
+            start = time.perf_counter()
+            assert dedup_with_list_scan(seen_ads, urls) == new_urls
+            scan_ms = f"{(time.perf_counter() - start) * 1000:.1f}"
+
+        print(f"{size:>12} | {store_ms:>10.2f} | {scan_ms:>15}")
+
+
+if __name__ == '__main__':
+    main()
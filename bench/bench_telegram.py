@@ -0,0 +1,76 @@
+import os
+import time
+
+import requests
+
+from bench.fake_telegram import FakeTelegram
+from notify.telegram_bot import TelegramNotifier
+
+# Rafale d'alertes contre un faux serveur Bot API local (1 message/s par chat, 429 avec
+# retry_after, une requête sur FAIL_EVERY en 502) : ancien envoi (requests.post nu, erreur
+# simplement affichée) contre la file TelegramNotifier, sans puis avec digest.
+# Vérifie aussi qu'aucune alerte n'est perdue ni envoyée deux fois.
+# Lancer depuis la racine du dépôt : python -m bench.bench_telegram
+
+NUM_ALERTS = 12
+FAIL_EVERY = 7
+
+
+def alert(number):
+    return f"""
+    <b>🚘 Nouvelle affaire notée 5/5 !</b>
+    <b>Alerte {number:03d}</b>
+    Prix: 4500 | Km: 120000 | Année: 2014
+    """
+
+
+def run_bare_post(base_url):
+    # Comme l'ancien send_telegram_message : pas de session, pas de nouvel essai
+    for number in range(NUM_ALERTS):
+        try:
+            response = requests.post(f"{base_url}/botfake-token/sendMessage",
+                                     json={"chat_id": "42", "text": alert(number), "parse_mode": "HTML"})
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            pass
+    return None
+
+
+def run_notifier(digest):
+    def runner(base_url):
+        notifier = TelegramNotifier(bot_token='fake-token', chat_id='42', digest=digest)
+        for number in range(NUM_ALERTS):
+            notifier.notify(alert(number))
+        notifier.flush()
+        return notifier
+    return runner
+
+
+def main():
+    results = []
+    for name, runner in [('requests.post nu', run_bare_post), ('file', run_notifier(False)), ('file + digest', run_notifier(True))]:
+        fake = FakeTelegram(fail_every=FAIL_EVERY)
+        os.environ['TELEGRAM_API_URL'] = base_url = fake.start()
+        try:
+            start = time.perf_counter()
+            notifier = runner(base_url)
+            elapsed = time.perf_counter() - start
+        finally:
+            fake.stop()
+        received = [f"Alerte {number:03d}" for number in range(NUM_ALERTS)
+                    for _, text in fake.messages if f"Alerte {number:03d}" in text]
+        delivered = len(set(received))
+        duplicates = len(received) - delivered
+        results.append((name, elapsed, delivered, duplicates, len(fake.messages), fake.rate_limited_count, notifier))
+
+    print()
+    for name, elapsed, delivered, duplicates, messages, rate_limited, notifier in results:
+        print(f"{name:>16} : {delivered}/{NUM_ALERTS} alertes reçues ({duplicates} en double) en {messages} messages, "
+              f"{rate_limited} réponses 429, {elapsed:.1f} s")
+        if notifier:
+            print(' ' * 19, end='')
+            notifier.print_report()
+
+
+if __name__ == '__main__':
+    main()
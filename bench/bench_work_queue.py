@@ -0,0 +1,230 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from bench.fake_mistral import FakeMistral
+from bench.fake_telegram import FakeTelegram
+from bench.stub_site import PAGE_PATTERN, StubSite, make_ad, render_results_page
+
+# N processus main.py --queue sur la même file SQLite (voir work_queue.py), contre le faux site,
+# le faux Mistral et le faux Telegram locaux. Chaque processus a ses propres limites de débit
+# (comme plusieurs machines, ou une par adresse IP) : le débit total doit croître avec N.
+# Les requêtes se recoupent (la moitié des annonces d'une requête est aussi dans la suivante) :
+# chaque annonce doit pourtant être évaluée et notifiée une seule fois, quel que soit N, et se
+# retrouver une fois dans l'historique JSON (report de la file en fin de cycle).
+# Deux derniers scénarios : des envois Telegram refusés, remis en file puis envoyés une seule fois,
+# et un processus tué en plein travail, ses tâches reprises à l'expiration du bail.
+# Lancer depuis la racine du dépôt : python -m bench.bench_work_queue
+
+WORKER_COUNTS = (1, 2, 4)
+NUM_URLS = 6
+PAGES_PER_URL = 5
+CARDS_PER_PAGE = 10
+# Limites de débit de chaque processus (pages du site, appels Mistral) : comme en vrai (1/s chacune),
+# elles dominent le temps d'un processus, et non le CPU (le gain mesuré ne dépend pas du nombre de cœurs)
+PAGE_REQUESTS_PER_SECOND = 2
+LLM_REQUESTS_PER_SECOND = 3
+SITE_LATENCY = 0.05
+MISTRAL_LATENCY = 0.05
+# Bail court pour le scénario d'arrêt brutal, et délai avant de tuer le processus
+KILL_LEASE_SECONDS = 2
+KILL_AFTER_SECONDS = 10
+# Une requête Telegram sur N refusée (502), sans nouvel essai dans le notifier : l'alerte repart en file
+TELEGRAM_FAIL_EVERY = 4
+QUERY_PATTERN = re.compile(r'/f/q(\d+)/')
+HREF_PATTERN = re.compile(r'href="([^"]+)"')
+
+
+class OverlappingSite(StubSite):
+    """Faux site dont la requête /l/autos/f/q<i>/<i>/ partage la moitié de ses annonces avec q<i+1>."""
+
+    def handle(self, path, headers=None):
+        match = QUERY_PATTERN.search(path)
+        if not match:
+            return super().handle(path, headers)
+        page = PAGE_PATTERN.search(path)
+        page_num = int(page.group(1)) if page else 1
+        start = self.first_ad_id - int(match.group(1)) * PAGES_PER_URL * CARDS_PER_PAGE // 2 - (page_num - 1) * CARDS_PER_PAGE
+        ads = [make_ad(start - i) for i in range(CARDS_PER_PAGE)]
+        return 200, {'Content-Type': 'text/html; charset=utf-8'}, render_results_page(ads).encode('utf-8')
+
+
+def base_urls(site_url):
+    return [f"{site_url}/l/autos/f/q{i}/{i}/" for i in range(NUM_URLS)]
+
+
+def run_child(work_dir, db_path, site_url, lease_seconds, telegram_retries):
+    import main
+    from ai.evaluate import AdEvaluator
+    from notify.telegram_bot import MAX_RETRIES, TelegramNotifier
+    from search_plan import plan_searches
+    from work_queue import LEASE_SECONDS, WorkQueue
+    os.chdir(work_dir)
+    main.PER_HOST_REQUESTS_PER_SECOND = PAGE_REQUESTS_PER_SECOND
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = main.BotState()
+        state.evaluator = AdEvaluator(cache=state.evaluation_cache, requests_per_second=LLM_REQUESTS_PER_SECOND)
+        # Le faux Telegram n'a pas de limite par chat ici : seules les alertes en double comptent
+        state.notifier = TelegramNotifier(messages_per_second=1000,
+                                          max_retries=MAX_RETRIES if telegram_retries is None else telegram_retries)
+        work_queue = WorkQueue(db_path, lease_seconds=lease_seconds or LEASE_SECONDS)
+        main.run_queue_worker(state, work_queue, plan_searches(base_urls(site_url)), PAGES_PER_URL)
+    print(json.dumps(state.metrics.report()['compteurs']))
+
+
+def run_workers(root, name, site_url, num_workers, lease_seconds=None, kill_after=None, telegram_fail_every=None):
+    from storage.seen_ads import load_seen_ads
+    work_dir = os.path.join(root, name)
+    os.makedirs(os.path.join(work_dir, 'data'))
+    db_path = os.path.join(work_dir, 'data', 'file_attente.sqlite')
+    fake_mistral = FakeMistral(latency=MISTRAL_LATENCY)
+    fake_telegram = FakeTelegram(max_messages_per_second_per_chat=1000, fail_every=telegram_fail_every)
+    env = dict(os.environ, MISTRAL_SERVER_URL=fake_mistral.start(), MISTRAL_API_KEY='bench',
+               TELEGRAM_API_URL=fake_telegram.start(), TELEGRAM_BOT_TOKEN='bench', TELEGRAM_CHAT_ID='42')
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, '-m', 'bench.bench_work_queue', '--child', work_dir, db_path, site_url,
+               str(lease_seconds or 0), '0' if telegram_fail_every else '-1']
+
+    start = time.perf_counter()
+    workers = [subprocess.Popen(command, cwd=repo_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+               for _ in range(num_workers)]
+    if kill_after:
+        time.sleep(kill_after)
+        workers[0].send_signal(signal.SIGKILL)
+    outputs = [worker.communicate() for worker in workers]
+    wall = time.perf_counter() - start
+    for worker, (stdout, stderr) in zip(workers, outputs):
+        if worker.returncode and not kill_after:
+            raise RuntimeError(f"Échec d'un processus :\n{stderr}")
+    fake_mistral.stop()
+    fake_telegram.stop()
+
+    with sqlite3.connect(db_path) as db:
+        tasks = dict(db.execute("SELECT kind || ':' || status, COUNT(*) FROM tasks GROUP BY kind, status").fetchall())
+        scored = db.execute("SELECT COUNT(*) FROM seen_ads WHERE note IS NOT NULL").fetchone()[0]
+        notified = db.execute("SELECT COUNT(*) FROM seen_ads WHERE notified_at IS NOT NULL").fetchone()[0]
+        ads = db.execute("SELECT COUNT(*) FROM seen_ads").fetchone()[0]
+        not_merged = db.execute("SELECT COUNT(*) FROM seen_ads WHERE dirty = 1").fetchone()[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        history = load_seen_ads(os.path.join(work_dir, 'data', 'annonces_vues.json'))
+    alerts = Counter(HREF_PATTERN.search(text).group(1) for _, text in fake_telegram.messages)
+    counters = Counter()
+    for stdout, _ in outputs:
+        if stdout.strip():
+            counters.update(json.loads(stdout.strip().splitlines()[-1]))
+    return {
+        'processus': num_workers,
+        'temps_s': round(wall, 2),
+        'taches': tasks,
+        'annonces': ads,
+        'pages': tasks.get('page:terminee', 0),
+        'evaluations': tasks.get('evaluation:terminee', 0),
+        'notifications': tasks.get('notification:terminee', 0),
+        'notifications_abandonnees': tasks.get('notification:echec', 0),
+        'historique_json': len(history.ads),
+        'historique_notees': sum(1 for ad in history.ads if ad.get('ai_note') is not None),
+        'non_reportees': not_merged,
+        'envois_refuses': fake_telegram.request_count - len(fake_telegram.messages) - fake_telegram.rate_limited_count,
+        'appels_ia': fake_mistral.request_count,
+        'verdicts': scored,
+        'notifications_reservees': notified,
+        'alertes': sum(alerts.values()),
+        'alertes_en_double': sum(count - 1 for count in alerts.values()),
+        'reprises': counters.get('queue_reclaimed', 0),
+    }
+
+
+def print_result(result, reference):
+    tasks_per_second = (result['pages'] + result['evaluations']) / result['temps_s']
+    speedup = reference['temps_s'] / result['temps_s'] if reference else 1.0
+    print(f"{result['processus']:>9} {result['temps_s']:>6.1f}s {result['pages']:>5} {result['annonces']:>8} "
+          f"{result['evaluations']:>11} {result['appels_ia']:>9} {result['alertes']:>7} {result['alertes_en_double']:>8} "
+          f"{tasks_per_second:>8.1f} {speedup:>7.2f}x")
+
+
+def check_exactly_once(result, killed=0):
+    # Un processus tué peut avoir fait un appel IA sans avoir pu écrire son verdict
+    assert result['alertes_en_double'] == 0, f"Alertes envoyées deux fois : {result}"
+    assert result['appels_ia'] <= result['verdicts'] + killed, f"Annonces évaluées deux fois : {result}"
+    assert result['verdicts'] <= result['evaluations'], f"Verdicts écrits deux fois : {result}"
+
+
+def check_merged(result):
+    # Le dernier processus a reporté la file dans l'historique JSON : un run normal ne les reverra pas
+    assert result['non_reportees'] == 0, f"Annonces de la file absentes de l'historique JSON : {result}"
+    assert result['historique_json'] == result['annonces'], f"Historique JSON incomplet : {result}"
+    assert result['historique_notees'] == result['verdicts'], f"Verdicts absents de l'historique JSON : {result}"
+
+
+def main():
+    from work_queue import MAX_ATTEMPTS
+    parser = argparse.ArgumentParser(description="Processus --queue en parallèle sur une file SQLite partagée")
+    parser.add_argument('--child', nargs=5, metavar=('WORK_DIR', 'DB', 'SITE', 'LEASE', 'RETRIES'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        work_dir, db_path, site_url, lease_seconds, telegram_retries = args.child
+        run_child(work_dir, db_path, site_url, float(lease_seconds) or None,
+                  int(telegram_retries) if int(telegram_retries) >= 0 else None)
+        return
+
+    site = OverlappingSite(latency=SITE_LATENCY, cards_per_page=CARDS_PER_PAGE)
+    site_url = site.start()
+    root = tempfile.mkdtemp(prefix='bench_file_')
+    print(f"{NUM_URLS} requêtes de {PAGES_PER_URL} pages ({CARDS_PER_PAGE} annonces), la moitié en commun avec la suivante ; "
+          f"par processus : {PAGE_REQUESTS_PER_SECOND} pages/s, {LLM_REQUESTS_PER_SECOND} appels IA/s.\n")
+    print(f"{'processus':>9} {'temps':>7} {'pages':>5} {'annonces':>8} {'évaluations':>11} {'appels IA':>9} "
+          f"{'alertes':>7} {'doublons':>8} {'tâches/s':>8} {'gain':>8}")
+    try:
+        results = []
+        for num_workers in WORKER_COUNTS:
+            result = run_workers(root, f"run_{num_workers}", site_url, num_workers)
+            check_exactly_once(result)
+            check_merged(result)
+            print_result(result, results[0] if results else None)
+            results.append(result)
+        # Même travail, quel que soit le nombre de processus
+        assert len({(r['pages'], r['annonces'], r['evaluations'], r['alertes']) for r in results}) == 1, results
+        for previous, result in zip(results, results[1:]):
+            assert result['temps_s'] < previous['temps_s'] * 0.8, f"Le débit ne croît pas avec le nombre de processus : {results}"
+
+        print(f"\nEnvois Telegram refusés (1 requête sur {TELEGRAM_FAIL_EVERY}, sans nouvel essai dans le notifier), 2 processus :")
+        result = run_workers(root, 'run_refus', site_url, 2, telegram_fail_every=TELEGRAM_FAIL_EVERY)
+        check_exactly_once(result)
+        check_merged(result)
+        assert result['envois_refuses'] > 0, f"Aucun envoi refusé : {result}"
+        # Une alerte refusée n'est plus réservée : seules les alertes envoyées le restent
+        assert result['alertes'] == result['notifications'] == result['notifications_reservees'], \
+            f"Alertes perdues après un refus : {result}"
+        print_result(result, results[0])
+        print(f"  {result['envois_refuses']} envois refusés et remis en file ; {result['alertes']} alertes envoyées une fois, "
+              f"{result['notifications_abandonnees']} abandonnée(s) après {MAX_ATTEMPTS} essais")
+
+        print(f"\nArrêt brutal d'un processus sur 2 après {KILL_AFTER_SECONDS} s (bail de {KILL_LEASE_SECONDS} s) :")
+        result = run_workers(root, 'run_kill', site_url, 2, lease_seconds=KILL_LEASE_SECONDS, kill_after=KILL_AFTER_SECONDS)
+        check_exactly_once(result, killed=1)
+        check_merged(result)
+        assert set(result['taches']) <= {'page:terminee', 'evaluation:terminee', 'notification:terminee'}, \
+            f"Tâches non terminées : {result['taches']}"
+        print_result(result, results[0])
+        print(f"  {result['reprises']} tâches reprises après expiration du bail ; tâches : {result['taches']}")
+        print(f"  {result['notifications_reservees'] - result['alertes']} alerte(s) réservée(s) par le processus tué "
+              f"et jamais envoyée(s) (au plus une fois, jamais deux)")
+    finally:
+        site.stop()
+        shutil.rmtree(root, ignore_errors=True)
+    print("\nAucune annonce évaluée ni notifiée deux fois.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Faux endpoint Mistral local (POST /v1/chat/completions) pour les benchmarks :
+# latence simulée, limite de débit côté serveur (429 + Retry-After) et
+# réponse JSON déterministe dérivée du prompt.
+
+
+def fake_verdict(prompt):
+    digest = hashlib.sha1(prompt.encode('utf-8')).digest()
+    return {"note": 1 + digest[0] % 5, "commentaire": "Réponse simulée par le faux serveur Mistral."}
+
+
+class FakeMistral:
+    def __init__(self, latency=0.5, max_requests_per_second=None):
+        self.latency = latency
+        self.max_requests_per_second = max_requests_per_second
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _over_limit(self):
+        if not self.max_requests_per_second:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_requests_per_second:
+                self.rate_limited_count += 1
+                return True
+            self._recent.append(now)
+            return False
+
+    def complete(self, payload):
+        prompt = payload['messages'][-1]['content']
+        return {
+            "id": "fake-completion",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get('model', 'mistral-tiny'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(fake_verdict(prompt), ensure_ascii=False)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 40, "total_tokens": len(prompt) // 4 + 40},
+        }
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                with fake._lock:
+                    fake.request_count += 1
+                if fake._over_limit():
+                    self._send(429, {"message": "Requests rate limit exceeded"}, {'Retry-After': '1'})
+                    return
+                time.sleep(fake.latency)
+                self._send(200, fake.complete(payload))
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,89 @@
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Faux serveur Bot API Telegram local (POST /bot<token>/sendMessage) pour les benchmarks :
+# limite de débit par chat comme le vrai service (429 + parameters.retry_after),
+# pannes 502 optionnelles, et journal des messages acceptés.
+
+SEND_MESSAGE_PATH = re.compile(r'^/bot[^/]+/sendMessage$')
+
+
+class FakeTelegram:
+    def __init__(self, max_messages_per_second_per_chat=1, retry_after=1, fail_every=None):
+        self.max_messages_per_second_per_chat = max_messages_per_second_per_chat
+        self.retry_after = retry_after
+        # Une requête sur `fail_every` échoue en 502 (panne passagère)
+        self.fail_every = fail_every
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.messages = []
+        self._recent = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _over_limit(self, chat_id):
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent.setdefault(chat_id, deque())
+            while recent and now - recent[0] > 1.0:
+                recent.popleft()
+            if len(recent) >= self.max_messages_per_second_per_chat:
+                self.rate_limited_count += 1
+                return True
+            recent.append(now)
+            return False
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                with fake._lock:
+                    fake.request_count += 1
+                    request_number = fake.request_count
+                if not SEND_MESSAGE_PATH.match(self.path):
+                    self._send(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                    return
+                if fake.fail_every and request_number % fake.fail_every == 0:
+                    self._send(502, {"ok": False, "error_code": 502, "description": "Bad Gateway"})
+                    return
+                chat_id = str(payload.get('chat_id'))
+                if fake._over_limit(chat_id):
+                    self._send(429, {"ok": False, "error_code": 429,
+                                     "description": f"Too Many Requests: retry after {fake.retry_after}",
+                                     "parameters": {"retry_after": fake.retry_after}})
+                    return
+                with fake._lock:
+                    fake.messages.append((chat_id, payload.get('text', '')))
+                    message_id = len(fake.messages)
+                self._send(200, {"ok": True, "result": {"message_id": message_id, "chat": {"id": chat_id},
+                                                        "date": int(time.time()), "text": payload.get('text', '')}})
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
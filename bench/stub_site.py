@@ -0,0 +1,213 @@
+import datetime
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Faux 2ememain local pour les benchmarks : pages de résultats avec le même
+# balisage hz-* que le vrai site, latence réseau simulée.
+
+BRANDS = [
+    ('Volkswagen', ['Golf', 'Polo', 'Passat', 'Tiguan']),
+    ('Renault', ['Clio', 'Megane', 'Captur']),
+    ('Toyota', ['Yaris', 'Aygo', 'Auris', 'C-HR']),
+    ('Honda', ['Civic', 'Jazz', 'CR-V']),
+    ('Dacia', ['Sandero', 'Duster', 'Logan']),
+    ('Peugeot', ['208', '308', '2008']),
+]
+FUELS = ['Essence', 'Diesel', 'Hybride Électrique/Essence']
+TRANSMISSIONS = ['Manuelle', 'Automatique']
+BODIES = ['Berline', 'Break', 'SUV ou Tout-terrain', 'Hatchback']
+CITIES = ['Bruxelles', 'Liège', 'Namur', 'Charleroi', 'Mons', 'Wavre', 'Arlon']
+
+PAGE_PATTERN = re.compile(r'/p/(\d+)/')
+# Page d'une annonce : /v/autos/<marque>/m<id>-<slug>
+DETAIL_PATTERN = re.compile(r'^/v/.*/m(\d+)-')
+OPTIONS = ['Airco', 'GPS', 'Régulateur de vitesse', 'Capteurs de stationnement', 'Bluetooth', 'Jantes alliage',
+           'Sièges chauffants', 'Toit ouvrant', 'Caméra de recul', 'Attelage']
+
+
+def make_ad(ad_id, rng=None):
+    rng = rng or random.Random(ad_id)
+    brand, models = rng.choice(BRANDS)
+    model = rng.choice(models)
+    return {
+        'id': ad_id,
+        'title': f"{brand} {model} {rng.choice(['1.0', '1.2 TSI', '1.5 dCi', '1.6 TDI', '1.8 i-VTEC'])}",
+        'price': rng.randrange(1500, 25000, 50),
+        'mileage': rng.randrange(5000, 280000, 500),
+        'year': rng.randint(2005, 2023),
+        'fuel_type': rng.choice(FUELS),
+        'transmission': rng.choice(TRANSMISSIONS),
+        'body_type': rng.choice(BODIES),
+        'description': "Voiture en bon état, carnet d'entretien complet, contrôle technique ok. " * rng.randint(1, 3),
+        'slug': f"{brand.lower()}-{model.lower()}",
+        'city': rng.choice(CITIES),
+        'professional': rng.random() < 0.3,
+        'date': (datetime.datetime(2024, 5, 1) - datetime.timedelta(minutes=rng.randrange(0, 60 * 24 * 30))).isoformat() + 'Z',
+        'image_count': rng.randint(0, 24),
+        # Seulement sur la page de l'annonce (tirés en dernier : les champs ci-dessus ne changent pas)
+        'options': rng.sample(OPTIONS, rng.randint(0, len(OPTIONS))),
+        'owners': rng.randint(1, 4),
+        'service_book': rng.choice(['Oui', 'Non', 'Partiel']),
+        'history': rng.choice(["Distribution faite à 120.000 km, pneus neufs.", "Aucun accident, factures disponibles.",
+                               "Petit choc arrière, embrayage à prévoir.", "Importée d'Allemagne, premier propriétaire."]),
+    }
+
+
+def format_thousands(value):
+    return f"{value:,}".replace(',', '.')
+
+
+def render_card(ad):
+    return f"""
+<li class="hz-Listing hz-Listing--list-item-cars">
+  <a class="hz-Link hz-Link--block hz-Listing-coverLink" href="/v/autos/{ad['slug'].split('-')[0]}/m{ad['id']}-{ad['slug']}">
+    <div class="hz-Listing-item-wrapper">
+      <div class="hz-Listing-group">
+        <h3 class="hz-Listing-title">{ad['title']}</h3>
+        <p class="hz-Listing-description hz-text-paragraph">{ad['description']}</p>
+        <div class="hz-Listing-attributes">
+          <span class="hz-Attribute hz-Attribute--default"><i class="hz-Icon hz-Icon--textSecondary hz-SvgIcon hz-SvgIconCarConstructionYear"></i>{ad['year']}</span>
+          <span class="hz-Attribute hz-Attribute--default"><i class="hz-Icon hz-Icon--textSecondary hz-SvgIcon hz-SvgIconCarMileage"></i>{format_thousands(ad['mileage'])} km</span>
+          <span class="hz-Attribute hz-Attribute--default"><i class="hz-Icon hz-Icon--textSecondary hz-SvgIcon hz-SvgIconCarFuel"></i>{ad['fuel_type']}</span>
+          <span class="hz-Attribute hz-Attribute--default"><i class="hz-Icon hz-Icon--textSecondary hz-SvgIcon hz-SvgIconCarTransmission"></i>{ad['transmission']}</span>
+          <span class="hz-Attribute hz-Attribute--default"><i class="hz-Icon hz-Icon--textSecondary hz-SvgIcon hz-SvgIconCarBody"></i>{ad['body_type']}</span>
+        </div>
+      </div>
+      <div class="hz-Listing-group--price-date-feature">
+        <span class="hz-Text hz-Text--bodyLargeStrong hz-Title--title4">€ {format_thousands(ad['price'])},-</span>
+      </div>
+    </div>
+  </a>
+</li>"""
+
+
+def state_listing(ad):
+    # Same shape as the listings of the real page state (see scraper/embedded_state.py)
+    return {
+        'itemId': f"m{ad['id']}",
+        'title': ad['title'],
+        'description': ad['description'],
+        'priceInfo': {'priceCents': ad['price'] * 100, 'priceType': 'FIXED'},
+        'location': {'cityName': ad['city'], 'countryName': 'Belgique', 'countryAbbreviation': 'BE'},
+        'date': ad['date'],
+        'imageUrls': [f"//images.2ememain.be/api/v1/listing-be/images/{ad['id']}/{index}" for index in range(ad['image_count'])],
+        'sellerInformation': {'sellerId': ad['id'] % 100000, 'sellerName': 'Vendeur', 'showWebsiteUrl': ad['professional']},
+        'attributes': [
+            {'key': 'constructionYear', 'value': str(ad['year'])},
+            {'key': 'mileage', 'value': str(ad['mileage'])},
+            {'key': 'fuel', 'value': ad['fuel_type']},
+            {'key': 'transmission', 'value': ad['transmission']},
+            {'key': 'body', 'value': ad['body_type']},
+        ],
+        'vipUrl': f"/v/autos/{ad['slug'].split('-')[0]}/m{ad['id']}-{ad['slug']}",
+    }
+
+
+def render_state(ads):
+    state = {'props': {'pageProps': {'searchRequestAndResponse': {'listings': [state_listing(ad) for ad in ads]}}}}
+    return f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(state, ensure_ascii=False)}</script>'
+
+
+def render_results_page(ads, embed_state=True):
+    cards = ''.join(render_card(ad) for ad in ads)
+    state = render_state(ads) if embed_state else ''
+    return f"""<!DOCTYPE html>
+<html lang="fr">
+<head><meta charset="utf-8"><title>Autos | 2ememain</title></head>
+<body>
+<div id="__next">
+  <header class="hz-Header"><nav class="hz-Nav"><a href="/">2ememain</a></nav></header>
+  <main class="hz-Page-body">
+    <ul class="hz-Listings hz-Listings--list-view">{cards}
+    </ul>
+  </main>
+</div>
+{state}
+</body>
+</html>"""
+
+
+def render_detail_page(ad):
+    # Même état JSON embarqué que les pages de résultats, avec l'annonce complète (voir scraper/detail_page.py)
+    listing = state_listing(ad)
+    listing['description'] = f"{ad['description']}{ad['history']} Options : {', '.join(ad['options']) or 'aucune'}."
+    listing['attributes'] = listing['attributes'] + [
+        {'key': 'options', 'label': 'Options', 'value': ad['options']},
+        {'key': 'numberOfOwners', 'label': 'Nombre de propriétaires', 'value': str(ad['owners'])},
+        {'key': 'serviceBook', 'label': "Carnet d'entretien", 'value': ad['service_book']},
+    ]
+    state = {'props': {'pageProps': {'listing': listing}}}
+    return f"""<!DOCTYPE html>
+<html lang="fr">
+<head><meta charset="utf-8"><title>{ad['title']} | 2ememain</title></head>
+<body>
+<div id="__next"><main class="hz-Page-body"><h1>{ad['title']}</h1></main></div>
+<script id="__NEXT_DATA__" type="application/json">{json.dumps(state, ensure_ascii=False)}</script>
+</body>
+</html>"""
+
+
+class StubSite:
+    """Serveur HTTP local qui sert des pages de résultats synthétiques."""
+
+    def __init__(self, latency=0.2, cards_per_page=30, first_ad_id=2_100_000_000):
+        self.latency = latency
+        self.cards_per_page = cards_per_page
+        self.first_ad_id = first_ad_id
+        self.request_count = 0
+        self.detail_request_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def page_ads(self, page_num):
+        start = self.first_ad_id - (page_num - 1) * self.cards_per_page
+        return [make_ad(start - i) for i in range(self.cards_per_page)]
+
+    def handle(self, path, headers=None):
+        # Renvoie (status, headers, body) ; surchargé par les benchmarks qui simulent d'autres cas
+        detail = DETAIL_PATTERN.search(path)
+        if detail:
+            with self._lock:
+                self.detail_request_count += 1
+            body = render_detail_page(make_ad(int(detail.group(1)))).encode('utf-8')
+            return 200, {'Content-Type': 'text/html; charset=utf-8'}, body
+        match = PAGE_PATTERN.search(path)
+        page_num = int(match.group(1)) if match else 1
+        body = render_results_page(self.page_ads(page_num)).encode('utf-8')
+        return 200, {'Content-Type': 'text/html; charset=utf-8'}, body
+
+    def start(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with site._lock:
+                    site.request_count += 1
+                time.sleep(site.latency)
+                status, headers, body = site.handle(self.path, self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,235 @@
+import base64
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import re
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import httpx
+except ImportError:  # httpx arrive avec mistralai ; sans lui, seules les requêtes 'requests' sont enregistrées
+    httpx = None
+
+# Enregistrement et rejeu hors ligne des échanges HTTP d'un run : pages de 2ememain, appels
+# Mistral et envois Telegram. En enregistrement (--record DIR), chaque réponse est gardée telle
+# quelle dans DIR/interactions.jsonl.gz ; en rejeu (--replay DIR), aucune requête ne sort :
+# chaque requête reçoit la réponse enregistrée pour la même méthode, la même URL, les mêmes
+# en-têtes conditionnels et le même corps (dans l'ordre d'enregistrement si elle revient plusieurs fois).
+# Une requête sans correspondance exacte reprend une réponse enregistrée pour la même URL
+# (choisie par l'empreinte de son corps, donc toujours la même), sinon reçoit un 404.
+RECORD = 'record'
+REPLAY = 'replay'
+INTERACTIONS_FILE = 'interactions.jsonl.gz'
+
+# En-têtes de requête qui changent la réponse (validateurs du cache de pages, voir scraper/page_cache.py)
+KEY_HEADERS = ('If-None-Match', 'If-Modified-Since')
+# En-têtes de réponse non conservés : le corps est enregistré décompressé, et pas de cookies sur disque
+DROPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection', 'set-cookie'}
+# Le jeton du bot Telegram fait partie de l'URL : il n'est jamais écrit dans la cassette
+TELEGRAM_TOKEN = re.compile(r'/bot[^/]+/')
+
+
+def request_key(method, url, headers, body):
+    url = TELEGRAM_TOKEN.sub('/bot<jeton>/', url)
+    conditions = '|'.join(f"{name}={headers.get(name)}" for name in KEY_HEADERS if headers.get(name))
+    digest = hashlib.sha256(body or b'').hexdigest()[:16]
+    return f"{method.upper()} {url}", conditions, digest
+
+
+def _encode_body(content):
+    try:
+        return {'text': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(content).decode('ascii')}
+
+
+def _decode_body(interaction):
+    if 'text' in interaction:
+        return interaction['text'].encode('utf-8')
+    return base64.b64decode(interaction.get('base64', ''))
+
+
+class Cassette:
+    """Échanges HTTP enregistrés d'un ou plusieurs runs, partagés entre les threads du pipeline."""
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.interactions = []
+        self._by_key = {}
+        self._by_url = {}
+        self._played = {}
+        self._lock = threading.Lock()
+        self.stats = {'enregistrees': 0, 'rejouees': 0, 'approchees': 0, 'absentes': 0}
+        if mode == REPLAY:
+            self._load()
+
+    @property
+    def file_path(self):
+        return os.path.join(self.path, INTERACTIONS_FILE)
+
+    def _load(self):
+        if not os.path.exists(self.file_path):
+            raise FileNotFoundError(f"Aucune cassette dans {self.path} (enregistrer d'abord avec --record {self.path}).")
+        with gzip.open(self.file_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    self._index(json.loads(line))
+
+    def _index(self, interaction):
+        self.interactions.append(interaction)
+        key = (interaction['request'], interaction['conditions'], interaction['digest'])
+        self._by_key.setdefault(key, []).append(interaction)
+        self._by_url.setdefault(interaction['request'], []).append(interaction)
+
+    def add(self, method, url, request_headers, request_body, status, headers, content):
+        request, conditions, digest = request_key(method, url, request_headers, request_body)
+        interaction = {
+            'request': request,
+            'conditions': conditions,
+            'digest': digest,
+            'status': status,
+            'headers': {name: value for name, value in headers.items() if name.lower() not in DROPPED_HEADERS},
+            **_encode_body(content),
+        }
+        with self._lock:
+            self._index(interaction)
+            self.stats['enregistrees'] += 1
+
+    def find(self, method, url, request_headers, request_body):
+        # Renvoie (status, headers, content) ; 404 si l'URL n'a jamais été enregistrée
+        request, conditions, digest = request_key(method, url, request_headers, request_body)
+        key = (request, conditions, digest)
+        with self._lock:
+            recorded = self._by_key.get(key)
+            if recorded:
+                # Même requête plusieurs fois (page relue, message renvoyé) : réponses dans l'ordre, puis la dernière
+                played = self._played.get(key, 0)
+                self._played[key] = played + 1
+                interaction = recorded[min(played, len(recorded) - 1)]
+                self.stats['rejouees'] += 1
+            elif request in self._by_url:
+                # Prompt ou état local différent de l'enregistrement : une réponse de la même URL, de préférence un 200
+                candidates = [i for i in self._by_url[request] if i['status'] == 200] or self._by_url[request]
+                interaction = candidates[int(digest, 16) % len(candidates)]
+                self.stats['approchees'] += 1
+            else:
+                self.stats['absentes'] += 1
+                print(f"Cassette : aucune réponse enregistrée pour {request}.")
+                return 404, {'Content-Type': 'text/plain'}, b'Not recorded'
+        return interaction['status'], interaction['headers'], _decode_body(interaction)
+
+    def save(self):
+        if self.mode != RECORD:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.file_path + '.tmp'
+        with self._lock:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                for interaction in self.interactions:
+                    f.write(json.dumps(interaction, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.file_path)
+
+    def print_report(self):
+        stats = self.stats
+        if self.mode == RECORD:
+            print(f"Cassette : {stats['enregistrees']} échanges enregistrés dans {self.file_path}.")
+        else:
+            print(f"Cassette : {stats['rejouees']} réponses rejouées, {stats['approchees']} sans correspondance exacte "
+                  f"(même URL), {stats['absentes']} absentes.")
+
+
+class CassetteAdapter(HTTPAdapter):
+    """Adaptateur 'requests' : enregistre les réponses reçues, ou les rejoue sans toucher au réseau."""
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        body = request.body.encode('utf-8') if isinstance(request.body, str) else request.body
+        if self.cassette.mode == REPLAY:
+            status, headers, content = self.cassette.find(request.method, request.url, request.headers, body)
+            response = requests.Response()
+            response.status_code = status
+            response.reason = http.client.responses.get(status, '')
+            response.headers = CaseInsensitiveDict(headers)
+            response.encoding = get_encoding_from_headers(response.headers)
+            response._content = content
+            response.url = request.url
+            response.request = request
+            return response
+
+        response = super().send(request, **kwargs)
+        self.cassette.add(request.method, request.url, request.headers, body,
+                          response.status_code, response.headers, response.content)
+        return response
+
+
+def _httpx_transport(cassette):
+    # Transport httpx pour le client Mistral (même principe que CassetteAdapter)
+    class CassetteTransport(httpx.BaseTransport):
+        def __init__(self):
+            self._transport = httpx.HTTPTransport()
+
+        def handle_request(self, request):
+            body = request.read()
+            if cassette.mode == REPLAY:
+                status, headers, content = cassette.find(request.method, str(request.url), request.headers, body)
+                return httpx.Response(status, headers=headers, content=content, request=request)
+            response = self._transport.handle_request(request)
+            content = response.read()
+            response.close()
+            headers = {name: value for name, value in response.headers.items() if name.lower() not in DROPPED_HEADERS}
+            cassette.add(request.method, str(request.url), request.headers, body, response.status_code, headers, content)
+            return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+        def close(self):
+            self._transport.close()
+
+    return CassetteTransport()
+
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def install(path, mode):
+    # À appeler avant de créer les sessions HTTP et le client Mistral (voir main.py)
+    global _active
+    with _active_lock:
+        _active = Cassette(path, mode)
+        return _active
+
+
+def active():
+    return _active
+
+
+def replaying():
+    return _active is not None and _active.mode == REPLAY
+
+
+def mount(session, **adapter_kwargs):
+    # Branche la cassette active (s'il y en a une) sur une session 'requests' ; renvoie la session
+    if _active is not None:
+        adapter = CassetteAdapter(_active, **adapter_kwargs)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+    return session
+
+
+def httpx_client():
+    # Client httpx pour Mistral(client=...) ; None sans cassette active (client par défaut du SDK)
+    if _active is None:
+        return None
+    if httpx is None:
+        raise ImportError("httpx est nécessaire pour enregistrer ou rejouer les appels Mistral.")
+    return httpx.Client(transport=_httpx_transport(_active), follow_redirects=True)
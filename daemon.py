@@ -0,0 +1,121 @@
+import signal
+import threading
+import time
+
+# Mode démon : le bot reste en mémoire et interroge chaque URL de base à son propre rythme.
+# L'intervalle d'une URL suit le débit de nouvelles annonces qu'elle apporte : une requête
+# très active est relue souvent, une requête calme s'espace jusqu'à MAX_INTERVAL_SECONDS.
+MIN_INTERVAL_SECONDS = 120
+MAX_INTERVAL_SECONDS = 3600
+# Nombre de nouvelles annonces visé entre deux passages (la 1re page en affiche une trentaine)
+TARGET_NEW_ADS_PER_POLL = 5
+# Lissage exponentiel du débit observé (nouvelles annonces par seconde)
+RATE_SMOOTHING = 0.3
+# Sauvegarde de l'état (cache IA, index des prix, compaction de l'historique)
+CHECKPOINT_EVERY_SECONDS = 900
+
+
+class PollSchedule:
+    """Intervalle de passage adaptatif par URL de base, à partir de son débit de nouvelles annonces."""
+
+    def __init__(self, base_urls, min_interval=MIN_INTERVAL_SECONDS, max_interval=MAX_INTERVAL_SECONDS,
+                 target_new_ads=TARGET_NEW_ADS_PER_POLL, smoothing=RATE_SMOOTHING):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new_ads = target_new_ads
+        self.smoothing = smoothing
+        now = time.monotonic()
+        # Au démarrage, toutes les URLs sont dues immédiatement
+        self.queries = {
+            base_url: {'rate': None, 'interval': min_interval, 'last_poll': None, 'next_poll': now, 'polls': 0, 'new_ads': 0,
+                       'failures': 0}
+            for base_url in base_urls
+        }
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return [base_url for base_url, query in self.queries.items() if query['next_poll'] <= now]
+
+    def seconds_until_next(self, now=None):
+        now = time.monotonic() if now is None else now
+        return max(0.0, min(query['next_poll'] for query in self.queries.values()) - now)
+
+    def record(self, base_url, new_ads, now=None):
+        now = time.monotonic() if now is None else now
+        query = self.queries[base_url]
+        query['polls'] += 1
+        query['new_ads'] += new_ads
+        if query['last_poll'] is not None:
+            rate = new_ads / max(now - query['last_poll'], 1.0)
+            if query['rate'] is None:
+                query['rate'] = rate
+            else:
+                query['rate'] = self.smoothing * rate + (1 - self.smoothing) * query['rate']
+            if query['rate'] > 0:
+                interval = self.target_new_ads / query['rate']
+            else:
+                interval = query['interval'] * 2
+            query['interval'] = min(self.max_interval, max(self.min_interval, interval))
+        query['last_poll'] = now
+        query['next_poll'] = now + query['interval']
+
+    def record_failure(self, base_url, now=None):
+        # Cycle en échec : aucun débit observé, l'intervalle et le dernier passage réussi sont gardés,
+        # l'URL est retentée après l'intervalle minimal
+        now = time.monotonic() if now is None else now
+        query = self.queries[base_url]
+        query['failures'] += 1
+        query['next_poll'] = now + self.min_interval
+
+    def print_report(self):
+        print("--- Rythme de passage par URL de base ---")
+        for index, (base_url, query) in enumerate(self.queries.items(), start=1):
+            failures = f" ({query['failures']} en échec)" if query['failures'] else ""
+            print(f"  [{index}] toutes les {query['interval'] / 60:.0f} min, {query['new_ads']} nouvelles annonces "
+                  f"en {query['polls']} passages{failures} : {base_url}")
+
+
+def run_daemon(schedule, run_cycle, checkpoint, checkpoint_every=CHECKPOINT_EVERY_SECONDS):
+    # run_cycle(base_urls) -> {base_url: nombre de nouvelles annonces} ; checkpoint() sauvegarde l'état.
+    # SIGINT/SIGTERM : le cycle en cours se termine, l'état est sauvegardé, puis le démon s'arrête.
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        if not stop.is_set():
+            print(f"\nSignal {signum} reçu : arrêt après le cycle en cours...")
+        stop.set()
+
+    previous_handlers = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+    last_checkpoint = time.monotonic()
+    try:
+        while not stop.is_set():
+            due = schedule.due()
+            if due:
+                print(f"\nCycle : {len(due)}/{len(schedule.queries)} URLs de base à relire.")
+                try:
+                    new_ads_by_base_url = run_cycle(due)
+                except Exception as e:
+                    # Un cycle raté ne doit pas arrêter le démon ni compter comme un passage sans
+                    # nouvelle annonce (l'intervalle doublerait) : ces URLs sont retentées plus tard
+                    print(f"Erreur pendant le cycle : {e}")
+                    now = time.monotonic()
+                    for base_url in due:
+                        schedule.record_failure(base_url, now)
+                else:
+                    now = time.monotonic()
+                    for base_url in due:
+                        schedule.record(base_url, new_ads_by_base_url.get(base_url, 0), now)
+
+            if time.monotonic() - last_checkpoint >= checkpoint_every:
+                checkpoint()
+                schedule.print_report()
+                last_checkpoint = time.monotonic()
+
+            wait = min(schedule.seconds_until_next(), max(0.0, last_checkpoint + checkpoint_every - time.monotonic()))
+            stop.wait(wait)
+    finally:
+        checkpoint()
+        schedule.print_report()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        print("Démon arrêté, état sauvegardé.")
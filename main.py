@@ -1,43 +1,159 @@
-import os
+import argparse
 import json
-from dotenv import load_dotenv
+import queue
+import threading
 import time
-import random
 
-from ai.evaluate import evaluate_car_ad
-from notify.telegram_bot import send_telegram_message
-from scraper.scrape_2ememain import scrape_2ememain 
+from dotenv import load_dotenv
+
+import cassette
+from ai.evaluate import AdEvaluator
+from ai.cache import EvaluationCache
+from ai.prefilter import PreFilter
+from ai.price_index import PriceIndex
+from notify.telegram_bot import TelegramNotifier
+from scraper.crawler import crawl_all, page_url
+from scraper.detail_page import DetailEnricher
+from scraper.fetcher import fetch_page
+from scraper.page_cache import PageCache
+from scraper.scheduler import RequestScheduler
+from scraper.scrape_2ememain import parse_listings
+from storage import seen_ads as seen_ads_store
+from storage.seen_ads import PRICE_DROP, RELISTED, SEEN, extract_ad_id, format_price_history
+from search_plan import plan_searches
+from pipeline import CrossQueryDedup, DetailShortlist, LatencyTracker, PageStream, evaluate_stream
+from daemon import PollSchedule, run_daemon
+from metrics import get_default_metrics, profiled
+from work_queue import EVALUATION, NOTIFICATION, PAGE, WorkQueue
 
 # Charger les variables d'environnement depuis .env (pour les tests locaux)
 load_dotenv()
 
 # Chemin du fichier pour stocker les annonces déjà vues
 SEEN_ADS_FILE = 'data/annonces_vues.json'
+# Cache des verdicts IA, indexé par empreinte du contenu de l'annonce
+EVALUATION_CACHE_FILE = 'data/cache_evaluations.json'
+# Index des prix du marché local (percentiles par marque/modèle/année)
+PRICE_INDEX_FILE = 'data/index_prix.json'
+# Validateurs HTTP (ETag/Last-Modified) et empreinte des annonces de chaque page de résultats
+PAGE_CACHE_FILE = 'data/cache_pages.json'
+
+# Nombre d'URLs de base crawlées en parallèle (session partagée)
+MAX_CONCURRENT_REQUESTS = 4
+# Crawl incrémental : arrêt de la pagination dès qu'une page ne contient que des annonces déjà vues
+# (False : toutes les pages sont téléchargées)
+INCREMENTAL_CRAWL = True
+# Optionnel : s'arrêter aussi après N annonces déjà vues consécutives (None = page entière)
+STOP_AFTER_SEEN_RUN = None
+# Nombre d'appels simultanés à l'API Mistral (le débit est limité dans ai/evaluate.py)
+MAX_CONCURRENT_EVALUATIONS = 4
+# Seuils du pré-filtre (voir DEFAULT_THRESHOLDS dans ai/prefilter.py), ex: {'max_price': 3000}
+PREFILTER_THRESHOLDS = {}
+# Recherches déclaratives, en plus des URLs de base de main() (voir search_plan.py). Chaque entrée :
+# 'brands' (slugs des URLs, ex: 'volkswagen'), 'fuels' (clés de FUEL_IDS), et les bornes optionnelles
+# min_price/max_price (€), min_year/max_year, min_mileage/max_mileage (km). Exemple :
+# {'brands': ['dacia', 'toyota'], 'fuels': ['essence', 'hybride-electrique-essence'], 'min_year': 2015, 'max_mileage': 100001}
+SEARCHES = []
+# Rafale de bonnes affaires : regrouper les alertes en attente dans un seul message Telegram
+TELEGRAM_DIGEST = False
+# Lecture de la page des annonces présélectionnées (description complète, équipements, historique)
+# avant l'avis final de l'IA : une requête de plus par annonce présélectionnée, pas par annonce vue
+DETAIL_ENRICHMENT = False
+# Présélection : prix sous ce percentile du marché local, ou note d'au moins DETAIL_MIN_CARD_NOTE sur la carte seule
+DETAIL_MAX_MARKET_PERCENTILE = 25
+DETAIL_MIN_CARD_NOTE = 3
+# Mesures par étape (durées, compteurs), cumulées depuis le démarrage du processus et réécrites à
+# chaque sauvegarde de l'état (en mode --daemon : tous les cycles depuis le lancement)
+RUN_REPORT_FILE = 'data/rapport_execution.json'
+# Optionnel : les mêmes mesures au format texte Prometheus, ex: 'data/metriques.prom' (None = désactivé)
+PROMETHEUS_FILE = None
+# Profil écrit par --profile (extension .pstats pour cProfile, .html pour pyinstrument)
+PROFILE_FILE_PREFIX = 'data/profil'
+# Baisse de prix (en %) à partir de laquelle une annonce déjà vue repart à l'IA, avec son historique des prix
+# (comparée aux cartes des pages déjà téléchargées : aucune requête en plus)
+PRICE_DROP_ALERT_PERCENT = 10
+# Politesse envers 2ememain : requêtes par seconde au maximum (token bucket par hôte). 0.4 req/s reste proche
+# de l'ancienne pause de 1 à 3 s par page : le gain de temps vient du recouvrement téléchargement /
+# analyse / IA, pas d'un débit plus élevé vers le site
+PER_HOST_REQUESTS_PER_SECOND = 0.4
+# Rejeu hors ligne (--replay) : personne en face, les limites de débit ne servent qu'à ne pas fausser les mesures
+REPLAY_REQUESTS_PER_SECOND = 1000
+# Mode file partagée (--queue) : attente avant de redemander une tâche quand les autres processus
+# tiennent les dernières (leurs pages peuvent encore en créer)
+QUEUE_POLL_SECONDS = 0.5
 
 def load_seen_ads():
-    if os.path.exists(SEEN_ADS_FILE):
-        try:
-            with open(SEEN_ADS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"Attention: Le fichier {SEEN_ADS_FILE} est corrompu ou vide. Création d'une nouvelle liste.")
-            return []
-    return []
-
-def save_seen_ads(ads):
-    # Assurez-vous que le répertoire 'data/' existe
-    os.makedirs(os.path.dirname(SEEN_ADS_FILE), exist_ok=True)
-    with open(SEEN_ADS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(ads, f, indent=4, ensure_ascii=False)
-
-def main():
+    return seen_ads_store.load_seen_ads(SEEN_ADS_FILE)
+
+class BotState:
+    """État gardé en mémoire d'un cycle à l'autre : historique des annonces vues, index des prix,
+    cache et client Mistral, planificateur HTTP (la session keep-alive est partagée dans scraper/fetcher.py)."""
+
+    def __init__(self):
+        # Compteurs et durées de chaque étape (voir metrics.py)
+        self.metrics = get_default_metrics()
+        self.load_history()
+        with self.metrics.timer('load_seconds'):
+            # Une page de résultats inchangée depuis le dernier passage n'est ni analysée ni traitée
+            self.page_cache = PageCache.load(PAGE_CACHE_FILE)
+        if cassette.replaying():
+            self.evaluator = AdEvaluator(cache=self.evaluation_cache, requests_per_second=REPLAY_REQUESTS_PER_SECOND)
+            self.scheduler = RequestScheduler(REPLAY_REQUESTS_PER_SECOND, jitter=0)
+            self.notifier = TelegramNotifier(digest=TELEGRAM_DIGEST, messages_per_second=REPLAY_REQUESTS_PER_SECOND)
+        else:
+            self.evaluator = AdEvaluator(cache=self.evaluation_cache)
+            # Toutes les pauses entre requêtes HTTP (débit par hôte, jitter, backoff 429) passent par ce planificateur
+            self.scheduler = RequestScheduler(PER_HOST_REQUESTS_PER_SECOND)
+            # File d'envoi Telegram (session gardée ouverte, débit limité par chat, nouveaux essais)
+            self.notifier = TelegramNotifier(digest=TELEGRAM_DIGEST)
+        # Pages d'annonces déjà lues, par ID (mêmes limites de débit que les pages de résultats)
+        self.detail_enricher = DetailEnricher(scheduler=self.scheduler)
+
+    def load_history(self):
+        # Historique des annonces vues, index des prix et cache des verdicts ; rechargés en mode
+        # --queue avant le report de la file, un autre processus ayant pu les sauvegarder entre-temps
+        with self.metrics.timer('load_seconds'):
+            self.seen_ads = load_seen_ads()
+
+            # Index des prix : seules les annonces ajoutées depuis sa dernière sauvegarde sont intégrées
+            self.price_index = PriceIndex.load(PRICE_INDEX_FILE)
+            added = self.price_index.sync(self.seen_ads)
+            if added:
+                print(f"Index des prix mis à jour avec {added} annonces.")
+
+            # Références prix/km du pré-filtre : construites une fois, puis complétées à chaque cycle
+            self.prefilter = PreFilter(thresholds=PREFILTER_THRESHOLDS)
+            self.prefilter.sync(self.seen_ads)
+            # Un prix revu par track() ou un enregistrement remplacé par update() remplace l'ancien prix dans les deux
+            self.seen_ads.replace_listeners += [self.price_index.replaced, self.prefilter.replaced]
+
+            # Les annonces republiées à l'identique reprennent le verdict en cache, sans appel à l'API
+            self.evaluation_cache = EvaluationCache.load(EVALUATION_CACHE_FILE)
+
+    def checkpoint(self):
+        # L'historique est déjà écrit annonce par annonce dans le journal : on le compacte si besoin
+        # (il est rouvert au prochain ajout), puis on sauvegarde le cache IA et l'index des prix.
+        with self.metrics.timer('save_seconds'):
+            self.seen_ads.close()
+            self.evaluation_cache.save()
+            self.page_cache.save()
+            self.price_index.sync(self.seen_ads)
+            self.price_index.save()
+        self.metrics.write_json(RUN_REPORT_FILE)
+        if PROMETHEUS_FILE:
+            self.metrics.write_prometheus(PROMETHEUS_FILE)
+
+
+def main(daemon=False, queue_path=None):
     print("Démarrage du bot de détection de bonnes affaires automobiles...")
-    seen_ads = load_seen_ads()
-    new_ads_count = 0
+    state = BotState()
 
     # --- LISTE DES URLS DE BASE À SCRAPER ---
     # Pour chaque URL dans cette liste, le bot tentera de scraper les 10 premières pages.
     # Assurez-vous que ces URLs sont les URLs de la *première page* de votre recherche.
+    # Les filtres après le # ne sont pas envoyés au site : ils sont appliqués localement, et les
+    # URLs qui ne diffèrent que par eux ne sont téléchargées qu'une fois (voir search_plan.py).
+    # Un chemin différent (marque, /f/essence/473/) reste une requête à part, avec toutes ses pages.
     # Exemple: "https://www.2ememain.be/l/autos/honda/f/civic/811/" pour la Civic,
     # ou "https://www.2ememain.be/l/autos/" pour toutes les voitures.
 
@@ -151,143 +267,452 @@ def main():
 
     ]
 
-    # Nombre de pages à scraper pour chaque URL de base
+    # Nombre de pages à scraper pour chaque URL de base (maximum en mode incrémental)
     num_pages_per_base_url = 5
 
-    all_specific_page_urls = []
-
-    # Générer toutes les URLs de pages spécifiques à partir des URLs de base
-    print(f"Génération des URLs de pages spécifiques (max {num_pages_per_base_url} pages par base URL)...")
-    for base_url in base_urls_to_monitor:
-        # Extraire le hash suffixe si présent dans l'URL de base pour le réappliquer à toutes les pages
-        url_parts = base_url.split('#', 1)
-        clean_base_url = url_parts[0] # URL sans le hash
-        hash_suffix = '#' + url_parts[1] if len(url_parts) > 1 else ''
-
-        for page_num in range(1, num_pages_per_base_url + 1):
-            if page_num == 1:
-                # La première page est l'URL de base + le hash
-                full_page_url = clean_base_url + hash_suffix
-            else:
-                # Les pages suivantes utilisent le format /p/X/
-                # Il faut s'assurer que l'URL ne se termine pas déjà par '/' avant d'ajouter 'p/X/'
-                # et que le hash est ajouté à la fin.
-                effective_base = clean_base_url
-                if not effective_base.endswith('/'):
-                    effective_base += '/'
-                
-                full_page_url = f"{effective_base}p/{page_num}/{hash_suffix}"
-            
-            all_specific_page_urls.append(full_page_url)
-    
-    print(f"Total de {len(all_specific_page_urls)} URLs de pages générées à scraper.")
-    # --- FIN DE LA GÉNÉRATION DES URLS ---
-
-    all_raw_listings = []
-
-    print("\nDémarrage du scraping des annonces sur 2ememain.be...")
-
-    for url_to_scrape in all_specific_page_urls:
-        print(f"Scraping de la page : {url_to_scrape}")
-        current_page_listings = scrape_2ememain(url_to_scrape)
-        all_raw_listings.extend(current_page_listings)
-        # Pause entre le scraping de différentes URLs (pages)
-        time.sleep(random.uniform(1, 3)) 
-    
-    print(f"\nTrouvé un total de {len(all_raw_listings)} annonces brutes sur toutes les pages consultées.")
-
-    for listing in all_raw_listings:
-        ad_url = listing.get('url')
-        if not ad_url:
-            print(f"Ignorons l'annonce sans URL : {listing.get('title', 'N/A')}")
-            continue
-        
-        seen_urls_list = [ad.get('url') for ad in seen_ads if ad.get('url')]
-        if ad_url in seen_urls_list:
-            print(f"Ignorons l'annonce déjà vue : {listing.get('title', 'N/A')}")
-            continue
+    # Recherches regroupées en un minimum de requêtes larges, filtres plus fins appliqués sur les cartes
+    plan = plan_searches(base_urls_to_monitor, SEARCHES)
+    plan.print_report(num_pages_per_base_url)
 
-        new_ads_count += 1
-        print(f"Traitement de la nouvelle annonce : {listing.get('title', 'N/A')} à {ad_url}")
-
-        print("\n--- Informations extraites de l'annonce ---")
-        print(f"  Titre: {listing.get('title', 'N/A')}")
-        print(f"  URL: {listing.get('url', 'N/A')}")
-        print(f"  Prix: {listing.get('price', 'N/A')}")
-        print(f"  Kilométrage: {listing.get('mileage', 'N/A')} km")
-        print(f"  Année: {listing.get('year', 'N/A')}")
-        print(f"  Carburant: {listing.get('fuel_type', 'N/A')}")
-        print(f"  Transmission: {listing.get('transmission', 'N/A')}")
-        print(f"  Carrosserie: {listing.get('body_type', 'N/A')}")
-        print(f"  Marque: {listing.get('brand', 'N/A')}")
-        print(f"  Modèle: {listing.get('model', 'N/A')}")
-        print(f"  Description: {listing.get('description', 'N/A')[:200]}...")  
-        print("----------------------------------------\n")
-
-        title = listing.get('title', 'N/A')
-        description = listing.get('description', 'N/A')
-        price = listing.get('price', 'N/A')
-        mileage = listing.get('mileage', 'N/A')
-        year = listing.get('year', 'N/A')
-        brand = listing.get('brand', 'N/A')
-        model = listing.get('model', 'N/A')
-        city = listing.get('city', 'N/A') 
-
-        fuel_type = listing.get('fuel_type', 'N/A')
-        transmission = listing.get('transmission', 'N/A')
-        body_type = listing.get('body_type', 'N/A')
-
-        print(f"Analyse de l'annonce avec l'IA : {title}")
-        ai_result = evaluate_car_ad(
-            title,
-            description,
-            price,
-            mileage,
-            year,
-            model,
-            brand,
-            fuel_type=fuel_type,
-            transmission=transmission,
-            body_type=body_type
-        )
-        
-        note = ai_result.get('note', 0)
+    if queue_path:
+        # Plusieurs processus sur la même file : pages et évaluations réparties (voir work_queue.py)
+        work_queue = WorkQueue(queue_path)
         try:
-            note = int(note)
-        except (ValueError, TypeError):
-            print(f"Avertissement: Impossible de convertir la note '{note}' en entier. Utilisation de 0 par défaut.")
-            note = 0
-        
-        comment = ai_result.get('commentaire', 'Pas de commentaire IA.')
+            run_queue_worker(state, work_queue, plan, num_pages_per_base_url)
+        finally:
+            work_queue.close()
+        return
+
+    if not daemon:
+        run_cycle(state, plan.base_urls, num_pages_per_base_url, plan)
+        state.checkpoint()
+        return
+
+    # Mode démon : chaque URL de base est relue à son propre rythme (voir daemon.py)
+    print(f"Mode démon : {len(plan.base_urls)} URLs de base, arrêt propre par Ctrl+C ou SIGTERM.")
+    run_daemon(
+        PollSchedule(plan.base_urls),
+        lambda base_urls: run_cycle(state, base_urls, num_pages_per_base_url, plan),
+        state.checkpoint
+    )
+
+
+def run_cycle(state, base_urls, num_pages_per_base_url, plan=None):
+    # Un passage sur les URLs de base données ; renvoie le nombre de nouvelles annonces par URL de base.
+    # plan (search_plan.SearchPlan) : les annonces hors des recherches demandées sont seulement marquées vues
+    cycle_start = time.perf_counter()
+    metrics = state.metrics
+    # En mode --daemon, le registre cumule tous les cycles : le rapport affiché ne porte que sur celui-ci
+    metrics_at_start = metrics.snapshot()
+    seen_ads = state.seen_ads
+    price_index = state.price_index
+    evaluation_cache = state.evaluation_cache
+    evaluator = state.evaluator
+    new_ads_count = 0
+    new_ads_by_base_url = dict.fromkeys(base_urls, 0)
+
+    # Mode démon : intégrer à l'index des prix les annonces vues aux cycles précédents
+    price_index.sync(seen_ads)
+    # Pages d'un cycle précédent en échec : leurs annonces n'ont peut-être pas été traitées, à relire
+    state.page_cache.discard()
+
+    # Ajoutées pendant ce cycle : le crawl incrémental ne s'arrête que sur les annonces des cycles précédents
+    added_this_run = set()
+
+    def seen_before(url):
+        return url in seen_ads and extract_ad_id(url) not in added_this_run
+
+    def is_seen(url):
+        return INCREMENTAL_CRAWL and seen_before(url)
+
+    def mark_seen(listing):
+        if listing.get('url') in seen_ads:
+            # Déjà vue, réévaluée après une baisse de prix : son enregistrement est remplacé
+            seen_ads.update(listing)
+            return
+        added_this_run.add(extract_ad_id(listing.get('url')))
+        # Ajout en fin de journal (data/annonces_vues.jsonl), pas de réécriture complète
+        seen_ads.add(listing)
+
+    latency = LatencyTracker()
+
+    def notification_delivered(listing):
+        delay = latency.reached(listing, 'notification Telegram')
+        # Pas de délai connu pour une annonce qui ne vient pas d'une page de ce cycle
+        since = f" ({delay:.1f} s après le téléchargement de la page)" if delay is not None else ""
+        print(f"Notification envoyée pour {listing.get('title', 'N/A')}{since} !")
+
+    def crawl(on_page):
+        def page_parsed(base_url, listings):
+            latency.page_fetched(listings)
+            new_ads_by_base_url[base_url] += sum(1 for listing in listings if not seen_before(listing.get('url')))
+            on_page(base_url, listings)
+
+        # Les résultats sont triés du plus récent au plus ancien : les pages d'une URL de base sont
+        # téléchargées une à une, et on s'arrête dès qu'une page ne contient plus que des annonces déjà vues.
+        _, stats = crawl_all(
+            base_urls,
+            is_seen,
+            num_pages_per_base_url,
+            stop_after_seen_run=STOP_AFTER_SEEN_RUN,
+            max_workers=MAX_CONCURRENT_REQUESTS,
+            scheduler=state.scheduler,
+            on_page=page_parsed,
+            # Hors crawl incrémental, toutes les pages sont relues et analysées
+            page_cache=state.page_cache if INCREMENTAL_CRAWL else None
+        )
+        return stats
 
-        print(f"Note IA : {note}, Commentaire : {comment}")
+    print("\nDémarrage du scraping des annonces sur 2ememain.be...")
+    print(f"Crawl de {len(base_urls)} URLs de base (max {num_pages_per_base_url} pages chacune), "
+          f"chaque page est traitée dès qu'elle est analysée...")
+
+    # Pipeline en flux (voir pipeline.py) : crawl -> doublons -> déjà vues -> pré-filtre -> IA -> Telegram.
+    # Une annonce part à l'IA dès que sa page est analysée, sans attendre la fin du crawl.
+    # Arrêt commun au crawl et aux évaluations si la boucle ci-dessous s'interrompt sur une exception
+    stop = threading.Event()
+    pages = PageStream(crawl, stop=stop)
+    # Les URLs de base se recoupent : chaque annonce n'est évaluée qu'une fois, quelle que soit la requête
+    cross_query_dedup = CrossQueryDedup()
+    # Pré-filtre local : seules les annonces plausibles comme bonnes affaires partent à l'IA
+    # (références prix/km complétées avec les seules annonces ajoutées depuis le cycle précédent)
+    prefilter = state.prefilter
+    prefilter.sync(seen_ads)
+    prefilter.reset_report()
+    evaluate, detail_shortlist = candidate_evaluator(state)
+
+    def new_candidates():
+        nonlocal new_ads_count
+        for listing in cross_query_dedup.stream(pages):
+            ad_url = listing.get('url')
+            if not ad_url:
+                print(f"Ignorons l'annonce sans URL : {listing.get('title', 'N/A')}")
+                continue
+
+            # Comparée à ce qui est connu en O(1) : prix et kilométrage de la carte, sans requête
+            status = seen_ads.track(listing, PRICE_DROP_ALERT_PERCENT)
+            if status == SEEN:
+                print(f"Ignorons l'annonce déjà vue : {listing.get('title', 'N/A')}")
+                metrics.count('seen_skipped')
+                continue
+            if plan is not None and not plan.wanted(listing):
+                # Page d'une requête élargie par le planificateur : marquée vue pour que le crawl
+                # incrémental s'arrête dessus, et gardée dans l'historique pour l'index des prix
+                metrics.count('search_filtered')
+                mark_seen(listing)
+                continue
+            if status in (PRICE_DROP, RELISTED):
+                report_price_change(listing, metrics)
+
+            new_ads_count += 1
+            print(f"Traitement de la nouvelle annonce : {listing.get('title', 'N/A')} à {ad_url}")
+
+            print("\n--- Informations extraites de l'annonce ---")
+            print(f"  Titre: {listing.get('title', 'N/A')}")
+            print(f"  URL: {listing.get('url', 'N/A')}")
+            print(f"  Prix: {listing.get('price', 'N/A')}")
+            print(f"  Kilométrage: {listing.get('mileage', 'N/A')} km")
+            print(f"  Année: {listing.get('year', 'N/A')}")
+            print(f"  Carburant: {listing.get('fuel_type', 'N/A')}")
+            print(f"  Transmission: {listing.get('transmission', 'N/A')}")
+            print(f"  Carrosserie: {listing.get('body_type', 'N/A')}")
+            print(f"  Marque: {listing.get('brand', 'N/A')}")
+            print(f"  Modèle: {listing.get('model', 'N/A')}")
+            print(f"  Ville: {listing.get('city', 'N/A')} | Vendeur: {listing.get('seller_type', 'N/A')} | "
+                  f"Publiée le: {listing.get('date_posted', 'N/A')} | Photos: {listing.get('image_count', 'N/A')}")
+            print(f"  Description: {listing.get('description', 'N/A')[:200]}...")  
+            print("----------------------------------------\n")
+
+            if prefilter_rejects(listing, price_index, prefilter, metrics):
+                mark_seen(listing)
+                continue
+            yield listing
+
+    # Évaluation IA concurrente sous limite de débit (voir ai/evaluate.py)
+    for listing, ai_result in evaluate_stream(new_candidates(), evaluate, max_workers=MAX_CONCURRENT_EVALUATIONS,
+                                              stop=stop):
+        latency.reached(listing, 'verdict IA')
+        note, comment = read_verdict(ai_result)
+        print(f"Note IA pour {listing.get('title', 'N/A')} : {note}, Commentaire : {comment}")
 
         listing['ai_note'] = note
         listing['ai_comment'] = comment
 
-        time.sleep(2) # Pause après chaque appel à l'IA
-
         if note >= 4:
-            message = f"""
-            <b>🚘 Nouvelle affaire notée {note}/5 !</b>
-            <b>{title}</b>
-            Marque: {brand} | Modèle: {model}
-            Prix: {listing.get('price', 'N/A')} | Km: {listing.get('mileage', 'N/A')} | Année: {listing.get('year', 'N/A')}
-            Carburant: {fuel_type} | Transmission: {transmission} | Carrosserie: {body_type}
-            ➤ Voir l'annonce : <a href="{ad_url}">Lien</a>
-            IA : “{comment}”
-            """
-            send_telegram_message(message)
-            print("Notification envoyée !")
-
-        seen_ads.append(listing)
-        save_seen_ads(seen_ads) 
+            # Envoi en arrière-plan : l'évaluation des annonces suivantes n'attend pas Telegram
+            state.notifier.notify(alert_message(listing), on_delivered=lambda listing=listing: notification_delivered(listing))
+
+        mark_seen(listing)
+
+    # Toutes les alertes de ce cycle doivent être parties avant les rapports et la sauvegarde
+    state.notifier.flush()
+    # Annonces des pages téléchargées toutes traitées : une page inchangée pourra être sautée
+    state.page_cache.commit()
+    crawl_stats = pages.stats
+    raw_count = sum(stats['annonces'] for stats in cross_query_dedup.stats.values())
+    print(f"\nTrouvé un total de {raw_count} annonces brutes sur toutes les pages consultées.")
+    print(f"Pages téléchargées : {crawl_stats['pages_fetched']}/{crawl_stats['pages_planned']} "
+          f"({crawl_stats['requests_saved']} requêtes économisées"
+          + (f", {crawl_stats['pages_failed']} en échec ou abandonnées" if crawl_stats['pages_failed'] else "") + ").")
+    if new_ads_count:
+        prefilter.print_report()
+
+    cache_stats = evaluation_cache.stats()
+    if cache_stats['hits'] or cache_stats['misses']:
+        print(f"Cache des verdicts IA : {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+              f"{cache_stats['evictions']} évictions ({cache_stats['entrees']} entrées).")
+    if detail_shortlist:
+        detail_shortlist.print_report()
+    latency.print_report()
+    state.notifier.print_report()
+    state.page_cache.print_report()
+    cross_query_dedup.print_report()
+    metrics.observe('cycle_seconds', time.perf_counter() - cycle_start)
+    metrics.print_report(since=metrics_at_start)
 
     if new_ads_count == 0:
         print("Aucune nouvelle annonce à traiter.")
     else:
         print(f"Terminé le traitement de {new_ads_count} nouvelles annonces.")
+    return new_ads_by_base_url
+
+
+def candidate_evaluator(state):
+    # Évaluation d'une annonce candidate : renvoie (evaluate, DetailShortlist ou None). Optionnel :
+    # page de l'annonce lue pour les seules annonces présélectionnées, puis réévaluation
+    if not DETAIL_ENRICHMENT:
+        return state.evaluator.evaluate, None
+    detail_shortlist = DetailShortlist(state.detail_enricher, state.evaluator.evaluate,
+                                       DETAIL_MAX_MARKET_PERCENTILE, DETAIL_MIN_CARD_NOTE)
+    return detail_shortlist.evaluate, detail_shortlist
+
+
+def report_price_change(listing, metrics):
+    # Annonce déjà vue dont le prix a baissé, ou republiée (champs ajoutés par SeenAdsStore.track ou la file)
+    if listing.get('relisted_from'):
+        print(f"Annonce republiée : {listing.get('title', 'N/A')}, déjà vue à {listing['relisted_from']} "
+              f"({format_price_history(listing['price_history'])})")
+        metrics.count('relists')
+    elif listing.get('price_drop_percent') is not None:
+        print(f"Baisse de prix de {listing['price_drop_percent']} % sur l'annonce déjà vue {listing.get('title', 'N/A')} : "
+              f"{format_price_history(listing['price_history'])}")
+        metrics.count('price_drops')
+
+
+def prefilter_rejects(listing, price_index, prefilter, metrics):
+    # Percentile du prix sur le marché local, utilisé par le pré-filtre et le prompt ; True si
+    # l'annonce est écartée sans appel IA (raison gardée dans listing['prefilter'])
+    price_index.annotate(listing)
+    escalate, reason = prefilter.check(listing)
+    if escalate:
+        return False
+    print(f"Pré-filtre : {listing.get('title', 'N/A')} écartée ({reason}).")
+    listing['prefilter'] = reason
+    metrics.count('prefilter_skipped')
+    return True
+
+
+def read_verdict(ai_result):
+    note = ai_result.get('note', 0)
+    try:
+        note = int(note)
+    except (ValueError, TypeError):
+        print(f"Avertissement: Impossible de convertir la note '{note}' en entier. Utilisation de 0 par défaut.")
+        note = 0
+    return note, ai_result.get('commentaire', 'Pas de commentaire IA.')
+
+
+def alert_message(listing):
+    # Annonce déjà vue dont le prix a baissé, ou republiée : historique des prix dans l'alerte
+    price_change = ""
+    if listing.get('relisted_from'):
+        price_change = f"♻️ Republiée, prix : {format_price_history(listing.get('price_history'))}"
+    elif listing.get('price_history'):
+        price_change = f"📉 Baisse de {listing.get('price_drop_percent')} % : {format_price_history(listing['price_history'])}"
+
+    return f"""
+    <b>🚘 Nouvelle affaire notée {listing['ai_note']}/5 !</b>
+    <b>{listing.get('title', 'N/A')}</b>
+    Marque: {listing.get('brand', 'N/A')} | Modèle: {listing.get('model', 'N/A')}
+    Prix: {listing.get('price', 'N/A')} | Km: {listing.get('mileage', 'N/A')} | Année: {listing.get('year', 'N/A')}
+    {price_change}
+    Carburant: {listing.get('fuel_type', 'N/A')} | Transmission: {listing.get('transmission', 'N/A')} | Carrosserie: {listing.get('body_type', 'N/A')}
+    ➤ Voir l'annonce : <a href="{listing.get('url')}">Lien</a>
+    IA : “{listing['ai_comment']}”
+    """
+
+
+def run_queue_worker(state, work_queue, plan, num_pages_per_base_url):
+    # Un processus parmi d'autres sur la même file SQLite : prend une tâche à la fois (page de
+    # résultats, évaluation ou alerte), jusqu'à ce que le cycle n'ait plus de tâche nulle part.
+    # Les annonces passent par les mêmes étapes que dans run_cycle (plan de recherches, baisses de
+    # prix et republications, pré-filtre, page de l'annonce, IA, Telegram), mais l'historique
+    # partagé pendant le cycle est celui de la file. Le dernier processus à finir le reporte dans
+    # data/ (historique, cache des verdicts, index des prix) ; les autres n'écrivent pas data/.
+    # Le cache des pages n'est pas utilisé : une page sautée par un processus serait perdue pour les autres.
+    metrics = state.metrics
+    cycle, started = work_queue.join_or_start_cycle(
+        plan.base_urls, ((extract_ad_id(ad.get('url')), ad.get('price')) for ad in state.seen_ads if ad.get('url')))
+    print(f"File partagée {work_queue.path} : cycle {cycle} {'démarré' if started else 'rejoint'} "
+          f"par le processus {work_queue.owner}.")
+    price_index = state.price_index
+    prefilter = state.prefilter
+    prefilter.sync(state.seen_ads)
+    prefilter.reset_report()
+    evaluate, detail_shortlist = candidate_evaluator(state)
+    # Issues des envois Telegram, rapportées par le thread du notifier et traitées par ce thread-ci
+    # (la connexion SQLite n'est pas partagée entre threads)
+    notification_outcomes = queue.Queue()
+
+    def process_page(task):
+        url = page_url(task.payload['base_url'], task.payload['page_num'])
+        listings = parse_listings(fetch_page(url, scheduler=state.scheduler))
+        for listing in listings:
+            if listing.get('url') and listing['url'] not in state.seen_ads:
+                # Republication d'une voiture déjà vue (une annonce inconnue n'est que comparée, rien n'est écrit)
+                state.seen_ads.track(listing, PRICE_DROP_ALERT_PERCENT)
+        # Hors des recherches demandées : vues (le crawl incrémental s'arrête dessus) mais pas évaluées
+        result = work_queue.complete_page(task, listings, num_pages_per_base_url, wanted=plan.wanted,
+                                          min_drop_percent=PRICE_DROP_ALERT_PERCENT)
+        if result is not None:
+            metrics.count('search_filtered', result[1])
+        return result
+
+    def process_evaluation(task):
+        listing = task.payload
+        if work_queue.already_scored(listing):
+            # Tâche reprise après expiration d'un bail : l'autre processus a fini entre-temps
+            return work_queue.complete(task)
+        report_price_change(listing, metrics)
+        if prefilter_rejects(listing, price_index, prefilter, metrics):
+            return work_queue.complete(task, listing)
+
+        note, comment = read_verdict(evaluate(listing))
+        listing['ai_note'] = note
+        listing['ai_comment'] = comment
+        print(f"Note IA pour {listing.get('title', 'N/A')} : {note}, Commentaire : {comment}")
+        return work_queue.complete_evaluation(task, listing, note, comment, notify=note >= 4)
+
+    def process_notification(task):
+        listing = task.payload
+        if not state.notifier.configured:
+            # Comme run_cycle : avertissement affiché, rien à envoyer
+            state.notifier.notify(alert_message(listing))
+            return work_queue.complete(task)
+        reserved = work_queue.reserve_notification(task)
+        if not reserved:
+            # None : bail perdu ; False : déjà réservée par un essai précédent, jamais deux alertes
+            return reserved
+        # Tâche terminée (ou remise en file) quand Telegram a répondu, voir settle_notifications
+        state.notifier.notify(alert_message(listing),
+                              on_delivered=lambda: notification_outcomes.put((task, True)),
+                              on_failed=lambda: notification_outcomes.put((task, False)))
+        return True
+
+    def settle_notifications():
+        while True:
+            try:
+                task, delivered = notification_outcomes.get_nowait()
+            except queue.Empty:
+                return
+            if delivered:
+                print(f"Notification envoyée pour {task.payload.get('title', 'N/A')} !")
+                work_queue.complete(task)
+            elif work_queue.cancel_notification(task, "envoi Telegram refusé") is not None:
+                print(f"Notification refusée pour {task.payload.get('title', 'N/A')} : alerte remise en file.")
+
+    handlers = {PAGE: process_page, EVALUATION: process_evaluation, NOTIFICATION: process_notification}
+    while True:
+        settle_notifications()
+        task = work_queue.claim()
+        if task is None:
+            if not work_queue.active_tasks():
+                break
+            # Tâches restantes tenues par d'autres processus, ou alertes de celui-ci en cours d'envoi
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+        if task.reclaimed:
+            metrics.count('queue_reclaimed')
+        try:
+            if handlers[task.kind](task) is None:
+                print(f"Bail perdu sur la tâche {task.id} ({task.kind}) : reprise par un autre processus.")
+                metrics.count('queue_lost_leases')
+            else:
+                metrics.count('queue_tasks')
+        except Exception as e:
+            print(f"Tâche {task.id} ({task.kind}) en échec (essai {task.attempt}) : {e}")
+            work_queue.release(task, e)
+
+    state.notifier.flush()
+    settle_notifications()
+    if detail_shortlist:
+        detail_shortlist.print_report()
+    state.notifier.print_report()
+    work_queue.print_report()
+    if work_queue.claim_merge():
+        merge_queue_history(state, work_queue)
+    metrics.print_report()
+
+
+def merge_queue_history(state, work_queue):
+    # Report de la file dans data/, par un seul processus à la fin d'un cycle : les runs suivants
+    # (normaux, --daemon ou --queue) ne réévaluent ni ne renotifient ces annonces
+    state.load_history()
+    state.evaluator.cache = state.evaluation_cache
+    seen_ads = state.seen_ads
+    rows = work_queue.merge_rows()
+    for _, raw_listing in rows:
+        listing = json.loads(raw_listing)
+        if listing.get('url') in seen_ads:
+            # Déjà dans l'historique : prix et historique des prix mis à jour comme par run_cycle
+            tracked = dict(listing)
+            seen_ads.track(tracked, PRICE_DROP_ALERT_PERCENT)
+            if 'ai_note' in listing or 'prefilter' in listing:
+                # Réévaluée après une baisse de prix : son enregistrement est remplacé
+                for key in ('first_seen', 'price_history'):
+                    if key in tracked:
+                        listing[key] = tracked[key]
+                seen_ads.update(listing)
+        else:
+            seen_ads.add(listing)
+        if listing.get('ai_note'):
+            # Une republication à l'identique reprendra ce verdict sans appel IA
+            state.evaluation_cache.put(listing, {'note': listing['ai_note'], 'commentaire': listing.get('ai_comment')})
+    state.checkpoint()
+    work_queue.mark_merged(rows)
+    print(f"File reportée dans {SEEN_ADS_FILE} : {len(rows)} annonces nouvelles ou modifiées.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Détection de bonnes affaires automobiles sur 2ememain.be")
+    parser.add_argument('--daemon', action='store_true',
+                        help="rester en mémoire et relire chaque URL de base à intervalle adaptatif")
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=['cprofile', 'pyinstrument'],
+                        help=f"profiler le run (cProfile par défaut) ; profil écrit dans {PROFILE_FILE_PREFIX}.*")
+    recording_group = parser.add_mutually_exclusive_group()
+    recording_group.add_argument('--record', metavar='DIR',
+                                 help="enregistrer les échanges HTTP du run (2ememain, Mistral, Telegram) dans DIR")
+    recording_group.add_argument('--replay', metavar='DIR',
+                                 help="rejouer hors ligne un run enregistré avec --record DIR")
+    parser.add_argument('--queue', metavar='DB',
+                        help="travailler avec d'autres processus sur la file SQLite DB (pages et évaluations "
+                             "réparties, chaque annonce notée et notifiée une seule fois)")
+    args = parser.parse_args()
+    if args.queue and args.daemon:
+        parser.error("--queue et --daemon ne se combinent pas : relancer les processus --queue à chaque cycle.")
+    # Avant BotState : les sessions HTTP et le client Mistral passent par la cassette (voir cassette.py)
+    recording = None
+    if args.record:
+        recording = cassette.install(args.record, cassette.RECORD)
+    elif args.replay:
+        recording = cassette.install(args.replay, cassette.REPLAY)
+    try:
+        if args.profile:
+            with profiled(args.profile, PROFILE_FILE_PREFIX):
+                main(daemon=args.daemon, queue_path=args.queue)
+        else:
+            main(daemon=args.daemon, queue_path=args.queue)
+    finally:
+        if recording:
+            recording.save()
+            recording.print_report()
\ No newline at end of file
@@ -0,0 +1,293 @@
+import bisect
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# Mesures d'un run, par étape : compteurs (pages, octets, annonces, appels IA, jetons...)
+# et histogrammes de durées (réseau, attente du limiteur, parsing, IA, Telegram, sauvegarde).
+# Les modules instrumentés écrivent dans le registre partagé (get_default_metrics()) ;
+# main.py en tire un rapport JSON, et optionnellement un fichier texte au format Prometheus.
+
+# Bornes des histogrammes, en secondes (de 1 ms à 5 min)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Libellés des mesures, pour le rapport affiché et les lignes # HELP de Prometheus
+DESCRIPTIONS = {
+    'pages_fetched': "Pages téléchargées (résultats et annonces)",
+    'page_bytes': "Octets reçus pour ces pages",
+    'pages_not_modified': "Pages inchangées (304 ou mêmes annonces)",
+    'http_request_seconds': "Durée d'une requête HTTP vers le site",
+    'scheduler_wait_seconds': "Attente imposée par le limiteur de débit par hôte",
+    'parse_seconds': "Analyse d'une page de résultats",
+    'cards_parsed': "Annonces lues sur les pages de résultats",
+    'duplicates_skipped': "Annonces déjà renvoyées par une autre requête du run",
+    'seen_skipped': "Annonces déjà vues lors d'un run précédent",
+    'search_filtered': "Annonces hors des recherches demandées (filtres appliqués localement)",
+    'price_drops': "Annonces déjà vues reparties à l'IA après une baisse de prix",
+    'relists': "Annonces republiées (nouvel ID, même voiture déjà vue)",
+    'prefilter_skipped': "Annonces écartées par le pré-filtre",
+    'detail_pages_fetched': "Pages d'annonces lues pour les annonces présélectionnées",
+    'llm_calls': "Appels à l'API Mistral",
+    'llm_cache_hits': "Verdicts repris du cache",
+    'llm_errors': "Évaluations en échec",
+    'llm_prompt_tokens': "Jetons envoyés à Mistral",
+    'llm_completion_tokens': "Jetons reçus de Mistral",
+    'llm_wait_seconds': "Attente du limiteur Mistral avant un appel",
+    'llm_latency_seconds': "Durée d'un appel à Mistral",
+    'llm_parse_seconds': "Lecture du JSON renvoyé par Mistral",
+    'notifications_sent': "Messages Telegram acceptés",
+    'notification_retries': "Nouveaux essais d'envoi Telegram",
+    'notification_failures': "Messages Telegram abandonnés",
+    'notification_seconds': "Durée d'un envoi Telegram",
+    'queue_tasks': "Tâches de la file partagée traitées par ce processus",
+    'queue_reclaimed': "Tâches reprises après expiration du bail d'un autre processus",
+    'queue_lost_leases': "Résultats abandonnés : bail expiré, tâche reprise par un autre processus",
+    'load_seconds': "Chargement de l'état (historique, index des prix, caches)",
+    'save_seconds': "Sauvegarde de l'état (historique, caches, index des prix)",
+    'cycle_seconds': "Durée d'un cycle complet",
+}
+
+
+class Histogram:
+    """Histogramme à bornes fixes : nombre, somme, max et quantiles approchés."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def copy(self):
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.total = self.total
+        histogram.max = self.max
+        return histogram
+
+    def since(self, previous):
+        # Observations faites depuis la copie `previous` ; le max exact n'est connu que s'il a
+        # augmenté, sinon c'est la borne du plus haut seau touché
+        histogram = Histogram(self.buckets)
+        histogram.counts = [count - before for count, before in zip(self.counts, previous.counts)]
+        histogram.count = self.count - previous.count
+        histogram.total = self.total - previous.total
+        if self.max > previous.max:
+            histogram.max = self.max
+        else:
+            for bound, count in zip(self.buckets + (self.max,), histogram.counts):
+                if count:
+                    histogram.max = min(bound, self.max)
+        return histogram
+
+    def quantile(self, q):
+        # Interpolation linéaire dans le seau qui contient le rang demandé
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return round(lower + (min(bound, self.max) - lower) * (rank - seen) / count, 4)
+            seen += count
+            lower = bound
+        return round(self.max, 4)
+
+    def summary(self):
+        return {
+            'nombre': self.count,
+            'total_s': round(self.total, 4),
+            'moyenne_s': round(self.total / self.count, 4) if self.count else None,
+            'p50_s': self.quantile(0.5),
+            'p90_s': self.quantile(0.9),
+            'p99_s': self.quantile(0.99),
+            'max_s': round(self.max, 4),
+        }
+
+
+class Metrics:
+    """Registre de compteurs et d'histogrammes, partagé entre les threads du pipeline."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        # Copie des mesures à un instant donné, pour rapporter ensuite ce qui s'est passé depuis
+        # (ex: un cycle du mode --daemon, le registre restant cumulé depuis le démarrage)
+        with self._lock:
+            return {
+                'taken_at': time.time(),
+                'counters': dict(self.counters),
+                'histograms': {name: histogram.copy() for name, histogram in self.histograms.items()},
+            }
+
+    def report(self, since=None):
+        # Mesures cumulées depuis le démarrage, ou depuis le snapshot `since`
+        with self._lock:
+            started_at = self.started_at
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+            if since is not None:
+                started_at = since['taken_at']
+                counters = {name: value - since['counters'].get(name, 0) for name, value in counters.items()}
+                counters = {name: value for name, value in counters.items() if value}
+                histograms = {name: histogram.since(since['histograms'][name]) if name in since['histograms']
+                              else histogram for name, histogram in histograms.items()}
+                histograms = {name: histogram for name, histogram in histograms.items() if histogram.count}
+            return {
+                'debut': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started_at)),
+                'duree_s': round(time.time() - started_at, 3),
+                'compteurs': dict(sorted(counters.items())),
+                'durees': {name: histogram.summary() for name, histogram in sorted(histograms.items())},
+            }
+
+    def prometheus_text(self, prefix='bonnes_affaires_'):
+        # Format texte d'exposition Prometheus (ex: collecteur "textfile" de node_exporter)
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{prefix}{name}_total"
+                lines.append(f"# HELP {metric} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{prefix}{name}"
+                lines.append(f"# HELP {metric} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.total}")
+                lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.report(), indent=2, ensure_ascii=False))
+
+    def write_prometheus(self, path):
+        _write_atomic(path, self.prometheus_text())
+
+    def print_report(self, since=None):
+        report = self.report(since)
+        print(f"--- Mesures du {'cycle' if since is not None else 'run'} ({report['duree_s']:.1f} s) ---")
+        for name, summary in report['durees'].items():
+            print(f"  {DESCRIPTIONS.get(name, name)} : {summary['nombre']} x, total {summary['total_s']:.2f} s, "
+                  f"médiane ~{summary['p50_s']:.3f} s, max {summary['max_s']:.3f} s")
+        for name, value in report['compteurs'].items():
+            print(f"  {DESCRIPTIONS.get(name, name)} : {value}")
+
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_default_metrics():
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
+
+
+@contextmanager
+def profiled(mode, path_prefix, top=25):
+    # Profilage d'un run (opt-in) : 'cprofile' (tous les threads, statistiques dans <path_prefix>.pstats)
+    # ou 'pyinstrument' (si installé ; échantillonne le thread principal, rapport dans <path_prefix>.html)
+    if mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument n'est pas installé (pip install pyinstrument) : profilage avec cProfile.")
+            mode = 'cprofile'
+        else:
+            profiler = Profiler()
+            path = path_prefix + '.html'
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                _write_atomic(path, profiler.output_html())
+                print(profiler.output_text())
+                print(f"Profil pyinstrument écrit dans {path}")
+            return
+
+    # cProfile ne suit que le thread qui l'active : un profileur par thread créé pendant le run
+    path = path_prefix + '.pstats'
+    profiles = [cProfile.Profile()]
+    profiles_lock = threading.Lock()
+
+    def profile_thread(frame, event, arg):
+        profile = cProfile.Profile()
+        try:
+            # Remplace ce hook pour le reste du thread
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ : un seul profileur actif, qui couvre déjà tous les threads
+            return
+        with profiles_lock:
+            profiles.append(profile)
+
+    threading.setprofile(profile_thread)
+    profiles[0].enable()
+    try:
+        yield
+    finally:
+        profiles[0].disable()
+        threading.setprofile(None)
+        with profiles_lock:
+            stats = pstats.Stats(profiles[0], stream=io.StringIO())
+            for profile in profiles[1:]:
+                stats.add(profile)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        stats.dump_stats(path)
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats('tottime').print_stats(top)
+        print(output.getvalue())
+        print(f"Profil cProfile ({len(profiles)} threads) écrit dans {path} (python -m pstats {path})")
@@ -1,26 +1,256 @@
 import requests
 import os
+import queue
+import random
+import threading
+import time
 
-def send_telegram_message(message):
-    bot_token = os.environ.get("TELEGRAM_BOT_TOKEN")
-    chat_id = os.environ.get("TELEGRAM_CHAT_ID")
+import cassette
+from metrics import get_default_metrics
+from scraper.scheduler import TokenBucket
+
+# Limites de l'API Bot Telegram : environ 1 message/s par chat (20/min dans un groupe)
+# et 30 messages/s au total pour un même bot
+MESSAGES_PER_SECOND_PER_CHAT = 1.0
+MESSAGES_PER_SECOND_GLOBAL = 30
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = 60
+REQUEST_TIMEOUT = 15
+# Taille maximale d'un message Telegram
+MAX_MESSAGE_LENGTH = 4096
+DIGEST_SEPARATOR = "\n➖➖➖➖➖\n"
+
+
+class TelegramNotifier:
+    """File d'envoi Telegram : un thread dédié, une session HTTP gardée ouverte, un limiteur
+    de débit par chat, et des nouveaux essais (retry_after sur 429, backoff sinon).
+
+    En mode digest, les messages en attente pour un même chat au moment de l'envoi
+    (rafale de bonnes affaires) partent regroupés dans un seul message.
+    """
+
+    def __init__(self, bot_token=None, chat_id=None, digest=False, session=None,
+                 messages_per_second=MESSAGES_PER_SECOND_PER_CHAT, max_retries=MAX_RETRIES):
+        self.bot_token = bot_token or os.environ.get("TELEGRAM_BOT_TOKEN")
+        self.chat_id = chat_id or os.environ.get("TELEGRAM_CHAT_ID")
+        if cassette.replaying():
+            # Rejeu hors ligne (voir cassette.py) : les envois sont rejoués, même sans identifiants
+            self.bot_token = self.bot_token or "rejeu"
+            self.chat_id = self.chat_id or "rejeu"
+        # Optionnel : pointer vers un faux serveur Bot API local (voir bench/fake_telegram.py)
+        self.api_url = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org").rstrip('/')
+        self.digest = digest
+        self.session = session or cassette.mount(requests.Session())
+        self.messages_per_second = messages_per_second
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._global_bucket = TokenBucket(MESSAGES_PER_SECOND_GLOBAL, MESSAGES_PER_SECOND_GLOBAL)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self.sent = 0
+        self.delivered = 0
+        self.digests = 0
+        self.retries = 0
+        self.failed = []
+
+    @property
+    def configured(self):
+        return bool(self.bot_token and self.chat_id)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.messages_per_second, 1)
+        return bucket
+
+    def _wait_for_slot(self, chat_id):
+        with self._lock:
+            now = time.monotonic()
+            delay = max(self._chat_bucket(chat_id).reserve(now), self._global_bucket.reserve(now))
+        if delay > 0:
+            time.sleep(delay)
+
+    def _seconds_until_slot(self, chat_id):
+        # Comme _wait_for_slot, sans prendre de jeton
+        with self._lock:
+            bucket = self._chat_bucket(chat_id)
+            tokens = min(bucket.capacity, bucket.tokens + (time.monotonic() - bucket.updated) * bucket.rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / bucket.rate
+
+    def deliver(self, text, chat_id=None):
+        # Envoi bloquant avec nouveaux essais ; renvoie True si Telegram a accepté le message
+        chat_id = chat_id or self.chat_id
+        url = f"{self.api_url}/bot{self.bot_token}/sendMessage"
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": "HTML" # Utiliser HTML pour le gras, les liens, etc.
+        }
+        metrics = get_default_metrics()
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_slot(chat_id)
+            try:
+                with metrics.timer('notification_seconds'):
+                    response = self.session.post(url, json=payload, timeout=REQUEST_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                error, delay = e, None
+            else:
+                if response.ok:
+                    with self._lock:
+                        self.sent += 1
+                    metrics.count('notifications_sent')
+                    return True
+                error, delay = f"HTTP {response.status_code} : {response.text[:200]}", None
+                if response.status_code == 429:
+                    try:
+                        delay = float(response.json()['parameters']['retry_after'])
+                    except (ValueError, KeyError, TypeError):
+                        delay = None
+                elif response.status_code < 500:
+                    # Requête refusée (HTML invalide, chat inconnu...) : inutile de réessayer
+                    print(f"Erreur lors de l'envoi du message Telegram : {error}")
+                    metrics.count('notification_failures')
+                    return False
+            if attempt == self.max_retries:
+                break
+            if delay is None:
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(1, 1.5)
+            with self._lock:
+                self.retries += 1
+            metrics.count('notification_retries')
+            print(f"Envoi Telegram refusé ({error}), nouvel essai dans {delay:.1f} s.")
+            time.sleep(delay)
+        print(f"Erreur lors de l'envoi du message Telegram : {error}")
+        metrics.count('notification_failures')
+        return False
+
+    def notify(self, text, chat_id=None, on_delivered=None, on_failed=None):
+        # Non bloquant : le message est envoyé par le thread de la file.
+        # `on_delivered()` est appelé une fois le message accepté par Telegram, `on_failed()`
+        # s'il est abandonné (refusé, ou nouveaux essais épuisés).
+        if not self.configured:
+            print("Le jeton du bot Telegram ou l'ID de chat ne sont pas définis dans les variables d'environnement.")
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+        self._queue.put((chat_id or self.chat_id, text, on_delivered, on_failed))
+
+    def flush(self):
+        # Attend que tous les messages en file soient envoyés (ou abandonnés)
+        self._queue.join()
 
-    if not bot_token or not chat_id:
+    def _run(self):
+        while True:
+            chat_id, text, on_delivered, on_failed = self._queue.get()
+            batch = [(text, on_delivered, on_failed)]
+            taken = 1
+            if self.digest:
+                # Pendant l'attente du limiteur, d'autres alertes ont pu arriver : on les joint
+                time.sleep(self._seconds_until_slot(chat_id))
+                taken += self._drain_into(chat_id, batch)
+            try:
+                self._send_batch(chat_id, batch)
+            except Exception as e:
+                # Le thread doit survivre à toute erreur, sinon flush() attendrait indéfiniment
+                print(f"Erreur inattendue lors de l'envoi Telegram : {e}")
+                with self._lock:
+                    self.failed.extend(item[0] for item in batch)
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    def _drain_into(self, chat_id, batch):
+        drained = 0
+        others = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            drained += 1
+            if item[0] == chat_id:
+                batch.append(item[1:])
+            else:
+                others.append(item)
+        # Messages d'autres chats : remis en file, dans l'ordre
+        for item in others:
+            self._queue.put(item)
+            self._queue.task_done()
+        return drained - len(others)
+
+    def _send_batch(self, chat_id, batch):
+        for chunk in digest_chunks(batch) if len(batch) > 1 else [batch]:
+            if len(chunk) == 1:
+                text = chunk[0][0]
+            else:
+                text = f"<b>📦 {len(chunk)} bonnes affaires d'un coup</b>\n" + DIGEST_SEPARATOR.join(item[0].strip() for item in chunk)
+            try:
+                delivered = self.deliver(text, chat_id)
+            except Exception as e:
+                print(f"Erreur inattendue lors de l'envoi Telegram : {e}")
+                delivered = False
+            if delivered:
+                with self._lock:
+                    self.delivered += len(chunk)
+                    if len(chunk) > 1:
+                        self.digests += 1
+            else:
+                with self._lock:
+                    self.failed.extend(item[0] for item in chunk)
+            for _, on_delivered, on_failed in chunk:
+                callback = on_delivered if delivered else on_failed
+                if callback:
+                    try:
+                        callback()
+                    except Exception as e:
+                        print(f"Erreur après l'envoi d'une alerte Telegram : {e}")
+
+    def print_report(self):
+        if not (self.sent or self.failed):
+            return
+        print(f"Telegram : {self.delivered} alertes livrées en {self.sent} messages ({self.digests} digests), "
+              f"{self.retries} nouveaux essais, {len(self.failed)} alertes perdues.")
+
+
+def digest_chunks(batch):
+    # Découpe un lot d'alertes en messages de moins de MAX_MESSAGE_LENGTH caractères
+    chunks, current, length = [], [], 0
+    for item in batch:
+        size = len(item[0]) + len(DIGEST_SEPARATOR)
+        if current and length + size > MAX_MESSAGE_LENGTH - 100:
+            chunks.append(current)
+            current, length = [], 0
+        current.append(item)
+        length += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+_default_notifier = None
+_default_notifier_lock = threading.Lock()
+
+
+def get_default_notifier():
+    global _default_notifier
+    with _default_notifier_lock:
+        if _default_notifier is None:
+            _default_notifier = TelegramNotifier()
+        return _default_notifier
+
+
+def send_telegram_message(message):
+    # Conservé pour les appelants existants : envoi bloquant via le notificateur partagé
+    notifier = get_default_notifier()
+    if not notifier.configured:
         print("Le jeton du bot Telegram ou l'ID de chat ne sont pas définis dans les variables d'environnement.")
         return
-
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": message,
-        "parse_mode": "HTML" # Utiliser HTML pour le gras, les liens, etc.
-    }
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
+    if notifier.deliver(message):
         print("Message Telegram envoyé avec succès.")
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur lors de l'envoi du message Telegram : {e}")
 
 if __name__ == '__main__':
     # Exemple d'utilisation
@@ -29,4 +259,4 @@ if __name__ == '__main__':
     <a href="https://example.com/ad-link">VW Golf 7, 2017, 130 000 km – 7 500€</a>
     IA : “Bonne affaire, prix bas pour ce modèle.”
     """
-    send_telegram_message(sample_message)
\ No newline at end of file
+    send_telegram_message(sample_message)
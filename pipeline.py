@@ -0,0 +1,265 @@
+import queue
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import get_default_metrics
+from storage.seen_ads import extract_ad_id
+
+# Pipeline en flux : crawl -> filtrage -> évaluation IA -> notification. Chaque étape
+# consomme la précédente au fil de l'eau, via des files bornées (contre-pression).
+MAX_PENDING_PAGES = 8
+MAX_EVALUATIONS_IN_FLIGHT = 8
+# Les threads bloqués sur une file revérifient l'arrêt du flux à cet intervalle
+STOP_POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+class StreamStopped(Exception):
+    """Levée dans le thread du crawl quand l'aval a abandonné le flux (voir PageStream)."""
+
+
+class CrossQueryDedup:
+    """Étape de pipeline : ne laisse passer qu'une fois chaque annonce (par ID) sur
+    l'ensemble des requêtes d'un run, et compte les doublons apportés par chaque requête."""
+
+    def __init__(self):
+        self._first_query = {}
+        self.stats = {}
+
+    def stream(self, listings_by_query):
+        # listings_by_query : itérable de (requête, annonces), consommé au fil de l'eau
+        for query, listings in listings_by_query:
+            stats = self.stats.setdefault(query, {'annonces': 0, 'doublons': 0, 'doublons_de': {}})
+            for listing in listings:
+                stats['annonces'] += 1
+                ad_id = extract_ad_id(listing.get('url'))
+                if ad_id is None:
+                    # Les annonces sans URL sont signalées plus loin dans main()
+                    yield listing
+                    continue
+                first_query = self._first_query.get(ad_id)
+                if first_query is not None:
+                    # Déjà renvoyée par une requête précédente (ou une autre page de la même)
+                    stats['doublons'] += 1
+                    get_default_metrics().count('duplicates_skipped')
+                    stats['doublons_de'][first_query] = stats['doublons_de'].get(first_query, 0) + 1
+                    continue
+                self._first_query[ad_id] = query
+                yield listing
+
+    def print_report(self):
+        print("\n--- Doublons entre requêtes ---")
+        queries = list(self.stats)
+        for index, query in enumerate(queries, start=1):
+            stats = self.stats[query]
+            uniques = stats['annonces'] - stats['doublons']
+            print(f"  [{index}] {stats['annonces']} annonces, {stats['doublons']} doublons, {uniques} uniques : {query}")
+            for other, count in stats['doublons_de'].items():
+                print(f"        {count} déjà renvoyées par [{queries.index(other) + 1}]")
+        print("-------------------------------\n")
+
+
+class PageStream:
+    """Lance le crawl dans un thread et rend les pages parsées au fil de l'eau.
+
+    `crawl(on_page)` doit appeler `on_page(base_url, listings)` pour chaque page et renvoyer
+    ses statistiques. La file est bornée : si l'aval prend du retard, le crawl attend.
+    Si `stop` (threading.Event) est levé, ou si l'itération est abandonnée, le crawl s'arrête
+    à sa page suivante (`on_page` lève StreamStopped).
+    """
+
+    def __init__(self, crawl, max_pending_pages=MAX_PENDING_PAGES, stop=None):
+        self._crawl = crawl
+        self._queue = queue.Queue(maxsize=max_pending_pages)
+        self._stop = stop if stop is not None else threading.Event()
+        self.stats = None
+        self.error = None
+
+    def _put(self, item):
+        # Attend une place dans la file, sauf si l'aval a abandonné le flux ; False dans ce cas
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=STOP_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _on_page(self, base_url, listings):
+        if not self._put((base_url, listings)):
+            raise StreamStopped()
+
+    def _run(self):
+        try:
+            self.stats = self._crawl(self._on_page)
+        except StreamStopped:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(_DONE)
+
+    def __iter__(self):
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=STOP_POLL_SECONDS)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        return
+                    continue
+                if item is _DONE:
+                    break
+                yield item
+        except GeneratorExit:
+            # Itération abandonnée (exception ou arrêt en aval) : le thread du crawl ne doit pas rester bloqué
+            self._stop.set()
+            raise
+        thread.join()
+        if self.error:
+            raise self.error
+
+
+def evaluate_stream(items, evaluate, max_workers=4, max_in_flight=MAX_EVALUATIONS_IN_FLIGHT, stop=None):
+    # Évalue les éléments de `items` en parallèle dès qu'ils arrivent et rend les paires
+    # (élément, résultat) dans l'ordre de fin d'évaluation. `items` est consommé dans un
+    # thread dédié, au plus `max_in_flight` évaluations en attente à la fois.
+    # Si le consommateur s'arrête (exception, générateur fermé), `stop` est levé : le thread
+    # cesse de consommer `items` et les évaluations pas encore commencées sont annulées.
+    # Passer le même `stop` à PageStream arrête aussi le crawl en amont.
+    stop = stop if stop is not None else threading.Event()
+    results = queue.Queue()
+    slots = threading.BoundedSemaphore(max_in_flight)
+    feed_errors = []
+
+    def run(item):
+        try:
+            results.put((item, evaluate(item)))
+        except Exception as e:
+            print(f"Erreur lors de l'évaluation : {e}")
+            results.put((item, {}))
+        finally:
+            slots.release()
+
+    def feed():
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                slots.acquire()
+                if stop.is_set():
+                    break
+                executor.submit(run, item)
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            if stop.is_set() and hasattr(items, 'close'):
+                # Générateur en amont (ex: PageStream) fermé tout de suite plutôt qu'au ramasse-miettes
+                items.close()
+            executor.shutdown(wait=True, cancel_futures=stop.is_set())
+            results.put(_DONE)
+
+    threading.Thread(target=feed, daemon=True).start()
+    try:
+        while True:
+            result = results.get()
+            if result is _DONE:
+                break
+            yield result
+    finally:
+        stop.set()
+    if feed_errors:
+        raise feed_errors[0]
+
+
+def ai_note(result):
+    try:
+        return int(result.get('note', 0))
+    except (ValueError, TypeError):
+        return 0
+
+
+class DetailShortlist:
+    """Étape d'évaluation avec enrichissement paresseux : la page de l'annonce n'est téléchargée
+    (scraper/detail_page.py) que pour les annonces présélectionnées, soit par un pré-score local
+    (prix bas sur le marché local), soit par une note d'au moins `min_card_note` sur les seules
+    données de la carte ; l'annonce enrichie est alors réévaluée."""
+
+    def __init__(self, enricher, evaluate, max_market_percentile, min_card_note):
+        self.enricher = enricher
+        self._evaluate = evaluate
+        self.max_market_percentile = max_market_percentile
+        self.min_card_note = min_card_note
+        self._lock = threading.Lock()
+        self.stats = {'annonces': 0, 'pre_score': 0, 'note_carte': 0, 'reevaluees': 0, 'notes_changees': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def evaluate(self, listing):
+        self._count('annonces')
+        percentile = listing.get('market_percentile')
+        if percentile is not None and percentile <= self.max_market_percentile:
+            # Pré-score : prix parmi les plus bas du marché local, la page vaut d'être lue avant l'IA
+            self._count('pre_score')
+            self.enricher.enrich(listing)
+            return self._evaluate(listing)
+
+        result = self._evaluate(listing)
+        if ai_note(result) < self.min_card_note:
+            return result
+        self._count('note_carte')
+        if not self.enricher.enrich(listing):
+            return result
+        enriched = self._evaluate(listing)
+        self._count('reevaluees')
+        if ai_note(enriched) != ai_note(result):
+            self._count('notes_changees')
+        return enriched
+
+    def print_report(self):
+        stats = self.stats
+        if not stats['annonces']:
+            return
+        print(f"Pages d'annonces : {stats['pre_score'] + stats['note_carte']} annonces présélectionnées sur "
+              f"{stats['annonces']} évaluées ({stats['pre_score']} par pré-score, {stats['note_carte']} "
+              f"par note sur la carte), {stats['reevaluees']} réévaluées dont {stats['notes_changees']} notes changées.")
+        self.enricher.print_report()
+
+
+class LatencyTracker:
+    """Latence de bout en bout par annonce : du téléchargement de sa page à chaque étape."""
+
+    def __init__(self):
+        self._fetched_at = {}
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def page_fetched(self, listings):
+        now = time.monotonic()
+        with self._lock:
+            for listing in listings:
+                self._fetched_at.setdefault(listing.get('url'), now)
+
+    def reached(self, listing, stage):
+        with self._lock:
+            fetched_at = self._fetched_at.get(listing.get('url'))
+            if fetched_at is None:
+                return None
+            latency = time.monotonic() - fetched_at
+            self.latencies.setdefault(stage, []).append(latency)
+        return latency
+
+    def print_report(self):
+        if not self.latencies:
+            return
+        print("--- Latence depuis le téléchargement de la page ---")
+        for stage, values in self.latencies.items():
+            print(f"  {stage} : {len(values)} annonces, médiane {statistics.median(values):.1f} s, max {max(values):.1f} s")
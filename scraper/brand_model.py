@@ -0,0 +1,102 @@
+import json
+import os
+import re
+import unicodedata
+
+# Brand/model recognition in ad titles ("VW Golf 7 1.6 TDI Highline", "Mercedes-Benz C 220 d").
+# The brand and model lists live in scraper/data/car_models.json:
+#   {"<Brand>": {"aliases": [...], "models": {"<Model>": [<aliases>...]}}}
+# Every name and alias is matched on a normalized title (lowercase, no accents, punctuation
+# turned into spaces), so "Citroën C4 Picasso", "citroen c4-picasso" and "CITROEN C4 PICASSO"
+# all read the same. The patterns are compiled once, at import: one alternation for all brands,
+# one per brand for its models, and one for the models that are enough to identify the brand
+# on their own ("Golf 7 TDI" -> Volkswagen).
+CAR_MODELS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'car_models.json')
+
+# Model names that are also everyday words in French/Dutch titles: only trusted after a brand
+MODEL_ONLY_STOPWORDS = {
+    'note', 'wind', 'seal', 'born', 'spring', 'master', 'expert', 'partner', 'models', 'cabrio',
+    'cabriolet', 'sport', 'delta', 'spider', 'california', 'dolphin', 'insight', 'legacy', 'fusion',
+}
+# Shorter aliases (and pure numbers, which are usually years or engine sizes) need the brand too
+MODEL_ONLY_MIN_LENGTH = 4
+
+NON_ALNUM = re.compile(r'[^a-z0-9+]+')
+
+
+def normalize(text):
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+def _alternation(names):
+    # Longest alternatives first: the regex keeps the first one that matches at a position,
+    # so "range rover evoque" must be tried before "range rover"
+    alternatives = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    return re.compile(rf'(?<![a-z0-9])(?:{alternatives})(?![a-z0-9+])')
+
+
+def _load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    brand_aliases = {}
+    models_by_brand = {}
+    brands_by_model_alias = {}
+    for brand, entry in data.items():
+        for alias in [brand] + entry.get('aliases', []):
+            brand_aliases[normalize(alias)] = brand
+        model_aliases = {}
+        for model, aliases in entry.get('models', {}).items():
+            for alias in [model] + aliases:
+                model_aliases[normalize(alias)] = model
+        models_by_brand[brand] = model_aliases
+        for alias, model in model_aliases.items():
+            brands_by_model_alias.setdefault(alias, set()).add((brand, model))
+
+    model_only = {}
+    for alias, candidates in brands_by_model_alias.items():
+        if (len(candidates) == 1 and len(alias) >= MODEL_ONLY_MIN_LENGTH and not alias.isdigit()
+                and alias not in MODEL_ONLY_STOPWORDS and alias not in brand_aliases):
+            model_only[alias] = next(iter(candidates))
+    return brand_aliases, models_by_brand, model_only
+
+
+BRAND_ALIASES, MODEL_ALIASES_BY_BRAND, MODEL_ONLY_ALIASES = _load(CAR_MODELS_FILE)
+BRAND_PATTERN = _alternation(BRAND_ALIASES)
+MODEL_PATTERNS = {brand: _alternation(aliases) for brand, aliases in MODEL_ALIASES_BY_BRAND.items() if aliases}
+MODEL_ONLY_PATTERN = _alternation(MODEL_ONLY_ALIASES)
+
+
+def canonical_brand_model(brand, model):
+    # Canonical names for brand/model values already read (site state, records guessed by older
+    # versions such as 'Bmw' / 'Serie 3' or 'Mercedes' / 'C-klasse'); values not in the list are kept
+    canonical_brand = BRAND_ALIASES.get(normalize(brand))
+    if canonical_brand is None:
+        return brand, model
+    return canonical_brand, MODEL_ALIASES_BY_BRAND[canonical_brand].get(normalize(model), model)
+
+
+def recognize_brand_model(title):
+    # Returns (brand, model) with canonical names from the data file, 'N/A' when unknown
+    if not title or title == 'N/A':
+        return 'N/A', 'N/A'
+    text = normalize(title)
+
+    match = BRAND_PATTERN.search(text)
+    if not match:
+        match = MODEL_ONLY_PATTERN.search(text)
+        if match:
+            return MODEL_ONLY_ALIASES[match.group()]
+        return 'N/A', 'N/A'
+
+    brand = BRAND_ALIASES[match.group()]
+    pattern = MODEL_PATTERNS.get(brand)
+    if pattern is None:
+        return brand, 'N/A'
+    # The model usually follows the brand ("VW Golf"), sometimes precedes it ("Golf VW")
+    model_match = pattern.search(text, match.end()) or pattern.search(text)
+    if not model_match:
+        return brand, 'N/A'
+    return brand, MODEL_ALIASES_BY_BRAND[brand][model_match.group()]
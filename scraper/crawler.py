@@ -0,0 +1,110 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from scraper.fetcher import MAX_CONCURRENT_REQUESTS, fetch_page
+from scraper.scrape_2ememain import parse_listings
+
+
+def page_url(base_url, page_num):
+    # Keep the hash suffix (filters, sort order) of the base URL on every page
+    url_parts = base_url.split('#', 1)
+    clean_base_url = url_parts[0]
+    hash_suffix = '#' + url_parts[1] if len(url_parts) > 1 else ''
+
+    if page_num == 1:
+        return clean_base_url + hash_suffix
+    # Following pages use the /p/X/ format
+    if not clean_base_url.endswith('/'):
+        clean_base_url += '/'
+    return f"{clean_base_url}p/{page_num}/{hash_suffix}"
+
+
+def build_page_urls(base_url, num_pages):
+    return [page_url(base_url, page_num) for page_num in range(1, num_pages + 1)]
+
+
+def crawl_incremental(base_url, is_seen, max_pages, stop_after_seen_run=None, session=None, scheduler=None, on_page=None,
+                      page_cache=None):
+    # Results are sorted newest first: fetch pages one by one and stop as soon as a whole
+    # page (or `stop_after_seen_run` consecutive cards) was already seen on a previous run.
+    # `on_page(base_url, listings)` is called as soon as each page is parsed.
+    # With a `page_cache`, a page whose card list did not change since the last fetch is not
+    # parsed at all and counts as an already-seen page.
+    # Returns (listings, pages fetched, pages failed): a fetch error aborts the remaining pages,
+    # which are counted as failed, not as requests saved.
+    listings = []
+    pages_fetched = 0
+    pages_failed = 0
+    seen_run = 0
+
+    for page_num in range(1, max_pages + 1):
+        url = page_url(base_url, page_num)
+        try:
+            if page_cache:
+                html = page_cache.fetch(url, stats_key=base_url, session=session, scheduler=scheduler)
+            else:
+                html = fetch_page(url, session=session, scheduler=scheduler)
+        except requests.exceptions.RequestException as e:
+            print(f"Network or HTTP error while fetching {url}: {e}")
+            pages_failed = max_pages - page_num + 1
+            break
+        pages_fetched += 1
+
+        if html is None:
+            if page_num < max_pages:
+                print(f"Page {page_num} of {base_url} unchanged since the last fetch, skipping the remaining {max_pages - page_num} page(s).")
+            break
+
+        page_listings = parse_listings(html)
+        listings.extend(page_listings)
+        if on_page:
+            on_page(base_url, page_listings)
+        if not page_listings:
+            break
+
+        page_all_seen = True
+        run_reached = False
+        for listing in page_listings:
+            if is_seen(listing['url']):
+                seen_run += 1
+                run_reached = run_reached or (stop_after_seen_run is not None and seen_run >= stop_after_seen_run)
+            else:
+                seen_run = 0
+                page_all_seen = False
+
+        if page_all_seen or run_reached:
+            if page_num < max_pages:
+                print(f"Only already-seen ads on page {page_num} of {base_url}, skipping the remaining {max_pages - page_num} page(s).")
+            break
+
+    return listings, pages_fetched, pages_failed
+
+
+def crawl_all(base_urls, is_seen, max_pages, stop_after_seen_run=None, max_workers=MAX_CONCURRENT_REQUESTS,
+              session=None, scheduler=None, on_page=None, page_cache=None):
+    # Base URLs are crawled in parallel; pages of one base URL stay sequential since each
+    # one decides whether the next is needed. Returns (base_url, listings) pairs in input order.
+    def crawl_one(base_url):
+        return crawl_incremental(base_url, is_seen, max_pages, stop_after_seen_run,
+                                 session=session, scheduler=scheduler, on_page=on_page, page_cache=page_cache)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(crawl_one, base_urls))
+
+    listings_by_base_url = []
+    pages_fetched = 0
+    pages_failed = 0
+    for base_url, (base_listings, base_pages, base_failed) in zip(base_urls, results):
+        listings_by_base_url.append((base_url, base_listings))
+        pages_fetched += base_pages
+        pages_failed += base_failed
+
+    pages_planned = len(base_urls) * max_pages
+    stats = {
+        'pages_planned': pages_planned,
+        'pages_fetched': pages_fetched,
+        'pages_failed': pages_failed,
+        'requests_saved': pages_planned - pages_fetched - pages_failed,
+    }
+    return listings_by_base_url, stats
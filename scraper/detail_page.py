@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+
+import requests
+
+from metrics import get_default_metrics
+from scraper.embedded_state import _dig, _text, load_state
+from scraper.fetcher import fetch_page
+from storage.seen_ads import extract_ad_id
+
+# Ad detail pages ("VIP") carry what the result cards don't: the full description, the
+# equipment list and the history attributes (owners, service book, inspection...).
+# They cost one request per ad, so they are only fetched for shortlisted ads (see
+# DetailShortlist in pipeline.py), with a bounded number of fetches in flight and the
+# parsed details kept per ad ID.
+MAX_CONCURRENT_FETCHES = 2
+MAX_ENTRIES = 5000
+
+# Where the ad lives inside the detail page state, newest layout first
+LISTING_PATHS = [
+    ('props', 'pageProps', 'listing'),
+    ('props', 'pageProps', 'ad'),
+]
+
+# Attribute keys already on the cards: not repeated in the details
+CARD_ATTRIBUTE_KEYS = {'constructionYear', 'mileage', 'fuel', 'transmission', 'body', 'brand', 'model'}
+OPTIONS_KEY = 'options'
+
+
+def parse_detail_page(html):
+    # Returns {'description', 'options', 'details', 'image_count'} or None when the page has no usable state
+    state = load_state(html)
+    if state is None:
+        return None
+    for path in LISTING_PATHS:
+        item = _dig(state, path)
+        if isinstance(item, dict):
+            break
+    else:
+        return None
+
+    options = []
+    details = {}
+    for attribute in item.get('attributes') or []:
+        key = attribute.get('key')
+        value = attribute.get('value')
+        if key == OPTIONS_KEY:
+            options.extend(str(option) for option in (value if isinstance(value, list) else [value]) if option)
+        elif key not in CARD_ATTRIBUTE_KEYS and value not in (None, ''):
+            details[attribute.get('label') or key] = _text(value)
+
+    pictures = item.get('imageUrls', item.get('pictures'))
+    return {
+        'description': _text(item.get('description')),
+        'options': options,
+        'details': details,
+        'image_count': len(pictures) if isinstance(pictures, list) else 'N/A',
+    }
+
+
+class DetailEnricher:
+    """Fetches and parses ad detail pages, at most `max_concurrent` at a time, cached by ad ID."""
+
+    def __init__(self, session=None, scheduler=None, max_concurrent=MAX_CONCURRENT_FETCHES, max_entries=MAX_ENTRIES):
+        self.session = session
+        self.scheduler = scheduler
+        self.max_entries = max_entries
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'fetched': 0, 'cache_hits': 0, 'failed': 0}
+
+    def details(self, url):
+        ad_id = extract_ad_id(url)
+        with self._lock:
+            if ad_id in self._entries:
+                self._entries.move_to_end(ad_id)
+                self.stats['cache_hits'] += 1
+                return self._entries[ad_id]
+
+        with self._slots:
+            try:
+                html = fetch_page(url, session=self.session, scheduler=self.scheduler)
+            except requests.exceptions.RequestException as e:
+                print(f"Network or HTTP error while fetching detail page {url}: {e}")
+                html = None
+        details = parse_detail_page(html) if html else None
+
+        with self._lock:
+            if details is None:
+                # Not cached: the next shortlisting of this ad tries again
+                self.stats['failed'] += 1
+                return None
+            self.stats['fetched'] += 1
+            get_default_metrics().count('detail_pages_fetched')
+            self._entries[ad_id] = details
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return details
+
+    def enrich(self, listing):
+        # Merges the detail page fields into the listing; returns False when the page is unavailable
+        if listing.get('detail_enriched'):
+            return True
+        details = self.details(listing.get('url'))
+        if details is None:
+            return False
+        # The card description is cut after a few lines
+        if len(details['description']) > len(str(listing.get('description') or '')):
+            listing['description'] = details['description']
+        if details['image_count'] != 'N/A':
+            listing['image_count'] = details['image_count']
+        listing['options'] = details['options']
+        listing['details'] = details['details']
+        listing['detail_enriched'] = True
+        return True
+
+    def print_report(self):
+        stats = self.stats
+        if not (stats['fetched'] or stats['cache_hits'] or stats['failed']):
+            return
+        print(f"Detail pages: {stats['fetched']} fetched, {stats['cache_hits']} from cache, {stats['failed']} failed.")
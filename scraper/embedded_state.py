@@ -0,0 +1,118 @@
+import json
+import re
+
+# Result pages are rendered server-side from a JSON state embedded in the page
+# (<script id="__NEXT_DATA__" type="application/json">). Reading the listings from it takes
+# one regex and one json.loads, with no DOM traversal, and gives fields the cards don't show
+# (location, seller, date posted, pictures). parse_listings() falls back to the DOM parsers
+# when the blob is missing or has an unexpected shape.
+STATE_OPENING_TAG = re.compile(r'<script[^>]*\bid="__NEXT_DATA__"[^>]*>')
+STATE_CLOSING_TAG = '</script>'
+
+# Where the search results live inside the state, newest layout first
+LISTINGS_PATHS = [
+    ('props', 'pageProps', 'searchRequestAndResponse', 'listings'),
+    ('props', 'pageProps', 'listings'),
+]
+
+# "attributes": [{"key": ..., "value": ...}] -> listing dict field
+ATTRIBUTE_FIELDS = {
+    'constructionYear': 'year',
+    'mileage': 'mileage',
+    'fuel': 'fuel_type',
+    'transmission': 'transmission',
+    'body': 'body_type',
+    'brand': 'brand',
+    'model': 'model',
+}
+
+SELLER_PRO = 'professionnel'
+SELLER_PRIVATE = 'particulier'
+
+
+def _dig(data, path):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def load_state(html):
+    # Returns the decoded embedded state of a page, or None when there is none
+    match = STATE_OPENING_TAG.search(html)
+    if not match:
+        return None
+    # A lazy (.*?)</script> group would be tried at every character of the blob: slice instead
+    end = html.find(STATE_CLOSING_TAG, match.end())
+    if end == -1:
+        return None
+    try:
+        return json.loads(html[match.end():end])
+    except ValueError:
+        print("Warning: embedded page state is not valid JSON.")
+        return None
+
+
+def extract_state_listings(html):
+    # Returns the raw listing objects of the embedded state, or None when there is no usable state
+    state = load_state(html)
+    if state is None:
+        return None
+    for path in LISTINGS_PATHS:
+        listings = _dig(state, path)
+        if isinstance(listings, list):
+            return listings
+    return None
+
+
+def _text(value):
+    if value is None:
+        return 'N/A'
+    text = str(value).strip()
+    return text if text else 'N/A'
+
+
+def state_listing_fields(item):
+    # Maps one raw state listing to the listing dict fields (brand/model may stay 'N/A':
+    # parse_listings() then guesses them from the title, like for HTML cards)
+    fields = {
+        'title': _text(item.get('title')),
+        'price': 'N/A',
+        'href': item.get('vipUrl'),
+        'description': _text(item.get('description')),
+        'year': 'N/A',
+        'mileage': 'N/A',
+        'fuel_type': 'N/A',
+        'transmission': 'N/A',
+        'body_type': 'N/A',
+        'brand': 'N/A',
+        'model': 'N/A',
+        'city': 'N/A',
+        'seller_type': 'N/A',
+        'date_posted': 'N/A',
+        'image_count': 'N/A',
+    }
+
+    price_cents = _dig(item, ('priceInfo', 'priceCents'))
+    if price_cents:
+        fields['price'] = str(int(price_cents) // 100)
+
+    for attribute in item.get('attributes') or []:
+        field = ATTRIBUTE_FIELDS.get(attribute.get('key'))
+        if field:
+            fields[field] = _text(attribute.get('value'))
+    if fields['mileage'] != 'N/A':
+        # Same cleaning as the HTML cards: "110.000 km" -> "110000"
+        fields['mileage'] = fields['mileage'].replace('km', '').replace('.', '').replace(',', '').strip()
+
+    fields['city'] = _text(_dig(item, ('location', 'cityName')))
+    seller = item.get('sellerInformation')
+    if isinstance(seller, dict):
+        # Dealers get a website link on their ads, private sellers don't
+        fields['seller_type'] = SELLER_PRO if seller.get('showWebsiteUrl') else SELLER_PRIVATE
+    fields['date_posted'] = _text(item.get('date'))
+    pictures = item.get('imageUrls', item.get('pictures'))
+    if isinstance(pictures, list):
+        fields['image_count'] = len(pictures)
+    return fields
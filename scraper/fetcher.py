@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import cassette
+from metrics import get_default_metrics
+from scraper.scheduler import RequestScheduler
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'Referer': 'https://www.2ememain.be/',
+    'Connection': 'keep-alive'
+}
+
+# Global cap on simultaneous requests (per-host politeness lives in scraper/scheduler.py)
+MAX_CONCURRENT_REQUESTS = 4
+REQUEST_TIMEOUT = 30
+
+_shared_session = None
+_shared_scheduler = None
+_shared_session_lock = threading.Lock()
+
+
+def create_session(pool_size=MAX_CONCURRENT_REQUESTS):
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    # Keep-alive pool sized for the worker count so threads never open throwaway connections
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # --record / --replay (see cassette.py): same pool, responses recorded or replayed
+    return cassette.mount(session, pool_connections=pool_size, pool_maxsize=pool_size)
+
+
+def get_shared_session():
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
+def get_shared_scheduler():
+    global _shared_scheduler
+    with _shared_session_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = RequestScheduler()
+        return _shared_scheduler
+
+
+def fetch_response(url, session=None, scheduler=None, headers=None):
+    session = session or get_shared_session()
+    scheduler = scheduler or get_shared_scheduler()
+    # All pacing (token bucket, jitter, 429 backoff) happens in the scheduler, per HTTP request
+    response = scheduler.request(session, url, headers=headers, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
+    metrics = get_default_metrics()
+    metrics.count('pages_fetched')
+    metrics.count('page_bytes', len(response.content))
+    return response
+
+
+def fetch_page(url, session=None, scheduler=None):
+    return fetch_response(url, session=session, scheduler=scheduler).text
+
+
+def fetch_pages(urls, max_workers=MAX_CONCURRENT_REQUESTS, session=None, scheduler=None):
+    # Returns (url, html) pairs in input order; html is None when the request failed
+    session = session or get_shared_session()
+    scheduler = scheduler or get_shared_scheduler()
+
+    def fetch_one(url):
+        try:
+            return url, fetch_page(url, session=session, scheduler=scheduler)
+        except requests.exceptions.RequestException as e:
+            print(f"Network or HTTP error while fetching {url}: {e}")
+            return url, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fetch_one, urls))
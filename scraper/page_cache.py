@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from metrics import get_default_metrics
+from scraper.fetcher import fetch_response
+
+# Cache of result pages, keyed by page URL. Nothing but validators is stored:
+# - ETag / Last-Modified, sent back as If-None-Match / If-Modified-Since (304 = unchanged)
+# - a hash of the ad IDs and prices found on the page, for when the site always answers 200
+#   (ads, tracking and CSRF tokens change on every response, the card list does not).
+#   Prices are part of it so that a price cut on an already-seen ad still gets parsed.
+# An unchanged page is neither parsed nor passed downstream.
+# New validators are only staged by fetch(): commit() keeps them once the listings of the cycle
+# have been processed, discard() drops them after a failed cycle (its pages are fetched again).
+MAX_ENTRIES = 2000
+
+# Card links look like /v/autos/volkswagen/m2165430155-vw-golf-7-...
+CARD_ID_PATTERN = re.compile(r'href="[^"]*/m(\d+)-')
+# Card prices ("€ 8.500,-") and the prices of the embedded page state
+CARD_PRICE_PATTERN = re.compile(r'hz-Title--title4[^>]*>([^<]*)<|"priceCents":\s*(\d+)')
+
+NOT_MODIFIED = 304
+
+
+def cards_hash(html):
+    ids = CARD_ID_PATTERN.findall(html)
+    if not ids:
+        return None
+    prices = [card_price or state_price for card_price, state_price in CARD_PRICE_PATTERN.findall(html)]
+    return hashlib.sha1(f"{','.join(ids)}|{','.join(prices)}".encode('utf-8')).hexdigest()[:16]
+
+
+class PageCache:
+    """Conditional GETs plus a card-ID hash per page URL, with hit counters per base URL."""
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Validators of the pages fetched since the last commit() (None: forget the URL)
+        self._staged = {}
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    @classmethod
+    def load(cls, path, max_entries=MAX_ENTRIES):
+        cache = cls(path, max_entries=max_entries)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    cache._entries.update(json.load(f))
+            except json.JSONDecodeError:
+                print(f"Warning: page cache {path} is corrupted, starting from scratch.")
+        return cache
+
+    def fetch(self, url, stats_key=None, session=None, scheduler=None):
+        # Returns the page HTML, or None when the page is unchanged since the last fetch
+        with self._lock:
+            entry = self._entries.get(url)
+            stats = self.stats.setdefault(stats_key or url, {'pages': 0, 'not_modified': 0, 'unchanged': 0})
+            stats['pages'] += 1
+
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = fetch_response(url, session=session, scheduler=scheduler, headers=headers)
+        if response.status_code == NOT_MODIFIED and entry:
+            with self._lock:
+                stats['not_modified'] += 1
+                self._entries.move_to_end(url)
+            get_default_metrics().count('pages_not_modified')
+            return None
+
+        html = response.text
+        ids_hash = cards_hash(html)
+        with self._lock:
+            if ids_hash is not None and entry and entry.get('ids_hash') == ids_hash:
+                stats['unchanged'] += 1
+                unchanged = True
+            else:
+                unchanged = False
+            if ids_hash is None:
+                # Empty or unexpected page: never cache it
+                self._staged[url] = None
+            else:
+                new_entry = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'ids_hash': ids_hash,
+                }
+                if unchanged:
+                    # Same cards as an already processed page: nothing to wait for
+                    self._entries[url] = new_entry
+                    self._entries.move_to_end(url)
+                else:
+                    self._staged[url] = new_entry
+        if unchanged:
+            get_default_metrics().count('pages_not_modified')
+            return None
+        return html
+
+    def commit(self):
+        # The listings of the staged pages were processed: later fetches may skip them
+        with self._lock:
+            for url, entry in self._staged.items():
+                if entry is None:
+                    self._entries.pop(url, None)
+                    continue
+                self._entries[url] = entry
+                self._entries.move_to_end(url)
+            self._staged = {}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self):
+        # Failed cycle: its pages keep their previous validators and will be processed again
+        with self._lock:
+            self._staged = {}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with self._lock:
+            entries = dict(self._entries)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def print_report(self):
+        if not self.stats:
+            return
+        print("--- Page cache per base URL ---")
+        for key, stats in self.stats.items():
+            pages = stats['pages']
+            hits = stats['not_modified'] + stats['unchanged']
+            print(f"  {hits}/{pages} unchanged ({hits / pages:.0%} hits, {stats['not_modified'] / pages:.0%} via 304) : {key}")
@@ -0,0 +1,105 @@
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # lxml is optional, BeautifulSoup stays available as a fallback
+    lxml_html = None
+
+# Each backend turns a results page into raw cards with the same shape:
+# {'href', 'title', 'price', 'description', 'attributes': [(icon_classes, text), ...]}
+# Missing tags are None; cleaning and brand/model detection happen in scrape_2ememain.
+
+
+class BeautifulSoupParser:
+    name = 'bs4'
+
+    def iter_cards(self, html):
+        soup = BeautifulSoup(html, 'html.parser')
+        for ad_link in soup.find_all('a', class_='hz-Listing-coverLink'):
+            title_tag = ad_link.find('h3', class_='hz-Listing-title')
+            price_tag = ad_link.find('span', class_='hz-Title--title4')
+            description_tag = ad_link.find('p', class_='hz-Listing-description')
+
+            attributes = []
+            attributes_container = ad_link.find('div', class_='hz-Listing-attributes')
+            if attributes_container:
+                for attr in attributes_container.find_all('span', class_='hz-Attribute'):
+                    icon = attr.find('i')
+                    if icon:
+                        attributes.append((icon.get('class', []), attr.get_text(strip=True)))
+
+            yield {
+                'href': ad_link.get('href'),
+                'title': title_tag.get_text(strip=True) if title_tag else None,
+                'price': price_tag.get_text(strip=True) if price_tag else None,
+                'description': description_tag.get_text(strip=True) if description_tag else None,
+                'attributes': attributes,
+            }
+
+
+def _has_class(tag, class_name, descendant=True):
+    axis = './/' if descendant else '//'
+    return f"{axis}{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+class LxmlParser:
+    name = 'lxml'
+
+    def __init__(self):
+        if lxml_html is None:
+            raise ImportError("lxml is not installed: pip install lxml")
+        # XPath expressions are compiled once and reused for every card of every page
+        self._cards = etree.XPath(_has_class('a', 'hz-Listing-coverLink', descendant=False))
+        self._title = etree.XPath(_has_class('h3', 'hz-Listing-title'))
+        self._price = etree.XPath(_has_class('span', 'hz-Title--title4'))
+        self._description = etree.XPath(_has_class('p', 'hz-Listing-description'))
+        self._attributes_container = etree.XPath(_has_class('div', 'hz-Listing-attributes'))
+        self._attributes = etree.XPath(_has_class('span', 'hz-Attribute'))
+        self._icon = etree.XPath('.//i')
+        self._texts = etree.XPath('.//text()')
+
+    def _text(self, element):
+        # Same result as BeautifulSoup's get_text(strip=True)
+        return ''.join(text.strip() for text in self._texts(element))
+
+    def _first_text(self, xpath, element):
+        found = xpath(element)
+        return self._text(found[0]) if found else None
+
+    def iter_cards(self, html):
+        root = lxml_html.fromstring(html)
+        for ad_link in self._cards(root):
+            attributes = []
+            containers = self._attributes_container(ad_link)
+            if containers:
+                for attr in self._attributes(containers[0]):
+                    icons = self._icon(attr)
+                    if icons:
+                        attributes.append((icons[0].get('class', '').split(), self._text(attr)))
+
+            yield {
+                'href': ad_link.get('href'),
+                'title': self._first_text(self._title, ad_link),
+                'price': self._first_text(self._price, ad_link),
+                'description': self._first_text(self._description, ad_link),
+                'attributes': attributes,
+            }
+
+
+PARSER_BACKENDS = {
+    'bs4': BeautifulSoupParser,
+    'lxml': LxmlParser,
+}
+DEFAULT_PARSER = 'lxml' if lxml_html is not None else 'bs4'
+
+_parsers = {}
+
+
+def get_parser(name=None):
+    name = name or DEFAULT_PARSER
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend '{name}' (available: {', '.join(PARSER_BACKENDS)})")
+    if name not in _parsers:
+        _parsers[name] = PARSER_BACKENDS[name]()
+    return _parsers[name]
@@ -1,40 +1,112 @@
 import requests
-from bs4 import BeautifulSoup
 import time
-import random
 import re
 
-# Renamed the function to be more generic
-def scrape_2ememain(url): 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept-Language': 'fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-        'Referer': 'https://www.2ememain.be/',
-        'Connection': 'keep-alive'
-    }
-    listings = []
-    seen_urls = set()
+from metrics import get_default_metrics
+from scraper.brand_model import recognize_brand_model
+from scraper.fetcher import fetch_page
+from scraper.embedded_state import extract_state_listings, state_listing_fields
+from scraper.parsers import get_parser
 
+# Renamed the function to be more generic
+def scrape_2ememain(url, session=None, scheduler=None, page_cache=None): 
     print(f"Starting scraping from: {url}")
 
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-        soup = BeautifulSoup(response.text, 'html.parser')
+        if page_cache:
+            # None when the page has not changed since the last fetch (see scraper/page_cache.py)
+            html = page_cache.fetch(url, session=session, scheduler=scheduler)
+        else:
+            html = fetch_page(url, session=session, scheduler=scheduler)
+    except requests.exceptions.RequestException as e:
+        print(f"Network or HTTP error during scraping: {e}")
+        return []
 
-        car_ad_links = soup.find_all('a', class_='hz-Listing-coverLink')
+    if html is None:
+        print(f"Page unchanged since the last fetch, skipping: {url}")
+        return []
+    return parse_listings(html)
+
+def guess_brand_model(title):
+    # Brand and model from the title, matched against the brand/model list (see scraper/brand_model.py)
+    brand, model = recognize_brand_model(title)
+    if brand == 'N/A' and model == 'N/A' and title and len(title.split()) > 1:
+        # Brand not in the list: first word as brand, second as model (very simplistic)
+        brand, model = title.split()[:2]
+    return brand, model
+
+def card_fields(card):
+    # Cleans one raw HTML card (see scraper/parsers.py) into listing fields
+    title = card['title'] if card['title'] is not None else 'N/A'
+
+    price = card['price'] if card['price'] is not None else 'N/A'
+    if price != 'N/A':
+        # Remove currency symbols, dots, commas, and strip whitespace
+        price = re.sub(r'[€.,-]', '', price).strip()
+
+    description = card['description'] if card['description'] is not None else 'N/A'
+
+    fields = {
+        'title': title,
+        'price': price,
+        'href': card['href'],
+        'description': description,
+        'year': 'N/A',
+        'mileage': 'N/A',
+        'fuel_type': 'N/A',
+        'transmission': 'N/A',
+        'body_type': 'N/A',
+        'brand': 'N/A',
+        'model': 'N/A',
+        'city': 'N/A', # Not shown on listing cards, only in the embedded state
+        'seller_type': 'N/A',
+        'date_posted': 'N/A',
+        'image_count': 'N/A',
+    }
+
+    for icon_classes, attr_text_raw in card['attributes']:
+        attr_text = attr_text_raw if attr_text_raw else 'N/A'
+
+        if 'hz-SvgIconCarConstructionYear' in icon_classes:
+            fields['year'] = attr_text
+        elif 'hz-SvgIconCarMileage' in icon_classes:
+            # Remove 'km', dots, commas, and strip whitespace
+            fields['mileage'] = attr_text.replace('km', '').replace('.', '').replace(',', '').strip()
+        elif 'hz-SvgIconCarFuel' in icon_classes:
+            fields['fuel_type'] = attr_text
+        elif 'hz-SvgIconCarTransmission' in icon_classes:
+            fields['transmission'] = attr_text
+        elif 'hz-SvgIconCarBody' in icon_classes:
+            fields['body_type'] = attr_text
+    return fields
+
+def parse_listings(html, parser=None, embedded_state=True):
+    # Listings come from the page's embedded JSON state when present (see scraper/embedded_state.py),
+    # otherwise from the HTML cards with the given DOM parser backend
+    listings = []
+    seen_urls = set()
+    parse_start = time.perf_counter()
 
-        if not car_ad_links:
-            print("No ad links found with selector 'a.hz-Link.hz-Link--block.hz-Listing-coverLink'.")
-            print("The website structure might have changed. Please inspect the page again.")
+    try:
+        state_listings = extract_state_listings(html) if embedded_state else None
+        if state_listings is not None:
+            source = 'embedded state'
+            cards = [state_listing_fields(item) for item in state_listings]
+        else:
+            parser = parser or get_parser()
+            source = parser.name
+            cards = [card_fields(card) for card in parser.iter_cards(html)]
+
+        if not cards:
+            if state_listings is None:
+                print("No ad links found with selector 'a.hz-Link.hz-Link--block.hz-Listing-coverLink'.")
+                print("The website structure might have changed. Please inspect the page again.")
             return []
 
-        for ad_link in car_ad_links:
-            href = ad_link.get('href')
+        for fields in cards:
+            href = fields.pop('href')
             if not href:
-                print(f"Warning: Ad link found without 'href' attribute. Skipping. (Partial HTML: {ad_link.prettify()[:200]}...)")
+                print(f"Warning: Ad link found without 'href' attribute. Skipping. (Title: {fields['title']})")
                 continue
 
             full_url = "https://www.2ememain.be" + href
@@ -44,105 +116,51 @@ def scrape_2ememain(url):
 
             seen_urls.add(full_url)
 
-            title_tag = ad_link.find('h3', class_='hz-Listing-title')
-            title = title_tag.get_text(strip=True) if title_tag else 'N/A'
-
-            price_tag = ad_link.find('span', class_='hz-Title--title4')
-            price = price_tag.get_text(strip=True) if price_tag else 'N/A'
-            if price != 'N/A':
-                # Remove currency symbols, dots, commas, and strip whitespace
-                price = re.sub(r'[€.,-]', '', price).strip()
-
-            description_tag = ad_link.find('p', class_='hz-Listing-description')
-            description = description_tag.get_text(strip=True) if description_tag else 'N/A'
-
-            attributes_container = ad_link.find('div', class_='hz-Listing-attributes')
-            year = 'N/A'
-            mileage = 'N/A'
-            fuel_type = 'N/A'
-            transmission = 'N/A'
-            body_type = 'N/A'
-
-            if attributes_container:
-                attributes = attributes_container.find_all('span', class_='hz-Attribute')
-                for attr in attributes:
-                    icon_class = attr.find('i')
-                    if icon_class:
-                        icon_classes = icon_class.get('class', [])
-                        attr_text_raw = attr.get_text(strip=True)
-                        attr_text = attr_text_raw if attr_text_raw else 'N/A'
-
-                        if 'hz-SvgIconCarConstructionYear' in icon_classes:
-                            year = attr_text
-                        elif 'hz-SvgIconCarMileage' in icon_classes:
-                            # Remove 'km', dots, commas, and strip whitespace
-                            mileage = attr_text.replace('km', '').replace('.', '').replace(',', '').strip()
-                        elif 'hz-SvgIconCarFuel' in icon_classes:
-                            fuel_type = attr_text
-                        elif 'hz-SvgIconCarTransmission' in icon_classes:
-                            transmission = attr_text
-                        elif 'hz-SvgIconCarBody' in icon_classes:
-                            body_type = attr_text
-
-            # Attempt to extract brand and model from the title as a fallback
-            # This is a basic approach and might need refinement for accuracy
-            brand = 'N/A'
-            model = 'N/A'
-            if title and title != 'N/A':
-                title_lower = title.lower()
-                # Simple attempt to find common brands and then models
-                known_brands = {
-                    'honda': ['civic', 'cr-v', 'jazz', 'accord'],
-                    'volkswagen': ['golf', 'passat', 'polo'],
-                    'bmw': ['serie 3', 'serie 5', 'x3'],
-                    'mercedes': ['c-klasse', 'e-klasse', 'a-klasse'],
-                    'audi': ['a3', 'a4', 'a6'],
-                    # Add more brands and their common models here
-                }
-                
-                found_brand = False
-                for b, models_list in known_brands.items():
-                    if b in title_lower:
-                        brand = b.capitalize()
-                        found_brand = True
-                        for m in models_list:
-                            if m in title_lower:
-                                model = m.capitalize()
-                                break
-                        break
-                
-                # Fallback if no specific brand/model found from known list
-                if not found_brand and len(title.split()) > 1:
-                    # Take the first word as brand, second as model (very simplistic)
-                    brand = title.split()[0]
-                    model = title.split()[1]
-
+            if fields['brand'] == 'N/A' or fields['model'] == 'N/A':
+                brand, model = guess_brand_model(fields['title'])
+                if fields['brand'] == 'N/A':
+                    fields['brand'] = brand
+                if fields['model'] == 'N/A':
+                    fields['model'] = model
+            else:
+                # Site values ("VW", "C-Klasse") mapped to the same names as the guessed ones,
+                # so the price index and prefilter group them together
+                brand, model = recognize_brand_model(f"{fields['brand']} {fields['model']}")
+                if brand != 'N/A':
+                    fields['brand'] = brand
+                    if model != 'N/A':
+                        fields['model'] = model
 
             listings.append({
-                'title': title,
-                'price': price,
+                'title': fields['title'],
+                'price': fields['price'],
                 'url': full_url,
-                'description': description,
-                'year': year,
-                'mileage': mileage,
-                'fuel_type': fuel_type,
-                'transmission': transmission,
-                'body_type': body_type,
-                'brand': brand,
-                'model': model,
-                'city': 'N/A' # 2ememain.be doesn't usually provide city on listing cards
+                'description': fields['description'],
+                'year': fields['year'],
+                'mileage': fields['mileage'],
+                'fuel_type': fields['fuel_type'],
+                'transmission': fields['transmission'],
+                'body_type': fields['body_type'],
+                'brand': fields['brand'],
+                'model': fields['model'],
+                'city': fields['city'],
+                'seller_type': fields['seller_type'],
+                'date_posted': fields['date_posted'],
+                'image_count': fields['image_count'],
             })
-            time.sleep(random.uniform(0.1, 0.5)) # Small random delay between ad extractions
 
-    except requests.exceptions.RequestException as e:
-        print(f"Network or HTTP error during scraping: {e}")
     except Exception as e:
         print(f"An unexpected error occurred during scraping: {e}")
         import traceback
         traceback.print_exc()
         return []
 
-    print(f"Scraping finished. Found {len(listings)} listings on this page.")
+    parse_seconds = time.perf_counter() - parse_start
+    metrics = get_default_metrics()
+    metrics.observe('parse_seconds', parse_seconds)
+    metrics.count('cards_parsed', len(listings))
+    parse_ms = parse_seconds * 1000
+    print(f"Scraping finished. Found {len(listings)} listings on this page (parsed in {parse_ms:.1f} ms, {source}).")
     return listings
 
 if __name__ == '__main__':
@@ -0,0 +1,182 @@
+from urllib.parse import urlsplit
+
+from scraper.brand_model import BRAND_ALIASES, normalize
+from storage.seen_ads import parse_int
+
+# Planification des recherches surveillées. Les filtres après le # des URLs de 2ememain
+# (#f:…|PriceCentsTo:…|mileageTo:…) ne sont jamais envoyés au serveur : c'est la page qui les
+# applique dans le navigateur. Deux URLs qui ne diffèrent qu'après le # téléchargent donc les mêmes
+# pages, et seul le chemin (/l/autos/<marque>/f/<carburant>/<id>/) restreint vraiment les résultats.
+# Le planificateur télécharge chaque chemin demandé une seule fois, avec la même profondeur qu'avant
+# (un chemin restreint n'est jamais replié dans un chemin plus large, ses pages iraient moins loin),
+# et applique les filtres du # localement : une annonce est gardée si elle correspond à au moins
+# une des recherches, sinon elle est seulement marquée vue.
+SITE_URL = "https://www.2ememain.be"
+CATEGORY_PATH = "/l/autos/"
+
+# IDs des carburants dans les URLs (/f/essence/473/, #f:13838)
+FUEL_IDS = {
+    'essence': 473,
+    'hybride-electrique-essence': 13838,
+}
+FUEL_SLUGS = {fuel_id: slug for slug, fuel_id in FUEL_IDS.items()}
+
+# Bornes après le # -> (borne locale, diviseur : les prix sont en centimes)
+BOUND_PARAMS = {
+    'PriceCentsFrom': ('min_price', 100),
+    'PriceCentsTo': ('max_price', 100),
+    'mileageFrom': ('min_mileage', 1),
+    'mileageTo': ('max_mileage', 1),
+    'constructionYearFrom': ('min_year', 1),
+    'constructionYearTo': ('max_year', 1),
+}
+# Paramètres d'affichage, sans effet sur les annonces renvoyées
+DISPLAY_PARAMS = {'Language', 'sortBy', 'sortOrder'}
+# Borne locale -> champ de l'annonce comparé
+BOUND_FIELDS = {
+    'min_price': 'price', 'max_price': 'price',
+    'min_mileage': 'mileage', 'max_mileage': 'mileage',
+    'min_year': 'year', 'max_year': 'year',
+}
+
+
+class SearchQuery:
+    """Une recherche : ce que le serveur filtre (marque et attribut du chemin) et ce qui se vérifie sur la carte."""
+
+    def __init__(self, brand=None, path_attribute=None, fuels=None, bounds=None, ignored=(), site=SITE_URL):
+        self.site = site                        # schéma et hôte (un faux site local dans les benchmarks)
+        self.brand = brand                      # slug de la marque dans le chemin, ex: 'volkswagen'
+        self.path_attribute = path_attribute    # (slug, id) après /f/ dans le chemin, ex: ('essence', 473)
+        self.fuels = fuels                      # slugs de carburant acceptés, None = tous
+        self.bounds = bounds or {}              # ex: {'max_price': 3000, 'max_mileage': 100001}
+        self.ignored = tuple(ignored)           # filtres du # invérifiables sur la carte, ex: 'f:10882'
+        self._brand_name = normalize(BRAND_ALIASES.get(normalize(brand), brand)) if brand else None
+        self._fuel_names = {normalize(slug) for slug in fuels} if fuels else None
+
+    @classmethod
+    def from_url(cls, url):
+        parts = urlsplit(url)
+        if not parts.path.startswith(CATEGORY_PATH):
+            raise ValueError(f"URL de recherche hors de {CATEGORY_PATH} : {url}")
+        segments = [segment for segment in parts.path[len(CATEGORY_PATH):].split('/') if segment]
+        brand = None
+        if segments and segments[0] != 'f':
+            brand = segments.pop(0)
+        path_attribute = None
+        if len(segments) == 3 and segments[0] == 'f' and segments[2].isdigit():
+            path_attribute = (segments[1], int(segments[2]))
+            segments = []
+        if segments:
+            raise ValueError(f"Chemin de recherche non reconnu : {url}")
+
+        # Carburant du chemin : le serveur ne renvoie que lui, les carburants du # n'y changent rien
+        path_fuel = path_attribute[0] if path_attribute and path_attribute[1] in FUEL_SLUGS else None
+        fuels = set()
+        bounds = {}
+        ignored = []
+        for param in filter(None, parts.fragment.split('|')):
+            key, _, value = param.partition(':')
+            if key == 'f':
+                for attribute_id in filter(None, value.split(',')):
+                    if attribute_id.isdigit() and int(attribute_id) in FUEL_SLUGS and not path_fuel:
+                        fuels.add(FUEL_SLUGS[int(attribute_id)])
+                    elif not (path_fuel and attribute_id == str(path_attribute[1])):
+                        ignored.append(f"f:{attribute_id}")
+            elif key in BOUND_PARAMS and value.isdigit():
+                name, divisor = BOUND_PARAMS[key]
+                bounds[name] = int(value) // divisor
+            elif key not in DISPLAY_PARAMS:
+                ignored.append(param)
+        if path_fuel:
+            fuels = {path_fuel}
+        return cls(brand, path_attribute, fuels or None, bounds, ignored, site=f"{parts.scheme}://{parts.netloc}")
+
+    @property
+    def scope(self):
+        # Ce que le serveur reçoit : deux recherches de même portée téléchargent les mêmes pages
+        return self.site, self.brand, self.path_attribute
+
+    def restricts(self):
+        return bool(self.brand or self.fuels or self.bounds)
+
+    def url(self):
+        path = CATEGORY_PATH
+        if self.brand:
+            path += f"{self.brand}/"
+        if self.path_attribute:
+            path += f"f/{self.path_attribute[0]}/{self.path_attribute[1]}/"
+        return self.site + path
+
+    def matches(self, listing):
+        # Une valeur absente de la carte ('N/A') ne fait pas écarter l'annonce. Un attribut du
+        # chemin autre que le carburant (ex: /f/civic/811/) n'est pas vérifié : l'annonce est gardée.
+        if self._brand_name:
+            brand = listing.get('brand')
+            if brand and brand != 'N/A' and normalize(brand) != self._brand_name:
+                return False
+        if self._fuel_names:
+            fuel = listing.get('fuel_type')
+            if fuel and fuel != 'N/A' and normalize(fuel) not in self._fuel_names:
+                return False
+        for name, bound in self.bounds.items():
+            value = parse_int(listing.get(BOUND_FIELDS[name]))
+            if value is None:
+                continue
+            if value < bound if name.startswith('min_') else value > bound:
+                return False
+        return True
+
+
+def expand_searches(searches):
+    # Recherches déclaratives (SEARCHES dans main.py) -> une SearchQuery par marque ; un seul
+    # carburant passe dans le chemin, plusieurs sont vérifiés sur la carte d'une recherche sans carburant
+    queries = []
+    for search in searches:
+        fuels = search.get('fuels') or []
+        for fuel in fuels:
+            if fuel not in FUEL_IDS:
+                raise ValueError(f"Carburant inconnu '{fuel}' (connus : {', '.join(FUEL_IDS)}) : ajouter son ID dans FUEL_IDS.")
+        bounds = {name: search[name] for name in BOUND_FIELDS if search.get(name) is not None}
+        path_attribute = (fuels[0], FUEL_IDS[fuels[0]]) if len(fuels) == 1 else None
+        for brand in search.get('brands') or [None]:
+            queries.append(SearchQuery(brand, path_attribute, set(fuels) or None, bounds))
+    return queries
+
+
+class SearchPlan:
+    """Requêtes larges à télécharger et filtre local des annonces lues."""
+
+    def __init__(self, queries):
+        self.queries = queries
+        # Une recherche sans filtre vérifiable garde tout ce qui est téléchargé
+        self.keep_all = any(not query.restricts() for query in queries)
+        # URL téléchargée (une par chemin demandé) -> recherches qui ne diffèrent qu'après le #
+        self.covered = {}
+        for query in queries:
+            self.covered.setdefault(query.url(), []).append(query)
+        self.base_urls = list(self.covered)
+
+    def wanted(self, listing):
+        # Testée sur toutes les recherches, pas seulement celles de l'URL qui a renvoyé l'annonce :
+        # une annonce présente dans deux URLs larges n'est gardée qu'une fois (voir CrossQueryDedup)
+        return self.keep_all or any(query.matches(listing) for query in self.queries)
+
+    def print_report(self, pages_per_url):
+        before = len(self.queries) * pages_per_url
+        after = len(self.base_urls) * pages_per_url
+        print(f"\n--- Planification des recherches : {len(self.queries)} recherches -> {len(self.base_urls)} requêtes ---")
+        print(f"  Pages de résultats par cycle (au plus) : {before} avant planification, {after} après "
+              f"(toujours {pages_per_url} par chemin : seules les pages identiques ne sont plus téléchargées deux fois).")
+        for url, queries in self.covered.items():
+            filtered = sum(1 for query in queries if query.restricts())
+            print(f"  {url} : {len(queries)} recherches, dont {filtered} filtrées localement")
+        if self.keep_all:
+            print("  Une recherche sans filtre vérifiable : toutes les annonces téléchargées sont gardées.")
+        ignored = sorted({param for query in self.queries for param in query.ignored})
+        if ignored:
+            # Le serveur ne les appliquait pas non plus : même résultat qu'avant la planification
+            print(f"  Filtres ignorés (invérifiables sur les cartes, ou carburant déjà fixé par le chemin) : {', '.join(ignored)}")
+
+
+def plan_searches(urls, searches=()):
+    return SearchPlan([SearchQuery.from_url(url) for url in urls] + expand_searches(searches))
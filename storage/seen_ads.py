@@ -0,0 +1,322 @@
+import os
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Identifiant numérique d'une annonce 2ememain, ex: .../m2165430155-vw-golf-7-...
+AD_ID_PATTERN = re.compile(r'/m(\d+)(?:[-/?#]|$)')
+
+
+def extract_ad_id(url):
+    # Renvoie l'ID normalisé (int) d'une annonce, ou l'URL nettoyée si aucun ID n'est trouvé
+    if not url:
+        return None
+    match = AD_ID_PATTERN.search(url)
+    if match:
+        return int(match.group(1))
+    return url.split('#', 1)[0].split('?', 1)[0].rstrip('/')
+
+
+# Compaction du journal dans le snapshot JSON au-delà de ce nombre d'enregistrements
+COMPACT_EVERY = 500
+# Republications (nouvel ID, même titre, année et kilométrage) cherchées parmi les N annonces les plus récentes
+RELIST_WINDOW = 20000
+
+# Résultat de SeenAdsStore.track() pour une carte de résultats
+SEEN = 'vue'                # déjà vue, sans baisse de prix notable
+PRICE_DROP = 'baisse'       # déjà vue, prix baissé d'au moins le pourcentage demandé
+RELISTED = 'republiee'      # nouvel ID, mais la même voiture a déjà été vue
+
+
+def parse_int(value):
+    # "8500", "8.500", "€ 8.500,-" -> 8500 ; "N/A", "Prix à convenir" -> None
+    digits = re.sub(r'\D', '', str(value or ''))
+    return int(digits) if digits else None
+
+
+def price_drop_percent(previous_price, price):
+    # Baisse en % (positive), ou None si le prix n'a pas baissé ou n'est pas connu
+    if not previous_price or not price or price >= previous_price:
+        return None
+    return 100 * (previous_price - price) / previous_price
+
+
+def relist_key(listing):
+    title = ' '.join(str(listing.get('title') or '').lower().split())
+    mileage = parse_int(listing.get('mileage'))
+    if not title or not mileage:
+        return None
+    return title, mileage, str(listing.get('year') or '')
+
+
+def format_price_history(history):
+    # [[horodatage, prix], ...] -> "9500 € (12/05) → 8200 € (03/06)"
+    parts = []
+    for seen_at, price in history or []:
+        date = f" ({time.strftime('%d/%m', time.localtime(seen_at))})" if seen_at else ""
+        parts.append(f"{price} €{date}")
+    return " → ".join(parts)
+
+
+def journal_path_for(path):
+    # data/annonces_vues.json -> data/annonces_vues.jsonl
+    return os.path.splitext(path)[0] + '.jsonl'
+
+
+class SeenAdsStore:
+    """Annonces déjà vues, avec un index des IDs pour un test d'appartenance en O(1).
+
+    Si `path` est fourni, chaque annonce ajoutée est écrite en fin de journal
+    (JSON Lines) ; le snapshot `path` n'est réécrit qu'à la compaction.
+
+    Chaque enregistrement garde le dernier prix et kilométrage vus, ses dates de premier et
+    dernier passage (`first_seen`, `last_seen`, horodatages Unix) et, après un changement de
+    prix, `price_history` ([[horodatage, prix], ...]) : track() compare une carte en O(1).
+    """
+
+    def __init__(self, ads=None, path=None, compact_every=COMPACT_EVERY):
+        self.ads = []
+        # Index compact : ID 2ememain (entier) -> position de l'annonce dans self.ads
+        self._positions = {}
+        for ad in ads or []:
+            self._append(ad)
+        # Titre/kilométrage/année des annonces récentes -> position, pour reconnaître une republication
+        self._relist_keys = OrderedDict()
+        for position in range(max(0, len(self.ads) - RELIST_WINDOW), len(self.ads)):
+            self._remember(position)
+        # Dernier passage des annonces revues sans changement, écrit en un bloc par close()
+        self._touched = {}
+        # Appelés avec (position, ancien, nouveau) quand un enregistrement est remplacé, pour que les
+        # index construits sur l'historique (PriceIndex, PreFilter) retirent l'ancien prix
+        self.replace_listeners = []
+
+        self.path = path
+        self.journal_path = journal_path_for(path) if path else None
+        self.compact_every = compact_every
+        self.journal_records = 0
+        self._journal = None
+        # Les étapes du pipeline peuvent ajouter des annonces depuis plusieurs threads
+        self._lock = threading.Lock()
+
+    def _append(self, ad):
+        ad_id = extract_ad_id(ad.get('url'))
+        if ad_id is None or ad_id in self._positions:
+            return False
+        self._positions[ad_id] = len(self.ads)
+        self.ads.append(ad)
+        return True
+
+    def _remember(self, position):
+        key = relist_key(self.ads[position])
+        if key is None:
+            return
+        self._relist_keys[key] = position
+        self._relist_keys.move_to_end(key)
+        while len(self._relist_keys) > RELIST_WINDOW:
+            self._relist_keys.popitem(last=False)
+
+    def _replace(self, ad):
+        # Nouvel enregistrement d'une annonce connue (prix changé, réévaluation) ; False si inconnue
+        position = self._positions.get(extract_ad_id(ad.get('url')))
+        if position is None:
+            return False
+        self._set(position, ad)
+        return True
+
+    def _set(self, position, ad):
+        previous = self.ads[position]
+        self.ads[position] = ad
+        for listener in self.replace_listeners:
+            listener(position, previous, ad)
+
+    def __contains__(self, url):
+        ad_id = extract_ad_id(url)
+        return ad_id is not None and ad_id in self._positions
+
+    def __len__(self):
+        return len(self.ads)
+
+    def __iter__(self):
+        return iter(self.ads)
+
+    def add(self, listing):
+        with self._lock:
+            now = int(time.time())
+            listing.setdefault('first_seen', now)
+            listing['last_seen'] = now
+            if not self._append(listing):
+                return False
+            self._remember(len(self.ads) - 1)
+            if self.journal_path:
+                self._write_journal(listing)
+            return True
+
+    def update(self, listing):
+        # Remplace l'enregistrement d'une annonce déjà vue (ex: verdict après une baisse de prix)
+        with self._lock:
+            listing['last_seen'] = int(time.time())
+            if not self._replace(listing):
+                return False
+            if self.journal_path:
+                self._write_journal(listing)
+            return True
+
+    def track(self, listing, min_drop_percent):
+        # Compare une carte de résultats à ce qui est connu, sans requête : renvoie None pour une
+        # nouvelle annonce, SEEN, PRICE_DROP (baisse d'au moins `min_drop_percent` %) ou RELISTED.
+        # Sur PRICE_DROP et RELISTED, la carte reçoit `price_history`, `previous_price` et
+        # `price_drop_percent` (None sans baisse). Un prix ou kilométrage changé est enregistré tout de suite.
+        ad_id = extract_ad_id(listing.get('url'))
+        price = parse_int(listing.get('price'))
+        now = int(time.time())
+        with self._lock:
+            position = self._positions.get(ad_id)
+            if position is None:
+                relisted = self._relist_keys.get(relist_key(listing))
+                if relisted is None:
+                    return None
+                record = self.ads[relisted]
+                listing['relisted_from'] = record.get('url')
+                status = RELISTED
+            else:
+                record = self.ads[position]
+                record['last_seen'] = now
+                status = SEEN
+
+            previous_price = parse_int(record.get('price'))
+            history = list(record.get('price_history') or [])
+            # Une republication garde aussi le prix d'avant, même inchangé
+            if price and (price != previous_price or status == RELISTED):
+                if not history and previous_price:
+                    history.append([record.get('first_seen'), previous_price])
+                history.append([now, price])
+
+            if status == SEEN:
+                changed = price != previous_price or parse_int(listing.get('mileage')) != parse_int(record.get('mileage'))
+                if not changed or not price:
+                    self._touched[ad_id] = now
+                    return SEEN
+                # Le dernier prix vu devient la référence de la prochaine comparaison
+                record = dict(record, price=listing.get('price'), mileage=listing.get('mileage'), price_history=history)
+                self._set(position, record)
+                self._touched.pop(ad_id, None)
+                if self.journal_path:
+                    self._write_journal(record)
+
+            drop = price_drop_percent(previous_price, price)
+            if status == SEEN and (drop is None or drop < min_drop_percent):
+                return SEEN
+            listing['first_seen'] = record.get('first_seen') if status == SEEN else now
+            listing['price_history'] = history
+            listing['previous_price'] = previous_price
+            listing['price_drop_percent'] = round(drop) if drop is not None else None
+            return PRICE_DROP if status == SEEN else RELISTED
+
+    def _write_journal(self, listing):
+        if self._journal is None:
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        # Une ligne par annonce, vidée immédiatement : un crash ne perd que l'enregistrement en cours
+        self._journal.write(json.dumps(listing, ensure_ascii=False) + '\n')
+        self._journal.flush()
+        self.journal_records += 1
+
+    def compact(self):
+        # Réécrit le snapshot (écriture atomique) puis vide le journal
+        if not self.path:
+            return
+        write_snapshot(self.ads, self.path)
+        # Les derniers passages sont déjà dans les enregistrements réécrits
+        self._touched = {}
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        open(self.journal_path, 'w', encoding='utf-8').close()
+        self.journal_records = 0
+
+    def _write_touched(self):
+        # Une ligne compacte par annonce revue sans changement, un seul flush
+        if not self._touched or not self.journal_path:
+            return
+        if self._journal is None:
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal.write(''.join(json.dumps({'id': ad_id, 'last_seen': seen_at}) + '\n'
+                                    for ad_id, seen_at in self._touched.items()))
+        self._journal.flush()
+        # Comptées comme les autres lignes : elles rapprochent aussi la prochaine compaction
+        self.journal_records += len(self._touched)
+        self._touched = {}
+
+    def close(self):
+        if self.journal_records + len(self._touched) < self.compact_every:
+            # Le snapshot n'est pas réécrit : les derniers passages vont dans le journal
+            with self._lock:
+                self._write_touched()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+        else:
+            print(f"Compaction du journal ({self.journal_records + len(self._touched)} enregistrements) dans {self.path}.")
+            self.compact()
+
+
+def write_snapshot(ads, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        # Une annonce par ligne : JSON valide, mais des diffs git lisibles
+        if ads:
+            f.write('[\n' + ',\n'.join(json.dumps(ad, ensure_ascii=False) for ad in ads) + '\n]\n')
+        else:
+            f.write('[]\n')
+    os.replace(tmp_path, path)
+
+
+def load_seen_ads(path, compact_every=COMPACT_EVERY):
+    ads = []
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                ads = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Attention: Le fichier {path} est corrompu ou vide. Création d'une nouvelle liste.")
+    store = SeenAdsStore(ads, path=path, compact_every=compact_every)
+
+    # Rejouer la fin du journal écrite depuis la dernière compaction
+    truncated = False
+    if os.path.exists(store.journal_path):
+        with open(store.journal_path, 'r', encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+        for number, line in enumerate(lines, 1):
+            try:
+                ad = json.loads(line)
+            except json.JSONDecodeError:
+                # Seule la dernière ligne peut être tronquée par un crash ; une ligne illisible
+                # au milieu est sautée, et les enregistrements suivants sont quand même rejoués
+                if number == len(lines):
+                    print(f"Attention: Dernier enregistrement de {store.journal_path} incomplet, ignoré.")
+                else:
+                    print(f"Attention: Ligne {number} de {store.journal_path} illisible, ignorée.")
+                truncated = True
+                continue
+            if 'url' not in ad:
+                # Dernier passage d'une annonce revue sans changement
+                position = store._positions.get(ad.get('id'))
+                if position is not None:
+                    store.ads[position]['last_seen'] = ad.get('last_seen')
+                store.journal_records += 1
+                continue
+            # Une annonce déjà connue est remplacée par son enregistrement le plus récent
+            if store._append(ad):
+                store._remember(len(store.ads) - 1)
+            else:
+                store._replace(ad)
+            store.journal_records += 1
+    if truncated:
+        # Repartir d'un journal propre (snapshot avec tous les enregistrements lisibles) pour ne
+        # pas écrire à la suite d'une ligne tronquée
+        store.compact()
+    return store
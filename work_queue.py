@@ -0,0 +1,355 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from storage.seen_ads import extract_ad_id, parse_int, price_drop_percent
+
+# File de travail partagée entre plusieurs processus du bot (python main.py --queue DB), dans une
+# base SQLite locale : aucun service à lancer. Elle contient trois sortes de tâches, les pages de
+# résultats (une URL de base, un numéro de page), les évaluations (une annonce) et les alertes
+# Telegram. Un processus prend une tâche avec un bail (lease) : si le bail expire avant la fin
+# (processus tué, bloqué), la tâche repart à un autre. Chaque reprise incrémente le numéro d'essai
+# de la tâche, et un résultat n'est accepté que de l'essai en cours : un processus en retard ne
+# peut rien écrire.
+# La base garde aussi l'historique partagé des annonces vues. Une annonce n'y entre qu'une fois
+# (dans la même transaction que sa tâche d'évaluation), son verdict n'est écrit qu'une fois et son
+# alerte n'est réservée qu'une fois : jamais deux appels IA enregistrés ni deux alertes. Un envoi
+# refusé libère la réservation et l'alerte repart en file ; seul un arrêt brutal entre la
+# réservation et l'envoi peut la perdre. En fin de cycle, un seul processus reporte les annonces
+# de la file dans l'historique JSON de data/ (voir claim_merge et merge_rows).
+PAGE = 'page'
+EVALUATION = 'evaluation'
+NOTIFICATION = 'notification'
+
+PENDING = 'en_attente'
+CLAIMED = 'prise'
+DONE = 'terminee'
+FAILED = 'echec'
+
+# Durée d'un bail : largement plus qu'une page ou un appel Mistral (délais d'attente compris)
+LEASE_SECONDS = 120
+# Essais d'une tâche (erreurs et baux expirés confondus) avant de l'abandonner
+MAX_ATTEMPTS = 3
+# Attente d'un verrou d'écriture tenu par un autre processus
+BUSY_TIMEOUT_SECONDS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cycles (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    started_by TEXT NOT NULL,
+    merged_by TEXT
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    cycle INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    UNIQUE (cycle, kind, key)
+);
+CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (status, id);
+CREATE TABLE IF NOT EXISTS seen_ads (
+    ad_id TEXT PRIMARY KEY,
+    url TEXT,
+    price TEXT,
+    first_cycle INTEGER NOT NULL,
+    first_seen REAL,
+    last_seen REAL,
+    note INTEGER,
+    comment TEXT,
+    scored_by TEXT,
+    notified_at REAL,
+    notified_by TEXT,
+    listing TEXT,
+    dirty INTEGER NOT NULL DEFAULT 0
+);
+"""
+# Colonnes ajoutées depuis la première version du schéma, ajoutées aux bases existantes
+ADDED_COLUMNS = [
+    ('cycles', 'merged_by', 'TEXT'),
+    ('seen_ads', 'listing', 'TEXT'),
+    ('seen_ads', 'dirty', 'INTEGER NOT NULL DEFAULT 0'),
+]
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Task:
+    """Tâche prise avec un bail ; `attempt` identifie la prise (un résultat d'une prise plus ancienne est refusé)."""
+
+    def __init__(self, task_id, kind, payload, attempt, reclaimed):
+        self.id = task_id
+        self.kind = kind
+        self.payload = payload
+        self.attempt = attempt
+        self.reclaimed = reclaimed
+
+
+class WorkQueue:
+    """File de tâches et historique partagé des annonces vues, dans une base SQLite (mode WAL)."""
+
+    def __init__(self, path, owner=None, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.owner = owner or worker_name()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.cycle = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Transactions gérées à la main (voir _transaction)
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        for table, column, declaration in ADDED_COLUMNS:
+            columns = {row[1] for row in self._db.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE : verrou d'écriture pris dès le début, pas d'échec au moment de COMMIT
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+    def join_or_start_cycle(self, base_urls, known_ads=()):
+        # Rejoint le cycle en cours s'il reste des tâches, sinon en démarre un : page 1 de chaque
+        # URL de base. Les annonces déjà vues hors de la file (historique JSON), des paires
+        # (ID, prix), y sont importées : leur prix sert de référence pour les baisses de prix.
+        with self._transaction() as db:
+            row = db.execute(f"SELECT cycle FROM tasks WHERE status IN ('{PENDING}', '{CLAIMED}') "
+                             "ORDER BY cycle DESC LIMIT 1").fetchone()
+            if row:
+                self.cycle = row[0]
+                return self.cycle, False
+            self.cycle = db.execute("INSERT INTO cycles (started_at, started_by) VALUES (?, ?)",
+                                    (time.time(), self.owner)).lastrowid
+            db.executemany("INSERT OR IGNORE INTO seen_ads (ad_id, price, first_cycle) VALUES (?, ?, 0)",
+                           ((str(ad_id), price) for ad_id, price in known_ads))
+            db.executemany(f"INSERT INTO tasks (cycle, kind, key, payload, status) VALUES (?, '{PAGE}', ?, ?, '{PENDING}')",
+                           ((self.cycle, page_key(base_url, 1), json.dumps({'base_url': base_url, 'page_num': 1}))
+                            for base_url in base_urls))
+        return self.cycle, True
+
+    def claim(self):
+        # Prochaine tâche en attente, ou dont le bail a expiré ; None s'il n'y en a pas pour l'instant
+        now = time.time()
+        with self._transaction() as db:
+            # Baux expirés sur des tâches sans essai restant : abandonnées
+            db.execute(f"UPDATE tasks SET status = '{FAILED}', error = 'bail expiré' "
+                       f"WHERE status = '{CLAIMED}' AND lease_until < ? AND attempts >= ?", (now, self.max_attempts))
+            row = db.execute(f"SELECT id, kind, payload, attempts, status FROM tasks "
+                             f"WHERE status = '{PENDING}' OR (status = '{CLAIMED}' AND lease_until < ?) "
+                             "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            task_id, kind, payload, attempts, status = row
+            db.execute(f"UPDATE tasks SET status = '{CLAIMED}', owner = ?, lease_until = ?, attempts = ? WHERE id = ?",
+                       (self.owner, now + self.lease_seconds, attempts + 1, task_id))
+        return Task(task_id, kind, json.loads(payload), attempts + 1, reclaimed=status == CLAIMED)
+
+    def _holds(self, db, task):
+        # Vrai si le bail de `task` est toujours le nôtre (pas repris par un autre processus)
+        row = db.execute("SELECT status, owner, attempts FROM tasks WHERE id = ?", (task.id,)).fetchone()
+        return row == (CLAIMED, self.owner, task.attempt)
+
+    def _finish(self, db, task, status, error=None):
+        db.execute("UPDATE tasks SET status = ?, lease_until = NULL, error = ? WHERE id = ?", (status, error, task.id))
+
+    def complete_page(self, task, listings, max_pages, wanted=None, min_drop_percent=None):
+        # Dans une seule transaction : annonces ajoutées à l'historique partagé, une évaluation par
+        # annonce jamais vue (si wanted(annonce), voir search_plan.py) ou déjà vue dont le prix a baissé
+        # d'au moins `min_drop_percent` %, page suivante si la page contient des annonces nouvelles
+        # pour ce cycle, tâche terminée. Renvoie (évaluations créées, annonces nouvelles non voulues),
+        # None si le bail a été perdu.
+        now = time.time()
+        created = 0
+        unwanted = 0
+        new_this_cycle = 0
+        with self._transaction() as db:
+            if not self._holds(db, task):
+                return None
+            for listing in listings:
+                ad_id = extract_ad_id(listing.get('url'))
+                if ad_id is None:
+                    continue
+                row = db.execute("SELECT first_cycle, price, listing FROM seen_ads WHERE ad_id = ?", (str(ad_id),)).fetchone()
+                if row is not None:
+                    first_cycle, previous_price, record = row
+                    if first_cycle == self.cycle:
+                        # Vue par une autre page de ce cycle : toujours nouvelle pour le crawl incrémental
+                        new_this_cycle += 1
+                        continue
+                    price = parse_int(listing.get('price'))
+                    previous = parse_int(previous_price)
+                    if not price or price == previous:
+                        db.execute("UPDATE seen_ads SET last_seen = ? WHERE ad_id = ?", (now, str(ad_id)))
+                        continue
+                    # Prix changé : la carte est gardée pour l'historique JSON (voir merge_rows)
+                    record = json.loads(record) if record else {}
+                    history = list(record.get('price_history') or [])
+                    if not history and previous:
+                        history.append([None, previous])
+                    history.append([int(now), price])
+                    listing['price_history'] = history
+                    listing['previous_price'] = previous
+                    drop = price_drop_percent(previous, price)
+                    listing['price_drop_percent'] = round(drop) if drop is not None else None
+                    db.execute("UPDATE seen_ads SET last_seen = ?, price = ?, listing = ?, dirty = 1 WHERE ad_id = ?",
+                               (now, listing.get('price'), json.dumps(dict(record, **listing), ensure_ascii=False), str(ad_id)))
+                    if (min_drop_percent is None or drop is None or drop < min_drop_percent
+                            or (wanted is not None and not wanted(listing))):
+                        continue
+                    # Baisse de prix : nouveau verdict et nouvelle alerte possibles, une fois par prix
+                    db.execute("UPDATE seen_ads SET note = NULL, comment = NULL, scored_by = NULL, notified_at = NULL, "
+                               "notified_by = NULL WHERE ad_id = ?", (str(ad_id),))
+                    db.execute(f"INSERT OR IGNORE INTO tasks (cycle, kind, key, payload, status) VALUES (?, '{EVALUATION}', ?, ?, '{PENDING}')",
+                               (self.cycle, f"{ad_id}@{price}", json.dumps(listing, ensure_ascii=False)))
+                    created += 1
+                    continue
+                db.execute("INSERT INTO seen_ads (ad_id, url, price, first_cycle, first_seen, last_seen, listing, dirty) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+                           (str(ad_id), listing.get('url'), listing.get('price'), self.cycle, now, now,
+                            json.dumps(listing, ensure_ascii=False)))
+                new_this_cycle += 1
+                if wanted is not None and not wanted(listing):
+                    unwanted += 1
+                    continue
+                db.execute(f"INSERT OR IGNORE INTO tasks (cycle, kind, key, payload, status) VALUES (?, '{EVALUATION}', ?, ?, '{PENDING}')",
+                           (self.cycle, str(ad_id), json.dumps(listing, ensure_ascii=False)))
+                created += 1
+            page_num = task.payload['page_num']
+            if new_this_cycle and page_num < max_pages:
+                base_url = task.payload['base_url']
+                db.execute(f"INSERT OR IGNORE INTO tasks (cycle, kind, key, payload, status) VALUES (?, '{PAGE}', ?, ?, '{PENDING}')",
+                           (self.cycle, page_key(base_url, page_num + 1),
+                            json.dumps({'base_url': base_url, 'page_num': page_num + 1})))
+            self._finish(db, task, DONE)
+        return created, unwanted
+
+    def already_scored(self, listing):
+        row = self._db.execute("SELECT note FROM seen_ads WHERE ad_id = ?",
+                               (str(extract_ad_id(listing.get('url'))),)).fetchone()
+        return row is not None and row[0] is not None
+
+    def complete_evaluation(self, task, listing, note, comment, notify):
+        # Verdict écrit une seule fois par annonce (avec l'annonce notée, pour l'historique JSON), et
+        # tâche d'alerte créée dans la même transaction si `notify`. Renvoie True si l'alerte est en
+        # file, False sinon, None si le bail a été perdu.
+        ad_id = str(extract_ad_id(listing.get('url')))
+        with self._transaction() as db:
+            if not self._holds(db, task):
+                return None
+            scored = db.execute("UPDATE seen_ads SET note = ?, comment = ?, scored_by = ?, listing = ?, dirty = 1 "
+                                "WHERE ad_id = ? AND note IS NULL",
+                                (note, comment, self.owner, json.dumps(listing, ensure_ascii=False), ad_id)).rowcount
+            queued = 0
+            if scored and notify:
+                queued = db.execute(f"INSERT OR IGNORE INTO tasks (cycle, kind, key, payload, status) VALUES (?, '{NOTIFICATION}', ?, ?, '{PENDING}')",
+                                    (self.cycle, ad_id, json.dumps(listing, ensure_ascii=False))).rowcount
+            self._finish(db, task, DONE)
+        return bool(queued)
+
+    def reserve_notification(self, task):
+        # Réserve l'envoi de l'alerte de `task` : True si ce processus doit l'envoyer, False si elle
+        # l'a déjà été (essai précédent arrêté après la réservation : au plus une alerte, tâche
+        # terminée), None si le bail a été perdu.
+        ad_id = str(extract_ad_id(task.payload.get('url')))
+        with self._transaction() as db:
+            if not self._holds(db, task):
+                return None
+            reserved = db.execute("UPDATE seen_ads SET notified_at = ?, notified_by = ? WHERE ad_id = ? AND notified_at IS NULL",
+                                  (time.time(), self.owner, ad_id)).rowcount
+            if not reserved:
+                self._finish(db, task, DONE)
+        return bool(reserved)
+
+    def cancel_notification(self, task, error):
+        # Envoi refusé : réservation libérée et alerte remise en file (abandonnée après MAX_ATTEMPTS
+        # essais), seulement si le bail et la réservation sont toujours ceux de ce processus
+        ad_id = str(extract_ad_id(task.payload.get('url')))
+        with self._transaction() as db:
+            if not self._holds(db, task):
+                return None
+            db.execute("UPDATE seen_ads SET notified_at = NULL, notified_by = NULL WHERE ad_id = ? AND notified_by = ?",
+                       (ad_id, self.owner))
+            status = FAILED if task.attempt >= self.max_attempts else PENDING
+            self._finish(db, task, status, str(error)[:500])
+        return True
+
+    def complete(self, task, listing=None):
+        # Tâche terminée sans verdict à écrire (ex: annonce écartée par le pré-filtre, gardée
+        # avec sa raison si `listing`) ; None si le bail a été perdu
+        with self._transaction() as db:
+            if not self._holds(db, task):
+                return None
+            if listing is not None:
+                db.execute("UPDATE seen_ads SET listing = ?, dirty = 1 WHERE ad_id = ?",
+                           (json.dumps(listing, ensure_ascii=False), str(extract_ad_id(listing.get('url')))))
+            self._finish(db, task, DONE)
+        return True
+
+    def release(self, task, error):
+        # Erreur : la tâche repart en attente, ou est abandonnée après MAX_ATTEMPTS essais
+        with self._transaction() as db:
+            if not self._holds(db, task):
+                return
+            status = FAILED if task.attempt >= self.max_attempts else PENDING
+            self._finish(db, task, status, str(error)[:500])
+
+    def claim_merge(self):
+        # Vrai pour un seul processus par cycle terminé : celui qui reporte la file dans l'historique JSON
+        with self._transaction() as db:
+            return bool(db.execute("UPDATE cycles SET merged_by = ? WHERE id = ? AND merged_by IS NULL",
+                                   (self.owner, self.cycle)).rowcount)
+
+    def merge_rows(self):
+        # Annonces nouvelles ou modifiées (prix, verdict, pré-filtre) depuis le dernier report, de
+        # tous les cycles : [(ID, annonce en JSON)] ; les reporter puis appeler mark_merged(rows)
+        return self._db.execute("SELECT ad_id, listing FROM seen_ads WHERE dirty = 1 AND listing IS NOT NULL "
+                                "ORDER BY first_seen, ad_id").fetchall()
+
+    def mark_merged(self, rows):
+        # Une annonce modifiée entre-temps par un autre processus reste à reporter
+        with self._transaction() as db:
+            db.executemany("UPDATE seen_ads SET dirty = 0 WHERE ad_id = ? AND listing = ?", rows)
+
+    def active_tasks(self):
+        # Tâches du cycle encore en attente ou prises (y compris par d'autres processus)
+        return self._db.execute(f"SELECT COUNT(*) FROM tasks WHERE cycle = ? AND status IN ('{PENDING}', '{CLAIMED}')",
+                                (self.cycle,)).fetchone()[0]
+
+    def stats(self):
+        rows = self._db.execute("SELECT kind, status, COUNT(*) FROM tasks WHERE cycle = ? GROUP BY kind, status",
+                                (self.cycle,)).fetchall()
+        stats = {}
+        for kind, status, count in rows:
+            stats.setdefault(kind, {})[status] = count
+        return stats
+
+    def print_report(self):
+        print(f"\n--- File partagée {self.path} (cycle {self.cycle}, processus {self.owner}) ---")
+        for kind, counts in sorted(self.stats().items()):
+            print(f"  {kind} : " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+
+    def close(self):
+        self._db.close()
+
+
+def page_key(base_url, page_num):
+    return f"{page_num} {base_url}"